@@ -1,22 +1,34 @@
 from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from pydantic import BaseModel, validator, root_validator
-from typing import List, Optional, Dict, Any, Set
+from typing import List, Optional, Dict, Any, Set, Tuple
 import os
 import logging
 import json
 import asyncio
+import functools
+import base64
+import bisect
 import hashlib
 import secrets
 import re
 from datetime import datetime, timedelta, date, timezone
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from array import array
 from supabase import create_client, Client
 import uuid
 from twilio.rest import Client as TwilioClient
 import random
+import itertools
+import math
+import numpy as np
+import heapq
+import time
+from collections import OrderedDict, deque
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -30,6 +42,174 @@ supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 supabase: Client = create_client(supabase_url, supabase_anon_key)
 supabase_admin: Client = create_client(supabase_url, supabase_service_key)
 
+# ==================== Data access ====================
+# The supabase-py client is synchronous: every .execute() is a blocking HTTP
+# round-trip. Routes hand those calls to a bounded thread pool so a slow
+# PostgREST query never stalls the event loop (and every WebSocket with it).
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "32"))
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="supabase")
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call (Supabase auth, Twilio, ...) on the DB executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(fn, *args, **kwargs))
+
+async def db_execute(query):
+    """Execute a Supabase query/RPC builder without blocking the event loop."""
+    return await run_blocking(query.execute)
+
+# ==================== In-process caches ====================
+class TTLCache:
+    """Bounded LRU cache with a per-entry TTL and hit/miss counters.
+
+    Only touched from the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def get(self, key: Any) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Any, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Any) -> Any:
+        """Drop an entry; returns its value (expired or not), or None."""
+        entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def invalidate_where(self, predicate):
+        for key in [k for k, (_, v) in self._data.items() if predicate(v)]:
+            del self._data[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+# Authenticated principals (profile rows) keyed by user id. Keeps the
+# per-request profile lookup in get_current_user off the hot path.
+principal_cache = TTLCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30")),
+)
+
+class ProfileCache:
+    """Read-through cache of profile rows, addressable by id or by username.
+
+    Rows live only under their id; the username side maps username -> id and
+    a hit is checked against the row's current username, so a renamed user
+    can never be served under the old name. Concurrent misses for the same
+    key share one query (single-flight), and a fill that started before an
+    invalidation is returned to its callers but not cached.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._by_id = TTLCache(maxsize, ttl)
+        self._by_username = TTLCache(maxsize, ttl)
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._epoch = 0
+
+    def _store(self, profile: dict):
+        self._by_id.set(profile["id"], profile)
+        if profile.get("username"):
+            self._by_username.set(profile["username"], profile["id"])
+
+    def _cached(self, field: str, value: str) -> Optional[dict]:
+        if field == "id":
+            return self._by_id.get(value)
+        user_id = self._by_username.get(value)
+        profile = self._by_id.get(user_id) if user_id else None
+        return profile if profile and profile.get("username") == value else None
+
+    async def get(self, field: str, value: str) -> Optional[dict]:
+        """Profile row where `field` ("id" or "username") equals value, or None."""
+        profile = self._cached(field, value)
+        if profile is not None:
+            return dict(profile)
+        key = (field, value)
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fill(field, value))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is future else None)
+        profile = await asyncio.shield(future)
+        return dict(profile) if profile else None
+
+    async def _fill(self, field: str, value: str) -> Optional[dict]:
+        epoch = self._epoch
+        response = await db_execute(supabase.table("profiles").select("*").eq(field, value).limit(1))
+        profile = response.data[0] if response.data else None
+        if profile and epoch == self._epoch:
+            self._store(profile)
+        return profile
+
+    async def get_many(self, user_ids: List[str]) -> Dict[str, dict]:
+        """Profiles by id; misses are fetched together in one query."""
+        found: Dict[str, dict] = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            profile = self._cached("id", user_id)
+            if profile is not None:
+                found[user_id] = dict(profile)
+            else:
+                missing.append(user_id)
+        if missing:
+            epoch = self._epoch
+            response = await db_execute(supabase.table("profiles").select("*").in_("id", missing))
+            for profile in response.data or []:
+                if epoch == self._epoch:
+                    self._store(profile)
+                found[profile["id"]] = dict(profile)
+        return found
+
+    def invalidate(self, user_id: str):
+        """Drop a user's row and its username key together (no await in between)."""
+        self._epoch += 1
+        profile = self._by_id.invalidate(user_id)
+        if profile and profile.get("username"):
+            self._by_username.invalidate(profile["username"])
+        self._inflight.pop(("id", user_id), None)
+        if profile and profile.get("username"):
+            self._inflight.pop(("username", profile["username"]), None)
+
+    def invalidate_where(self, predicate):
+        self._epoch += 1
+        self._by_id.invalidate_where(predicate)
+
+    def stats(self) -> dict:
+        return {"by_id": self._by_id.stats(), "by_username": self._by_username.stats()}
+
+profile_cache = ProfileCache(
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60")),
+)
+
 # Twilio configuration
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
@@ -45,6 +225,7 @@ otp_storage = {}
 app = FastAPI(title="DaddyBaddy API", version="1.0.0")
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # CORS middleware
 app.add_middleware(
@@ -60,7 +241,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # ==================== Notification helper ====================
-def notify_user(user_id: str, title: str, message: str = "", ntype: str = "user", reference_id: Optional[str] = None):
+async def notify_user(user_id: str, title: str, message: str = "", ntype: str = "user", reference_id: Optional[str] = None):
     try:
         record = {
             "user_id": user_id,
@@ -71,10 +252,29 @@ def notify_user(user_id: str, title: str, message: str = "", ntype: str = "user"
             "is_read": False,
             "created_at": datetime.now(timezone.utc).isoformat()
         }
-        supabase.table("notifications").insert(record).execute()
+        await db_execute(supabase.table("notifications").insert(record))
     except Exception as e:
         logger.warning(f"notify_user failed: {e}")
 
+async def notify_users(notifications: List[dict]):
+    """Bulk variant of notify_user: one insert for many (user_id, title, message, type, reference_id) dicts."""
+    if not notifications:
+        return
+    now_iso = datetime.now(timezone.utc).isoformat()
+    records = [{
+        "user_id": n["user_id"],
+        "title": n["title"],
+        "message": n.get("message", ""),
+        "type": n.get("type", "user"),
+        "reference_id": n.get("reference_id"),
+        "is_read": False,
+        "created_at": now_iso
+    } for n in notifications]
+    try:
+        await db_execute(supabase.table("notifications").insert(records))
+    except Exception as e:
+        logger.warning(f"notify_users failed: {e}")
+
 def tag_from_user(u: Any) -> str:
     try:
         return f"@{(u.get('id') if isinstance(u, dict) else u.id)}"
@@ -109,45 +309,884 @@ def _ensure_dm_metadata(chat: dict, user_a: str, user_b: str) -> dict:
     return metadata
 
 # Connection manager for WebSocket
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+
+# ==================== Broadcast backplane ====================
+# Battle broadcasts go through a backplane so that, with several uvicorn
+# workers, a vote handled on one worker reaches sockets held by the others.
+class InProcessBackplane:
+    """Single-worker backplane: delivers straight to the local sockets."""
+
+    def __init__(self, deliver=None):
+        self._deliver = deliver
+
+    async def start(self, deliver):
+        self._deliver = deliver
+
+    async def publish(self, battle_id: str, message_str: str):
+        if self._deliver:
+            self._deliver(battle_id, message_str)
+
+    async def stop(self):
+        pass
+
+class UnixSocketBackplane:
+    """Multi-worker backplane over a local Unix-socket broker.
+
+    Whichever worker holds an flock on <path>.lock runs the broker, which
+    relays each newline-delimited event to every other connected worker.
+    Workers deliver their own events locally, publish each event once, and
+    drop anything they have already seen (by event id). If the broker
+    worker dies, another one takes the lock and the rest reconnect.
+    """
+
+    RECONNECT_DELAY = 0.2
+    SEEN_LIMIT = 4096
+
+    def __init__(self, path: str):
+        self.path = path
+        self.worker_id = uuid.uuid4().hex
+        self._deliver = None
+        self._lock_file = None
+        self._server = None
+        self._broker_clients: Set[asyncio.StreamWriter] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+
+    async def start(self, deliver):
+        self._deliver = deliver
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def publish(self, battle_id: str, message_str: str):
+        event_id = uuid.uuid4().hex
+        self._mark_seen(event_id)
+        if self._deliver:
+            self._deliver(battle_id, message_str)
+        writer = self._writer
+        if writer is None:
+            logger.warning("WS backplane not connected; event delivered to this worker only")
+            return
+        line = json.dumps({"o": self.worker_id, "id": event_id, "b": battle_id, "m": message_str}) + "\n"
+        try:
+            writer.write(line.encode())
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"WS backplane publish failed: {e}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._server is not None:
+            self._server.close()
+            for client in list(self._broker_clients):
+                client.close()
+            self._server = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _mark_seen(self, event_id: str) -> bool:
+        if event_id in self._seen:
+            return False
+        self._seen[event_id] = None
+        if len(self._seen) > self.SEEN_LIMIT:
+            self._seen.popitem(last=False)
+        return True
+
+    def _try_become_broker(self) -> bool:
+        import fcntl
+        lock_file = open(f"{self.path}.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._broker_clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for client in list(self._broker_clients):
+                    if client is not writer:
+                        client.write(line)
+        except asyncio.CancelledError:
+            # Broker shutting down; end the handler quietly
+            pass
+        except Exception as e:
+            logger.warning(f"WS backplane broker client error: {e}")
+        finally:
+            self._broker_clients.discard(writer)
+            writer.close()
+
+    async def _run(self):
+        while True:
+            if self._server is None and self._try_become_broker():
+                # We hold the lock, so any existing socket file is stale
+                self._server = await asyncio.start_unix_server(self._serve_client, path=self.path)
+                logger.info(f"WS backplane broker listening on {self.path}")
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(self.RECONNECT_DELAY)
+                continue
+            self._writer = writer
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    self._handle_event(line)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                logger.warning(f"WS backplane connection lost: {e}")
+            finally:
+                self._writer = None
+                writer.close()
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+    def _handle_event(self, line: bytes):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return
+        if event.get("o") == self.worker_id or not self._mark_seen(event.get("id", "")):
+            return
+        if self._deliver:
+            self._deliver(event["b"], event["m"])
+
+class ConnectionSender:
+    """Bounded outbound queue drained by a dedicated writer task for one socket.
+
+    Broadcasts only enqueue, so a slow client stalls its own writer and
+    nobody else's.
+    """
+
+    def __init__(self, websocket: WebSocket, maxsize: int, on_error):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._on_error = on_error
+        self._task = asyncio.create_task(self._run())
+
+    def offer(self, message: str) -> bool:
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _run(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                await self.websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"WebSocket send failed, dropping connection: {e}")
+            self._on_error(self.websocket)
+
+    def close(self):
+        self._task.cancel()
+
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, backplane=None):
+        self.backplane = backplane or InProcessBackplane(self.deliver_local)
         self.active_connections: Dict[str, set] = {}
         self.user_connections: Dict[str, WebSocket] = {}
+        self.senders: Dict[WebSocket, ConnectionSender] = {}
+        self.subscriptions: Dict[WebSocket, Set[str]] = {}
+        self.dropped_slow_consumers = 0
 
-    async def connect(self, websocket: WebSocket, battle_id: str, user_id: str):
+    async def accept(self, websocket: WebSocket):
         await websocket.accept()
-        if battle_id not in self.active_connections:
-            self.active_connections[battle_id] = set()
-        self.active_connections[battle_id].add(websocket)
+        self.senders[websocket] = ConnectionSender(websocket, WS_SEND_QUEUE_SIZE, self._drop)
+        self.subscriptions[websocket] = set()
+
+    def subscribe(self, websocket: WebSocket, battle_ids: List[str]) -> List[str]:
+        """Add battle subscriptions for a connection; returns the ids that were new."""
+        subscribed = self.subscriptions.get(websocket)
+        if subscribed is None:
+            return []
+        added = []
+        for battle_id in battle_ids:
+            if battle_id in subscribed:
+                continue
+            subscribed.add(battle_id)
+            self.active_connections.setdefault(battle_id, set()).add(websocket)
+            added.append(battle_id)
+        return added
+
+    def unsubscribe(self, websocket: WebSocket, battle_ids):
+        subscribed = self.subscriptions.get(websocket, set())
+        for battle_id in list(battle_ids):
+            subscribed.discard(battle_id)
+            if battle_id in self.active_connections:
+                self.active_connections[battle_id].discard(websocket)
+                if not self.active_connections[battle_id]:
+                    del self.active_connections[battle_id]
+
+    def release(self, websocket: WebSocket):
+        """Drop every subscription and the writer task of a connection."""
+        self.unsubscribe(websocket, self.subscriptions.pop(websocket, set()))
+        sender = self.senders.pop(websocket, None)
+        if sender:
+            sender.close()
+
+    async def connect(self, websocket: WebSocket, battle_id: str, user_id: str):
+        if websocket not in self.senders:
+            await self.accept(websocket)
+        self.subscribe(websocket, [battle_id])
         self.user_connections[f"{battle_id}:{user_id}"] = websocket
         logger.info(f"User {user_id} connected to battle {battle_id}")
 
     def disconnect(self, websocket: WebSocket, battle_id: str, user_id: str):
-        if battle_id in self.active_connections:
-            self.active_connections[battle_id].discard(websocket)
-            if not self.active_connections[battle_id]:
-                del self.active_connections[battle_id]
+        self.release(websocket)
         self.user_connections.pop(f"{battle_id}:{user_id}", None)
         logger.info(f"User {user_id} disconnected from battle {battle_id}")
 
+    def _drop(self, websocket: WebSocket):
+        """Detach a dead or hopelessly slow socket; its endpoint loop cleans up the rest."""
+        self.release(websocket)
+        asyncio.create_task(self._close_quietly(websocket))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            # 1013 "try again later": the client reconnects and gets a fresh battle_state
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def send(self, websocket: WebSocket, message: dict) -> bool:
+        """Queue a message for one socket (keeps ordering with broadcasts)."""
+        sender = self.senders.get(websocket)
+        return bool(sender and sender.offer(json.dumps(message)))
+
     async def broadcast_to_battle(self, battle_id: str, message: dict):
+        # Serialized once, then fanned out to every worker by the backplane
+        await self.backplane.publish(battle_id, json.dumps(message))
+
+    def deliver_local(self, battle_id: str, message_str: str):
+        """Enqueue an already-serialized frame for this worker's viewers of a battle."""
         if battle_id not in self.active_connections:
             return
         
-        message_str = json.dumps(message)
-        disconnected = []
+        overflowed = []
         
         for connection in self.active_connections[battle_id]:
-            try:
-                await connection.send_text(message_str)
-            except:
-                disconnected.append(connection)
+            sender = self.senders.get(connection)
+            if sender is None or not sender.offer(message_str):
+                overflowed.append(connection)
         
-        # Clean up disconnected connections
-        for connection in disconnected:
-            self.active_connections[battle_id].discard(connection)
+        # Slow consumers whose queue is full get disconnected rather than
+        # holding back everyone else
+        for connection in overflowed:
+            self.dropped_slow_consumers += 1
+            self._drop(connection)
+
+def _make_backplane():
+    kind = os.getenv("WS_BACKPLANE", "inprocess").lower()
+    if kind == "unix":
+        return UnixSocketBackplane(os.getenv("WS_BACKPLANE_SOCKET", "/tmp/daddybaddy-ws.sock"))
+    return InProcessBackplane()
+
+manager = ConnectionManager(backplane=_make_backplane())
+
+# ==================== Coalesced vote broadcasts ====================
+class VoteUpdateCoalescer:
+    """Folds per-vote tally changes into at most max_hz vote_update frames per
+    battle per second.
+
+    Only the latest snapshot per battle is kept between ticks and it is
+    serialized once per tick. Dirty battles are always published to the
+    backplane, since viewers may be held by other workers.
+
+    Each worker numbers its own frames: a frame carries `origin` (the
+    publishing worker) and a `seq` counting that origin's frames for the
+    battle, so clients track gaps per (battle, origin). battle_state carries
+    this worker's origin and current seq.
+    """
+
+    def __init__(self, connections: ConnectionManager, max_hz: float):
+        self.connections = connections
+        self.interval = 1 / max_hz
+        self.origin = getattr(connections.backplane, "worker_id", None) or uuid.uuid4().hex
+        self.seq: Dict[str, int] = {}
+        self.updates_received = 0
+        self.naive_frames = 0
+        self.frames_sent = 0
+        self._dirty: Dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def publish(self, battle_id: str, results: dict):
+        self.updates_received += 1
+        # What the old one-broadcast-per-vote path would have sent
+        self.naive_frames += len(self.connections.active_connections.get(battle_id, ()))
+        self._dirty[battle_id] = results
+
+    async def flush(self):
+        dirty, self._dirty = self._dirty, {}
+        timestamp = datetime.now(timezone.utc).isoformat()
+        for battle_id, results in dirty.items():
+            seq = self.seq.get(battle_id, 0) + 1
+            self.seq[battle_id] = seq
+            # Local accounting only; remote viewers are counted by their worker
+            self.frames_sent += len(self.connections.active_connections.get(battle_id, ()))
+            await self.connections.broadcast_to_battle(battle_id, {
+                "type": "vote_update",
+                "origin": self.origin,
+                "seq": seq,
+                "data": {"battle_id": battle_id, "results": results},
+                "timestamp": timestamp
+            })
+
+    def state(self, battle_id: str) -> dict:
+        """origin/seq fields for a battle_state frame."""
+        return {"origin": self.origin, "seq": self.seq.get(battle_id, 0)}
 
-manager = ConnectionManager()
+    def forget(self, battle_id: str):
+        """Drop the seq of a battle that will not get further updates."""
+        self.seq.pop(battle_id, None)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"vote_update flush failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "updates_received": self.updates_received,
+            "frames_without_coalescing": self.naive_frames,
+            "frames_sent": self.frames_sent,
+        }
+
+vote_updates = VoteUpdateCoalescer(manager, max_hz=float(os.getenv("VOTE_UPDATE_MAX_HZ", "4")))
+
+# ==================== Vote write-behind buffer ====================
+class VoteBuffer:
+    """Optional write-behind ingestion for hot battles.
+
+    Votes are acknowledged as soon as they land in a per-battle buffer and are
+    written with one cast_battle_votes_batch RPC per battle when the buffer
+    reaches max_batch or every flush_interval seconds. The statement-level
+    votes trigger then bumps vote_counts once per batch instead of per vote.
+
+    A batch whose RPC fails is parked on its own and retried with exponential
+    backoff; votes arriving meanwhile go into a fresh batch behind it. After
+    max_attempts failures the batch is logged and dropped. Votes the RPC
+    refuses (an earlier stored vote, a battle that is gone or no longer
+    LIVE) come back as rejected and are logged and counted.
+    """
+
+    def __init__(self, max_batch: int, flush_interval: float, max_attempts: int = 5):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.pending: Dict[str, Dict[str, dict]] = {}
+        # battle_id -> (votes, failed attempts, monotonic time of next retry)
+        self.retrying: Dict[str, Tuple[Dict[str, dict], int, float]] = {}
+        self.flushed_votes = 0
+        self.dropped_votes = 0
+        self.rejected_votes = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def pending_vote(self, battle_id: str, user_id: str) -> Optional[dict]:
+        """The user's not-yet-written vote on this battle, if any."""
+        vote = self.pending.get(battle_id, {}).get(user_id)
+        if vote is None and battle_id in self.retrying:
+            vote = self.retrying[battle_id][0].get(user_id)
+        return vote
+
+    def add(self, battle_id: str, user_id: str, choice: str) -> Optional[dict]:
+        """Buffer a vote. Returns the vote record, or None if this user already has one pending."""
+        if self.pending_vote(battle_id, user_id) is not None:
+            return None
+        battle_votes = self.pending.setdefault(battle_id, {})
+        vote = {
+            "battle_id": battle_id,
+            "user_id": user_id,
+            "choice": choice,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        battle_votes[user_id] = vote
+        if len(battle_votes) >= self.max_batch:
+            self._wakeup.set()
+        return vote
+
+    async def _write(self, battle_id: str, battle_votes: Dict[str, dict]) -> bool:
+        batch = [{"user_id": v["user_id"], "choice": v["choice"], "created_at": v["created_at"]} for v in battle_votes.values()]
+        try:
+            result = await db_execute(supabase.rpc("cast_battle_votes_batch", {
+                "battle_uuid": battle_id,
+                "batch": batch
+            }))
+        except Exception as e:
+            logger.error(f"Vote batch flush failed for battle {battle_id} ({len(batch)} votes): {e}")
+            return False
+        outcome = result.data or {}
+        inserted = int(outcome.get("inserted") or 0)
+        self.flushed_votes += inserted
+        rejected = outcome.get("rejected") or []
+        if outcome.get("error"):
+            # Missing or no longer LIVE: refresh the cached status for the next votes
+            known_battles.invalidate(battle_id)
+        if rejected:
+            self.rejected_votes += len(rejected)
+            logger.warning(
+                f"Vote batch for battle {battle_id}: {len(rejected)} of {len(batch)} votes rejected"
+                f" ({outcome.get('error') or 'already voted'}): {', '.join(map(str, rejected[:20]))}"
+            )
+        if not outcome.get("error"):
+            # Rejected voters without a battle error already had a stored vote
+            remember_voters(battle_id, list(outcome.get("inserted_ids") or []) + list(rejected))
+        if inserted:
+            vote_updates.publish(battle_id, _results_from_vote_counts(battle_id, outcome.get("vote_counts")).dict())
+        creator_id = outcome.get("creator_id")
+        if inserted and creator_id:
+            await notify_user(creator_id, f"{inserted} new votes in your battle.", ntype="vote", reference_id=battle_id)
+        return True
+
+    def _failed(self, battle_id: str, battle_votes: Dict[str, dict], attempts: int):
+        if attempts >= self.max_attempts:
+            self.dropped_votes += len(battle_votes)
+            logger.error(f"Dropping {len(battle_votes)} buffered votes for battle {battle_id} after {attempts} failed flushes")
+            return
+        retry_at = time.monotonic() + self.flush_interval * (2 ** attempts)
+        self.retrying[battle_id] = (battle_votes, attempts, retry_at)
+
+    async def flush_battle(self, battle_id: str, force: bool = False):
+        parked = self.retrying.get(battle_id)
+        if parked is not None:
+            battle_votes, attempts, retry_at = parked
+            if not force and time.monotonic() < retry_at:
+                return
+            del self.retrying[battle_id]
+            if not await self._write(battle_id, battle_votes):
+                self._failed(battle_id, battle_votes, attempts + 1)
+                return
+        battle_votes = self.pending.pop(battle_id, None)
+        if not battle_votes:
+            return
+        if not await self._write(battle_id, battle_votes):
+            self._failed(battle_id, battle_votes, 1)
+
+    async def flush_all(self, force: bool = False):
+        battle_ids = set(self.pending) | set(self.retrying)
+        if battle_ids:
+            await asyncio.gather(*(self.flush_battle(bid, force) for bid in battle_ids))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush_all()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and drain whatever is still buffered, retries included."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_all(force=True)
+        if self.retrying:
+            dropped = sum(len(votes) for votes, _, _ in self.retrying.values())
+            self.dropped_votes += dropped
+            logger.error(f"Dropping {dropped} buffered votes that could not be written at shutdown")
+            self.retrying.clear()
+
+# Enabled with VOTE_WRITE_BEHIND=1; vote_battle writes through otherwise.
+vote_buffer: Optional[VoteBuffer] = None
+if os.getenv("VOTE_WRITE_BEHIND", "0") == "1":
+    vote_buffer = VoteBuffer(
+        max_batch=int(os.getenv("VOTE_BUFFER_MAX_BATCH", "500")),
+        flush_interval=float(os.getenv("VOTE_BUFFER_FLUSH_INTERVAL_MS", "250")) / 1000,
+        max_attempts=int(os.getenv("VOTE_BUFFER_MAX_ATTEMPTS", "5")),
+    )
+
+# A buffered vote is acknowledged before it is written, so vote_battle checks
+# it against cached state first. known_battles maps battle_id -> (status,
+# end_time epoch); statuses that can still turn LIVE are not cached.
+# battle_voters maps battle_id -> ids of users with a stored vote, seeded from
+# the votes table the first time a battle is voted on through this worker and
+# extended by every flush. Battles with more than VOTER_SEED_MAX stored votes
+# are not seeded (False); their voters are looked up one indexed query at a
+# time. A vote another worker stores after seeding is still refused by
+# cast_battle_votes_batch, which reports it as rejected.
+VOTER_SEED_MAX = int(os.getenv("VOTER_SEED_MAX", "20000"))
+
+known_battles = TTLCache(
+    maxsize=int(os.getenv("KNOWN_BATTLES_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("KNOWN_BATTLES_TTL_SECONDS", "30")),
+)
+battle_voters = TTLCache(
+    maxsize=int(os.getenv("BATTLE_VOTERS_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("BATTLE_VOTERS_TTL_SECONDS", "300")),
+)
+
+async def battle_vote_status(battle_id: str) -> Optional[str]:
+    """The battle's status for voting (None if it doesn't exist); a LIVE
+    battle past its end_time counts as ENDED before the scheduler fires."""
+    entry = known_battles.get(battle_id)
+    if entry is None:
+        response = await db_execute(
+            supabase.table("battles").select("id,status,end_time").eq("id", battle_id).maybe_single()
+        )
+        if not response or not response.data:
+            return None
+        end_time = _parse_timestamp(response.data.get("end_time"))
+        entry = (response.data.get("status"), end_time.timestamp() if end_time else None)
+        if entry[0] not in ("INVITED", "UPLOADING"):
+            known_battles.set(battle_id, entry)
+    status, ends_at = entry
+    if status == "LIVE" and ends_at is not None and ends_at <= time.time():
+        return "ENDED"
+    return status
+
+async def _seed_battle_voters(battle_id: str):
+    voters: Set[str] = set()
+    query = lambda: supabase.table("votes").select("id,user_id,created_at").eq("battle_id", battle_id)
+    async for rows in scan_keyset(query):
+        voters.update(row["user_id"] for row in rows)
+        if len(voters) > VOTER_SEED_MAX:
+            return False
+    return voters
+
+async def has_stored_vote(battle_id: str, user_id: str) -> bool:
+    voters = battle_voters.get(battle_id)
+    if voters is None:
+        voters = await _seed_battle_voters(battle_id)
+        battle_voters.set(battle_id, voters)
+    if voters is not False:
+        return user_id in voters
+    response = await db_execute(
+        supabase.table("votes").select("id").eq("battle_id", battle_id).eq("user_id", user_id).limit(1)
+    )
+    return bool(response.data)
+
+def remember_voters(battle_id: str, user_ids: List[str]):
+    voters = battle_voters.get(battle_id)
+    if voters:
+        voters.update(user_ids)
+
+# ==================== Battle lifecycle scheduler ====================
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+class BattleScheduler:
+    """Fires battle deadline transitions (INVITED->CANCELLED at accept_deadline,
+    LIVE->ENDED at end_time) from an in-process min-heap.
+
+    The heap is rebuilt from the battles table on startup. Superseded entries
+    are skipped lazily, and every transition is a conditional update on the
+    expected status, so early acceptance, other workers, or a restart never
+    double-fire a transition or its notifications.
+    """
+
+    TRANSITIONS = {
+        "accept": ("INVITED", "CANCELLED"),
+        "end": ("LIVE", "ENDED"),
+    }
+    BATCH_SIZE = 500
+
+    def __init__(self, tick: float):
+        self.tick = tick
+        self.fired = 0
+        self._heap: List[tuple] = []
+        self._deadlines: Dict[tuple, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def schedule(self, battle_id: str, kind: str, when: Optional[datetime]):
+        if when is None:
+            return
+        ts = when.timestamp()
+        self._deadlines[(battle_id, kind)] = ts
+        heapq.heappush(self._heap, (ts, battle_id, kind))
+
+    def cancel(self, battle_id: str, kind: str):
+        # The heap entry stays and is skipped when it surfaces
+        self._deadlines.pop((battle_id, kind), None)
+
+    def pop_due(self, now: float) -> Dict[str, List[str]]:
+        due: Dict[str, List[str]] = {}
+        while self._heap and self._heap[0][0] <= now:
+            ts, battle_id, kind = heapq.heappop(self._heap)
+            if self._deadlines.get((battle_id, kind)) != ts:
+                continue
+            del self._deadlines[(battle_id, kind)]
+            due.setdefault(kind, []).append(battle_id)
+        return due
+
+    async def rebuild(self):
+        """Load every pending deadline from the battles table."""
+        self._heap = []
+        self._deadlines = {}
+        page = 1000
+        offset = 0
+        while True:
+            response = await db_execute(
+                supabase_admin
+                .table("battles")
+                .select("id,status,accept_deadline,end_time")
+                .in_("status", ["INVITED", "LIVE"])
+                .order("id")
+                .range(offset, offset + page - 1)
+            )
+            rows = response.data or []
+            for row in rows:
+                if row.get("status") == "INVITED":
+                    self.schedule(row["id"], "accept", _parse_timestamp(row.get("accept_deadline")))
+                elif row.get("status") == "LIVE":
+                    self.schedule(row["id"], "end", _parse_timestamp(row.get("end_time")))
+            if len(rows) < page:
+                break
+            offset += page
+        logger.info(f"Battle scheduler loaded {len(self)} pending deadlines")
+
+    async def fire(self, kind: str, battle_ids: List[str]):
+        from_status, to_status = self.TRANSITIONS[kind]
+        for i in range(0, len(battle_ids), self.BATCH_SIZE):
+            chunk = battle_ids[i:i + self.BATCH_SIZE]
+            response = await db_execute(
+                supabase_admin
+                .table("battles")
+                .update({"status": to_status})
+                .in_("id", chunk)
+                .eq("status", from_status)
+            )
+            notifications = []
+            for battle in response.data or []:
+                known_battles.invalidate(battle["id"])
+                if kind == "accept":
+                    notifications.append({
+                        "user_id": battle["creator_id"],
+                        "title": "Battle cancelled.",
+                        "message": "Acceptance requirement not met in 2 hours.",
+                        "type": "battle_result",
+                        "reference_id": battle["id"]
+                    })
+                else:
+                    trending_battles.discard(battle["id"])
+                    vote_updates.forget(battle["id"])
+                    participants = {battle.get("creator_id")} | set(battle.get("accepted_user_ids") or [])
+                    for pid in participants:
+                        if pid:
+                            notifications.append({
+                                "user_id": pid,
+                                "title": "Battle ended.",
+                                "message": "See the final results.",
+                                "type": "battle_result",
+                                "reference_id": battle["id"]
+                            })
+            self.fired += len(response.data or [])
+            await notify_users(notifications)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            due = self.pop_due(time.time())
+            for kind, battle_ids in due.items():
+                try:
+                    await self.fire(kind, battle_ids)
+                except Exception as e:
+                    logger.error(f"Battle scheduler failed to fire {kind} for {len(battle_ids)} battles: {e}")
+                    # Retry on the next tick
+                    for battle_id in battle_ids:
+                        self.schedule(battle_id, kind, datetime.now(timezone.utc))
+
+    async def start(self):
+        try:
+            await self.rebuild()
+        except Exception as e:
+            logger.error(f"Battle scheduler rebuild failed: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+battle_scheduler = BattleScheduler(tick=float(os.getenv("BATTLE_SCHEDULER_TICK_SECONDS", "1")))
+
+# ==================== Trending battles ====================
+class TrendingBattles:
+    """Battles ranked by exponentially decayed vote velocity.
+
+    A vote at time t adds exp(decay * (t - origin)) to its battle's key. That
+    is the decayed score times a factor shared by every battle, so keys never
+    need re-decaying and their order only changes when a vote lands. The
+    max-heap holds (-key, battle_id) with lazy deletion: top(k) pops k live
+    entries and pushes them back, O(k log n). Keys are rebased onto a new
+    origin before they overflow, which also drops battles that went quiet.
+
+    Votes cast through this worker are recorded directly; refresh() replays
+    votes on LIVE battles cast through other workers. Each (battle, voter)
+    pair counts once, so the two paths never double count. Only the newest
+    SEEN_LIMIT pairs are remembered; refresh() replays at most the last
+    refresh_overlap seconds again, which that covers at any sane vote rate.
+    """
+
+    REBASE_EXPONENT = 50.0
+    HORIZON_HALF_LIVES = 8
+    SEEN_LIMIT = 100_000
+
+    def __init__(self, half_life: float, min_score: float, refresh_overlap: float = 30):
+        self.decay = math.log(2) / half_life
+        self.half_life = half_life
+        self.min_score = min_score
+        self.refresh_overlap = refresh_overlap
+        self._origin = time.time()
+        self._keys: Dict[str, float] = {}
+        self._heap: List[tuple] = []
+        self._seen: "OrderedDict[tuple, float]" = OrderedDict()
+        self._synced_ts: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def record(self, battle_id: str, ts: Optional[float] = None, voter_id: Optional[str] = None):
+        ts = ts if ts is not None else time.time()
+        if voter_id is not None:
+            if (battle_id, voter_id) in self._seen:
+                return
+            self._seen[(battle_id, voter_id)] = ts
+            if len(self._seen) > self.SEEN_LIMIT:
+                self._seen.popitem(last=False)
+        if self.decay * (ts - self._origin) > self.REBASE_EXPONENT:
+            self._rebase(ts)
+        key = self._keys.get(battle_id, 0.0) + math.exp(self.decay * (ts - self._origin))
+        self._keys[battle_id] = key
+        heapq.heappush(self._heap, (-key, battle_id))
+        if len(self._heap) > 4 * len(self._keys) + 1024:
+            self._rebase(max(ts, time.time()))
+
+    def discard(self, battle_id: str):
+        # The heap entry stays and is skipped when it surfaces
+        self._keys.pop(battle_id, None)
+
+    def _rebase(self, now: float):
+        horizon = now - self.half_life * self.HORIZON_HALF_LIVES
+        while self._seen and next(iter(self._seen.values())) < horizon:
+            self._seen.popitem(last=False)
+        factor = math.exp(-self.decay * (now - self._origin))
+        self._origin = now
+        self._keys = {
+            battle_id: key * factor
+            for battle_id, key in self._keys.items()
+            if key * factor >= self.min_score
+        }
+        self._heap = [(-key, battle_id) for battle_id, key in self._keys.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, k: int) -> List[tuple]:
+        """[(battle_id, votes_per_hour)] for the k hottest battles."""
+        live = []
+        while self._heap and len(live) < k:
+            entry = heapq.heappop(self._heap)
+            if self._keys.get(entry[1]) == -entry[0]:
+                live.append(entry)
+        for entry in live:
+            heapq.heappush(self._heap, entry)
+        # Decayed score -> instantaneous rate (votes/hour)
+        scale = math.exp(-self.decay * (time.time() - self._origin)) * self.decay * 3600
+        return [(battle_id, -neg_key * scale) for neg_key, battle_id in live]
+
+    async def refresh(self) -> int:
+        """Replay votes on LIVE battles cast since the last refresh (the last
+        HORIZON_HALF_LIVES half-lives on the first call, so a restart doesn't
+        reset the ranking). Returns votes newly recorded."""
+        now = time.time()
+        since_ts = now - self.half_life * self.HORIZON_HALF_LIVES
+        if self._synced_ts is not None:
+            since_ts = max(since_ts, self._synced_ts - self.refresh_overlap)
+        since = datetime.fromtimestamp(since_ts, timezone.utc).isoformat()
+        recorded = 0
+        pages = scan_keyset(lambda: (
+            supabase_admin
+            .table("votes")
+            .select("id,battle_id,user_id,created_at,battle:battles!votes_battle_id_fkey!inner(status)")
+            .eq("battle.status", "LIVE")
+            .gte("created_at", since)
+        ))
+        async for rows in pages:
+            for row in rows:
+                created = _parse_timestamp(row.get("created_at"))
+                if not created:
+                    continue
+                self._synced_ts = max(self._synced_ts or 0.0, created.timestamp())
+                if (row["battle_id"], row.get("user_id")) not in self._seen:
+                    self.record(row["battle_id"], created.timestamp(), row.get("user_id"))
+                    recorded += 1
+        if self._synced_ts is None:
+            self._synced_ts = now
+        return recorded
+
+trending_battles = TrendingBattles(
+    half_life=float(os.getenv("TRENDING_BATTLES_HALF_LIFE_MINUTES", "60")) * 60,
+    min_score=0.01,
+)
+TRENDING_BATTLES_REFRESH_SECONDS = float(os.getenv("TRENDING_BATTLES_REFRESH_SECONDS", "15"))
+
+async def refresh_trending_battles_periodically():
+    """Fold in votes cast through other workers."""
+    while True:
+        await asyncio.sleep(TRENDING_BATTLES_REFRESH_SECONDS)
+        try:
+            await trending_battles.refresh()
+        except Exception as e:
+            logger.warning(f"Trending battles refresh failed: {e}")
 
 # Pydantic models
 class UserProfile(BaseModel):
@@ -272,6 +1311,17 @@ class BattleResultsResponse(BaseModel):
     option_a_percentage: float
     option_b_percentage: float
 
+RESULTS_BATCH_MAX = int(os.getenv("RESULTS_BATCH_MAX", "100"))
+
+class BattleResultsBatchRequest(BaseModel):
+    battle_ids: List[str]
+
+    @validator('battle_ids')
+    def validate_battle_ids(cls, v):
+        if len(v) > RESULTS_BATCH_MAX:
+            raise ValueError(f'At most {RESULTS_BATCH_MAX} battle ids per request')
+        return v
+
 class DirectChatRequest(BaseModel):
     recipient_id: str
 
@@ -386,10 +1436,14 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if not user_id:
             raise credentials_exception
             
-        # Get user profile
-        profile_response = supabase.table("profiles").select("*").eq("id", user_id).single().execute()
+        # Get user profile (cached per user id)
+        cached = principal_cache.get(user_id)
+        if cached is not None:
+            return dict(cached)
+        profile_response = await db_execute(supabase.table("profiles").select("*").eq("id", user_id).single())
         if profile_response.data:
-            return profile_response.data
+            principal_cache.set(user_id, profile_response.data)
+            return dict(profile_response.data)
         else:
             raise credentials_exception
             
@@ -401,6 +1455,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         logger.error(f"Authentication error: {e}")
         raise credentials_exception
 
+async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> Optional[dict]:
+    """Like get_current_user, but anonymous or invalid callers get None instead of a 401."""
+    if credentials is None:
+        return None
+    try:
+        return await get_current_user(credentials)
+    except HTTPException:
+        return None
+
 # API Routes
 @api_router.get("/")
 async def root():
@@ -410,6 +1473,25 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now(timezone.utc)}
 
+@api_router.get("/metrics/caches")
+async def cache_metrics():
+    """Hit/miss counters for the in-process caches."""
+    return {
+        "principal": principal_cache.stats(),
+        "profiles": profile_cache.stats(),
+        "follow_counts": follow_counts_cache.stats(),
+        "ranked_feed": ranked_feed_cache.stats(),
+        "threads": thread_cache.stats(),
+    }
+
+@api_router.get("/metrics/realtime")
+async def realtime_metrics():
+    """Outbound WebSocket frame counters for battle updates."""
+    return {
+        "vote_updates": vote_updates.stats(),
+        "dropped_slow_consumers": manager.dropped_slow_consumers,
+    }
+
 # Authentication endpoints
 @api_router.post("/auth/register")
 async def register(request: RegisterRequest):
@@ -420,17 +1502,17 @@ async def register(request: RegisterRequest):
             phone = '+1' + re.sub(r'\D', '', request.phone)
         
         # Check if username is unique
-        existing_user = supabase.table("profiles").select("id").eq("username", request.username).execute()
+        existing_user = await db_execute(supabase.table("profiles").select("id").eq("username", request.username))
         if existing_user.data:
             raise HTTPException(status_code=400, detail="Username already exists")
         
         # Check if phone is unique
-        existing_phone = supabase.table("profiles").select("id").eq("phone", phone).execute()
+        existing_phone = await db_execute(supabase.table("profiles").select("id").eq("phone", phone))
         if existing_phone.data:
             raise HTTPException(status_code=400, detail="Phone number already registered")
         
         # Create user in Supabase Auth (this will trigger the profile creation)
-        auth_response = supabase.auth.sign_up({
+        auth_response = await run_blocking(supabase.auth.sign_up, {
             "phone": phone,
             "password": request.password,
             "options": {
@@ -458,7 +1540,8 @@ async def register(request: RegisterRequest):
                 "created_at": datetime.now(timezone.utc).isoformat()
             }
             
-            supabase.table("profiles").upsert(profile_data).execute()
+            await db_execute(supabase.table("profiles").upsert(profile_data))
+            user_search_index.upsert(profile_data)
             
             return {"message": "Registration successful", "user_id": auth_response.user.id}
         else:
@@ -487,7 +1570,7 @@ async def login(request: LoginRequest):
         else:
             raise HTTPException(status_code=400, detail="Username or phone required")
 
-        profile_response = query.maybe_single().execute()
+        profile_response = await db_execute(query.maybe_single())
         
         if not profile_response.data:
             raise HTTPException(status_code=401, detail="User not found")
@@ -521,7 +1604,7 @@ async def login(request: LoginRequest):
 async def forgot_password(request: ForgotPasswordRequest):
     try:
         # Send OTP via Supabase
-        response = supabase.auth.reset_password_for_phone(request.phone)
+        response = await run_blocking(supabase.auth.reset_password_for_phone, request.phone)
         
         return {"message": "Reset code sent to your phone"}
         
@@ -533,7 +1616,7 @@ async def forgot_password(request: ForgotPasswordRequest):
 async def reset_password(request: ResetPasswordRequest):
     try:
         # Verify OTP and update password
-        response = supabase.auth.verify_otp({
+        response = await run_blocking(supabase.auth.verify_otp, {
             "phone": request.phone,
             "token": request.token,
             "type": "phone_change"
@@ -542,10 +1625,12 @@ async def reset_password(request: ResetPasswordRequest):
         if response.user:
             # Update password hash in profiles table
             password_hash = hash_password(request.new_password)
-            supabase.table("profiles").update({
+            await db_execute(supabase.table("profiles").update({
                 "password_hash": password_hash,
                 "updated_at": datetime.now(timezone.utc).isoformat()
-            }).eq("phone", request.phone).execute()
+            }).eq("phone", request.phone))
+            principal_cache.invalidate_where(lambda p: p.get("phone") == request.phone)
+            profile_cache.invalidate_where(lambda p: p.get("phone") == request.phone)
             
             return {"message": "Password reset successfully"}
         else:
@@ -576,7 +1661,8 @@ async def send_otp(request: ForgotPasswordRequest):
         }
         
         # Send SMS via Twilio
-        message = twilio_client.messages.create(
+        message = await run_blocking(
+            twilio_client.messages.create,
             body=f"Your DaddyBaddy verification code is: {otp}. This code expires in 5 minutes.",
             from_=TWILIO_PHONE_NUMBER,
             to=request.phone
@@ -645,7 +1731,7 @@ async def register_with_otp(request: RegisterRequest):
             raise HTTPException(status_code=400, detail="OTP verification expired. Please verify again.")
         
         # Check if user already exists
-        existing_user = supabase.table("profiles").select("id").eq("phone", request.phone).execute()
+        existing_user = await db_execute(supabase.table("profiles").select("id").eq("phone", request.phone))
         if existing_user.data:
             del otp_storage[request.phone]
             raise HTTPException(status_code=400, detail="User already exists with this phone number")
@@ -675,10 +1761,11 @@ async def register_with_otp(request: RegisterRequest):
         if hasattr(request, 'website') and request.website:
             profile_data["website"] = request.website
         
-        profile_response = supabase.table("profiles").insert(profile_data).execute()
+        profile_response = await db_execute(supabase.table("profiles").insert(profile_data))
         
         if not profile_response.data:
             raise HTTPException(status_code=500, detail="Failed to create user profile")
+        user_search_index.upsert(profile_data)
         
         # Clean up OTP storage
         del otp_storage[request.phone]
@@ -720,7 +1807,7 @@ async def create_battle(
             "end_time": end_time.isoformat() if end_time else None
         }
         
-        response = supabase.table("battles").insert(battle_record).execute()
+        response = await db_execute(supabase.table("battles").insert(battle_record))
         
         if response.data:
             return Battle(**response.data[0])
@@ -734,7 +1821,7 @@ async def create_battle(
 @api_router.get("/battles-legacy", response_model=List[Battle])
 async def get_battles(skip: int = 0, limit: int = 20):
     try:
-        response = supabase.table("battles").select("*").eq("is_active", True).order("created_at", desc=True).range(skip, skip + limit - 1).execute()
+        response = await db_execute(supabase.table("battles").select("*").eq("is_active", True).order("created_at", desc=True).range(skip, skip + limit - 1))
         
         return [Battle(**battle) for battle in response.data]
         
@@ -745,7 +1832,7 @@ async def get_battles(skip: int = 0, limit: int = 20):
 @api_router.get("/battles-legacy/{battle_id}", response_model=Battle)
 async def get_battle(battle_id: str):
     try:
-        response = supabase.table("battles").select("*").eq("id", battle_id).single().execute()
+        response = await db_execute(supabase.table("battles").select("*").eq("id", battle_id).single())
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Battle not found")
@@ -766,7 +1853,7 @@ async def vote_on_battle(
 ):
     try:
         # Check if battle exists and is active
-        battle_response = supabase.table("battles").select("*").eq("id", battle_id).eq("is_active", True).single().execute()
+        battle_response = await db_execute(supabase.table("battles").select("*").eq("id", battle_id).eq("is_active", True).single())
         
         if not battle_response.data:
             raise HTTPException(status_code=404, detail="Battle not found or inactive")
@@ -788,25 +1875,14 @@ async def vote_on_battle(
         }
         
         # Use upsert to handle vote changes
-        response = supabase.table("votes").upsert(vote_record).execute()
+        response = await db_execute(supabase.table("votes").upsert(vote_record))
         
         if response.data:
             vote_response = VoteResponse(**response.data[0])
             
-            # Get updated results and broadcast to connected users
+            # Get updated results; connected users get a coalesced vote_update
             results = await get_battle_results_internal(battle_id)
-            await manager.broadcast_to_battle(battle_id, {
-                "type": "vote_update",
-                "data": {
-                    "battle_id": battle_id,
-                    "results": results,
-                    "latest_vote": {
-                        "user_id": current_user.id,
-                        "choice": vote_data.choice
-                    }
-                },
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            })
+            vote_updates.publish(battle_id, results.dict())
             
             return vote_response
         else:
@@ -822,27 +1898,37 @@ async def vote_on_battle(
 async def get_battle_results(battle_id: str):
     return await get_battle_results_internal(battle_id)
 
+def _results_from_vote_counts(battle_id: str, vote_counts: Any) -> BattleResultsResponse:
+    """Build a results payload from a battles.vote_counts tally ({"A": n, "B": m})."""
+    if isinstance(vote_counts, str):
+        try:
+            vote_counts = json.loads(vote_counts)
+        except ValueError:
+            vote_counts = {}
+    counts = vote_counts or {}
+    option_a_votes = int(counts.get("A") or 0)
+    option_b_votes = int(counts.get("B") or 0)
+    total_votes = option_a_votes + option_b_votes
+
+    option_a_percentage = (option_a_votes / total_votes * 100) if total_votes > 0 else 0
+    option_b_percentage = (option_b_votes / total_votes * 100) if total_votes > 0 else 0
+
+    return BattleResultsResponse(
+        battle_id=battle_id,
+        total_votes=total_votes,
+        option_a_votes=option_a_votes,
+        option_b_votes=option_b_votes,
+        option_a_percentage=round(option_a_percentage, 1),
+        option_b_percentage=round(option_b_percentage, 1)
+    )
+
 async def get_battle_results_internal(battle_id: str) -> BattleResultsResponse:
     try:
-        # Get all votes for the battle
-        votes_response = supabase.table("votes").select("choice").eq("battle_id", battle_id).execute()
-        
-        votes = votes_response.data
-        total_votes = len(votes)
-        option_a_votes = len([v for v in votes if v["choice"] == "A"])
-        option_b_votes = len([v for v in votes if v["choice"] == "B"])
-        
-        option_a_percentage = (option_a_votes / total_votes * 100) if total_votes > 0 else 0
-        option_b_percentage = (option_b_votes / total_votes * 100) if total_votes > 0 else 0
-        
-        return BattleResultsResponse(
-            battle_id=battle_id,
-            total_votes=total_votes,
-            option_a_votes=option_a_votes,
-            option_b_votes=option_b_votes,
-            option_a_percentage=round(option_a_percentage, 1),
-            option_b_percentage=round(option_b_percentage, 1)
-        )
+        # Tallies are maintained on battles.vote_counts by the votes triggers
+        # (see supabase_battle_module.sql), so this is one row regardless of vote count.
+        response = await db_execute(supabase.table("battles").select("vote_counts").eq("id", battle_id).maybe_single())
+        vote_counts = response.data.get("vote_counts") if response and response.data else None
+        return _results_from_vote_counts(battle_id, vote_counts)
         
     except Exception as e:
         logger.error(f"Error getting battle results: {e}")
@@ -854,16 +1940,19 @@ async def websocket_endpoint(websocket: WebSocket, battle_id: str):
     # Simple auth check - in production, implement proper WebSocket auth
     user_id = "anonymous"  # Replace with proper user identification
     
-    await manager.connect(websocket, battle_id, user_id)
+    await manager.accept(websocket)
     
     try:
-        # Send current battle state
+        # Queue the current battle state before subscribing, so no vote_update
+        # for this battle can reach the client ahead of it
         results = await get_battle_results_internal(battle_id)
-        await websocket.send_text(json.dumps({
+        manager.send(websocket, {
             "type": "battle_state",
+            **vote_updates.state(battle_id),
             "data": results.dict(),
             "timestamp": datetime.now(timezone.utc).isoformat()
-        }))
+        })
+        await manager.connect(websocket, battle_id, user_id)
         
         while True:
             # Keep connection alive
@@ -871,7 +1960,7 @@ async def websocket_endpoint(websocket: WebSocket, battle_id: str):
             message = json.loads(data)
             
             if message.get("type") == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+                manager.send(websocket, {"type": "pong"})
                 
     except WebSocketDisconnect:
         manager.disconnect(websocket, battle_id, user_id)
@@ -879,6 +1968,112 @@ async def websocket_endpoint(websocket: WebSocket, battle_id: str):
         logger.error(f"WebSocket error: {e}")
         manager.disconnect(websocket, battle_id, user_id)
 
+async def get_battle_results_batch(battle_ids: List[str]) -> Dict[str, BattleResultsResponse]:
+    """Results for many battles from one battles.vote_counts read; unknown ids are skipped."""
+    if not battle_ids:
+        return {}
+    response = await db_execute(supabase.table("battles").select("id,vote_counts").in_("id", battle_ids))
+    return {
+        row["id"]: _results_from_vote_counts(row["id"], row.get("vote_counts"))
+        for row in (response.data or []) if row.get("id")
+    }
+
+def _normalize_battle_ids(raw_ids: list):
+    """Split client-supplied ids into canonical UUID strings and rejects."""
+    valid, invalid = [], []
+    for raw in raw_ids:
+        try:
+            valid.append(str(uuid.UUID(str(raw))))
+        except ValueError:
+            invalid.append(raw)
+    return valid, invalid
+
+@api_router.post("/battles/results:batch")
+async def get_battle_results_for_many(request: BattleResultsBatchRequest):
+    """Results for up to RESULTS_BATCH_MAX battles in one query; unknown ids are listed under missing"""
+    # A malformed id would fail the whole IN query, so treat it as missing
+    battle_ids, missing = _normalize_battle_ids(list(dict.fromkeys(request.battle_ids)))
+    try:
+        results = await get_battle_results_batch(battle_ids)
+    except Exception as e:
+        logger.error(f"Error getting batch battle results: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get battle results")
+    missing.extend(battle_id for battle_id in battle_ids if battle_id not in results)
+    return {
+        "results": {battle_id: res.dict() for battle_id, res in results.items()},
+        "missing": missing
+    }
+
+# Multiplexed WebSocket: one socket, many battles
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "100"))
+
+@api_router.websocket("/ws/battles")
+async def websocket_multiplex_endpoint(websocket: WebSocket):
+    """Clients send {"type": "subscribe" | "unsubscribe", "battle_ids": [...]}.
+
+    Each subscribe batch is answered with one battle_states frame built from a
+    single query; vote_update frames then arrive for every subscribed battle.
+    """
+    await manager.accept(websocket)
+    
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                message = json.loads(data)
+            except ValueError:
+                manager.send(websocket, {"type": "error", "detail": "Invalid JSON"})
+                continue
+            
+            if not isinstance(message, dict):
+                manager.send(websocket, {"type": "error", "detail": "Expected a JSON object"})
+                continue
+            msg_type = message.get("type")
+            raw_ids = message.get("battle_ids") or []
+            if not isinstance(raw_ids, list):
+                manager.send(websocket, {"type": "error", "detail": "battle_ids must be a list"})
+                continue
+            battle_ids, invalid = _normalize_battle_ids(raw_ids)
+            if invalid:
+                manager.send(websocket, {"type": "error", "detail": "Invalid battle ids", "battle_ids": invalid})
+            if msg_type == "ping":
+                manager.send(websocket, {"type": "pong"})
+            elif msg_type == "subscribe":
+                current = manager.subscriptions.get(websocket, set())
+                new_ids = [b for b in dict.fromkeys(battle_ids) if b not in current]
+                wanted = new_ids[:max(WS_MAX_SUBSCRIPTIONS - len(current), 0)]
+                added = manager.subscribe(websocket, wanted)
+                try:
+                    results = await get_battle_results_batch(added)
+                except Exception as e:
+                    # Only this request fails; the client can retry it
+                    logger.error(f"WebSocket subscribe lookup failed: {e}")
+                    manager.unsubscribe(websocket, added)
+                    manager.send(websocket, {"type": "error", "detail": "Failed to load battles", "battle_ids": added})
+                    continue
+                missing = [bid for bid in added if bid not in results]
+                if missing:
+                    manager.unsubscribe(websocket, missing)
+                    manager.send(websocket, {"type": "error", "detail": "Battles not found", "battle_ids": missing})
+                manager.send(websocket, {
+                    "type": "battle_states",
+                    "data": [
+                        {**res.dict(), **vote_updates.state(bid)}
+                        for bid, res in results.items()
+                    ],
+                    "timestamp": datetime.now(timezone.utc).isoformat()
+                })
+                if len(wanted) < len(new_ids):
+                    manager.send(websocket, {"type": "error", "detail": f"Subscription limit is {WS_MAX_SUBSCRIPTIONS}"})
+            elif msg_type == "unsubscribe":
+                manager.unsubscribe(websocket, battle_ids)
+                
+    except WebSocketDisconnect:
+        manager.release(websocket)
+    except Exception as e:
+        logger.error(f"WebSocket error: {e}")
+        manager.release(websocket)
+
 # User profile endpoints
 @api_router.get("/profile", response_model=UserProfile)
 async def get_profile(current_user: UserProfile = Depends(get_current_user)):
@@ -891,7 +2086,7 @@ async def send_private_comment(battle_id: str, payload: PrivateCommentCreate, cu
     """Send a private comment to the battle creator. Max 5 per user per 24h."""
     try:
         # Get battle to identify creator
-        battle_resp = supabase.table("battles").select("creator_id").eq("id", battle_id).single().execute()
+        battle_resp = await db_execute(supabase.table("battles").select("creator_id").eq("id", battle_id).single())
         if not battle_resp.data:
             raise HTTPException(status_code=404, detail="Battle not found")
         creator_id = battle_resp.data.get("creator_id")
@@ -901,7 +2096,7 @@ async def send_private_comment(battle_id: str, payload: PrivateCommentCreate, cu
         # Rate limit: 5 comments / 24h per user per battle
         since = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
         try:
-            recent = supabase.table("private_battle_comments").select("id", count="exact").eq("battle_id", battle_id).eq("author_id", current_user["id"]).gte("created_at", since).execute()
+            recent = await db_execute(supabase.table("private_battle_comments").select("id", count="exact").eq("battle_id", battle_id).eq("author_id", current_user["id"]).gte("created_at", since))
             # Some drivers return count on the result; default 0
             rate_count = getattr(recent, 'count', None)
             if rate_count is None:
@@ -925,7 +2120,7 @@ async def send_private_comment(battle_id: str, payload: PrivateCommentCreate, cu
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         try:
-            resp = supabase.table("private_battle_comments").insert(record).execute()
+            resp = await db_execute(supabase.table("private_battle_comments").insert(record))
         except Exception as e:
             # Likely missing table; guide caller gracefully
             logger.error(f"Private comment insert failed: {e}")
@@ -933,7 +2128,7 @@ async def send_private_comment(battle_id: str, payload: PrivateCommentCreate, cu
 
         # Notify creator if notifications table exists
         try:
-            supabase.table("notifications").insert({
+            await db_execute(supabase.table("notifications").insert({
                 "user_id": creator_id,
                 "title": "Private comment on your battle",
                 "message": payload.content[:140],
@@ -941,7 +2136,7 @@ async def send_private_comment(battle_id: str, payload: PrivateCommentCreate, cu
                 "reference_id": battle_id,
                 "is_read": False,
                 "created_at": datetime.now(timezone.utc).isoformat()
-            }).execute()
+            }))
         except Exception:
             pass
 
@@ -956,7 +2151,7 @@ async def send_private_comment(battle_id: str, payload: PrivateCommentCreate, cu
 async def list_private_comments(battle_id: str, filter: str = "all", current_user: dict = Depends(get_current_user)):
     """List private comments for a battle (creator only). filter=all|unread|reported"""
     try:
-        battle_resp = supabase.table("battles").select("creator_id").eq("id", battle_id).single().execute()
+        battle_resp = await db_execute(supabase.table("battles").select("creator_id").eq("id", battle_id).single())
         if not battle_resp.data:
             raise HTTPException(status_code=404, detail="Battle not found")
         if battle_resp.data.get("creator_id") != current_user["id"]:
@@ -966,7 +2161,7 @@ async def list_private_comments(battle_id: str, filter: str = "all", current_use
             query = query.eq("is_read", False)
         elif filter == "reported":
             query = query.eq("is_reported", True)
-        resp = query.execute()
+        resp = await db_execute(query)
         return {"comments": resp.data}
     except HTTPException:
         raise
@@ -978,14 +2173,14 @@ async def list_private_comments(battle_id: str, filter: str = "all", current_use
 async def mark_private_comment_read(comment_id: str, current_user: dict = Depends(get_current_user)):
     try:
         # Ensure current user owns the comment (as creator)
-        resp = supabase.table("private_battle_comments").select("*").eq("id", comment_id).single().execute()
+        resp = await db_execute(supabase.table("private_battle_comments").select("*").eq("id", comment_id).single())
         data = resp.data
         if not data:
             raise HTTPException(status_code=404, detail="Not found")
-        battle = supabase.table("battles").select("creator_id").eq("id", data["battle_id"]).single().execute()
+        battle = await db_execute(supabase.table("battles").select("creator_id").eq("id", data["battle_id"]).single())
         if battle.data.get("creator_id") != current_user["id"]:
             raise HTTPException(status_code=403, detail="Not allowed")
-        supabase.table("private_battle_comments").update({"is_read": True}).eq("id", comment_id).execute()
+        await db_execute(supabase.table("private_battle_comments").update({"is_read": True}).eq("id", comment_id))
         return {"success": True}
     except HTTPException:
         raise
@@ -997,7 +2192,7 @@ async def mark_private_comment_read(comment_id: str, current_user: dict = Depend
 async def report_private_comment(comment_id: str, current_user: dict = Depends(get_current_user)):
     try:
         # Creator or any authenticated user can report
-        supabase.table("private_battle_comments").update({"is_reported": True}).eq("id", comment_id).execute()
+        await db_execute(supabase.table("private_battle_comments").update({"is_reported": True}).eq("id", comment_id))
         return {"success": True}
     except Exception as e:
         logger.error(f"Error reporting comment: {e}")
@@ -1007,14 +2202,14 @@ async def report_private_comment(comment_id: str, current_user: dict = Depends(g
 async def delete_private_comment(comment_id: str, current_user: dict = Depends(get_current_user)):
     try:
         # Only battle creator may delete
-        resp = supabase.table("private_battle_comments").select("*").eq("id", comment_id).single().execute()
+        resp = await db_execute(supabase.table("private_battle_comments").select("*").eq("id", comment_id).single())
         data = resp.data
         if not data:
             raise HTTPException(status_code=404, detail="Not found")
-        battle = supabase.table("battles").select("creator_id").eq("id", data["battle_id"]).single().execute()
+        battle = await db_execute(supabase.table("battles").select("creator_id").eq("id", data["battle_id"]).single())
         if battle.data.get("creator_id") != current_user["id"]:
             raise HTTPException(status_code=403, detail="Not allowed")
-        supabase.table("private_battle_comments").delete().eq("id", comment_id).execute()
+        await db_execute(supabase.table("private_battle_comments").delete().eq("id", comment_id))
         return {"success": True}
     except HTTPException:
         raise
@@ -1033,9 +2228,13 @@ async def update_profile(update: UpdateProfileRequest, current_user: dict = Depe
         if not data:
             return {"message": "No changes"}
         data["updated_at"] = datetime.now(timezone.utc).isoformat()
-        supabase.table("profiles").update(data).eq("id", current_user["id"]).execute()
+        await db_execute(supabase.table("profiles").update(data).eq("id", current_user["id"]))
+        principal_cache.invalidate(current_user["id"])
+        profile_cache.invalidate(current_user["id"])
         # Return updated profile
-        resp = supabase.table("profiles").select("*").eq("id", current_user["id"]).single().execute()
+        resp = await db_execute(supabase.table("profiles").select("*").eq("id", current_user["id"]).single())
+        if resp.data:
+            user_search_index.upsert(resp.data)
         return {"profile": resp.data}
     except Exception as e:
         logger.error(f"Error updating profile: {e}")
@@ -1051,7 +2250,22 @@ logging.basicConfig(
 
 @api_router.get("/battles")
 async def get_battles(skip: int = 0, limit: int = 20, status: str = None):
-    """Get battles with pagination and filtering. Falls back if 'status' column doesn't exist."""
+    """Get battles with pagination and filtering.
+
+    Each battle comes back as a card (battle row plus creator, submissions and
+    vote_counts) read from the trigger-maintained battle_cards table. Falls
+    back to plain battle rows if cards are unavailable, and to is_active if the
+    'status' column doesn't exist.
+    """
+    try:
+        query = supabase.table("battle_cards").select("card")
+        if status:
+            query = query.eq("status", status)
+        response = await db_execute(query.order("created_at", desc=True).range(skip, skip + limit - 1))
+        battles = [row["card"] for row in (response.data or [])]
+        return {"battles": battles, "has_more": len(battles) == limit}
+    except Exception as e:
+        logger.warning(f"Battle cards unavailable, reading battles directly: {e}")
     try:
         # Preferred shape with rich relations (if available)
         query = supabase.table("battles").select("*")
@@ -1063,26 +2277,54 @@ async def get_battles(skip: int = 0, limit: int = 20, status: str = None):
                 # Ignore filter if unsupported
                 pass
         query = query.order("created_at", desc=True).range(skip, skip + limit - 1)
-        response = query.execute()
+        response = await db_execute(query)
         return {"battles": response.data, "has_more": len(response.data) == limit}
     except Exception as e:
         logger.error(f"Error fetching battles: {e}")
         # Fallback to is_active-based filtering if supported
         try:
-            response = (
+            response = await db_execute(
                 supabase
                 .table("battles")
                 .select("*")
                 .eq("is_active", True)
                 .order("created_at", desc=True)
                 .range(skip, skip + limit - 1)
-                .execute()
             )
             return {"battles": response.data, "has_more": len(response.data) == limit}
         except Exception as e2:
             logger.error(f"Battles fallback failed: {e2}")
             raise HTTPException(status_code=500, detail="Failed to fetch battles")
 
+@api_router.get("/battles/trending")
+async def get_trending_battles(limit: int = 20):
+    """Battles ranked by recent vote velocity (decayed votes/hour), hottest first"""
+    try:
+        limit = max(1, min(limit, 100))
+        # Over-fetch a little: battles that ended on another worker drop out here
+        ranked = trending_battles.top(limit * 2)
+        if not ranked:
+            return {"battles": []}
+        response = await db_execute(
+            supabase.table("battles").select("*")
+            .in_("id", [battle_id for battle_id, _ in ranked])
+            .eq("status", "LIVE")
+        )
+        by_id = {row["id"]: row for row in (response.data or [])}
+        battles = []
+        for battle_id, velocity in ranked:
+            battle = by_id.get(battle_id)
+            if battle is None:
+                trending_battles.discard(battle_id)
+                continue
+            if len(battles) < limit:
+                battle["vote_velocity"] = round(velocity, 3)
+                battles.append(battle)
+        return {"battles": battles}
+    except Exception as e:
+        logger.error(f"Error fetching trending battles: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch trending battles")
+
 @api_router.post("/battles")
 async def create_battle(request: Request, current_user: dict = Depends(get_current_user)):
     """Create a new battle from flexible payload posted by the client."""
@@ -1106,7 +2348,7 @@ async def create_battle(request: Request, current_user: dict = Depends(get_curre
             "is_active": True,
             "created_at": now_iso
         }
-        response = supabase.table("battles").insert(record).execute()
+        response = await db_execute(supabase.table("battles").insert(record))
         return {"battle": response.data[0]}
     except Exception as e:
         logger.error(f"Error creating battle: {e}")
@@ -1138,15 +2380,17 @@ async def create_user_battle(payload: UserBattleCreate, current_user: dict = Dep
             "created_at": now.isoformat()
         }
         try:
-            resp = supabase_admin.table("battles").insert(record).execute()
+            resp = await db_execute(supabase_admin.table("battles").insert(record))
         except Exception as e:
             logger.error(f"User battle insert failed: {e}")
             raise HTTPException(status_code=500, detail="User battle flow not enabled. Run DB migration.")
 
+        battle_scheduler.schedule(record["id"], "accept", now + timedelta(hours=2))
+
         # Notify invitees
         creator_name = tag_from_user(current_user)
         for uid in payload.invited_user_ids:
-            notify_user(uid, f"{creator_name} challenged you.", "Accept within 2 hours to join.", ntype="challenge_sent", reference_id=record["id"]) 
+            await notify_user(uid, f"{creator_name} challenged you.", "Accept within 2 hours to join.", ntype="challenge_sent", reference_id=record["id"]) 
         return {"battle": resp.data[0]}
     except HTTPException:
         raise
@@ -1154,8 +2398,8 @@ async def create_user_battle(payload: UserBattleCreate, current_user: dict = Dep
         logger.error(f"Error creating user battle: {e}")
         raise HTTPException(status_code=500, detail="Failed to create user battle")
 
-def _load_acceptance_lists(battle_id: str):
-    b = supabase.table("battles").select("creator_id, mode, status, accept_deadline, invited_user_ids, accepted_user_ids").eq("id", battle_id).single().execute()
+async def _load_acceptance_lists(battle_id: str):
+    b = await db_execute(supabase.table("battles").select("creator_id, mode, status, accept_deadline, invited_user_ids, accepted_user_ids").eq("id", battle_id).single())
     if not b.data:
         raise HTTPException(status_code=404, detail="Battle not found")
     data = b.data
@@ -1167,12 +2411,18 @@ def _threshold_met(mode: str, accepted_count: int) -> bool:
 @api_router.post("/battles/{battle_id}/accept")
 async def accept_battle(battle_id: str, current_user: dict = Depends(get_current_user)):
     try:
-        data = _load_acceptance_lists(battle_id)
+        data = await _load_acceptance_lists(battle_id)
         # deadline check
         if data.get("accept_deadline"):
             if datetime.now(timezone.utc) > datetime.fromisoformat(data["accept_deadline"].replace('Z','+00:00')):
-                supabase.table("battles").update({"status": "CANCELLED"}).eq("id", battle_id).execute()
-                notify_user(data["creator_id"], "Battle cancelled.", "Acceptance requirement not met in 2 hours.", ntype="battle_result", reference_id=battle_id)
+                # Conditional, like BattleScheduler.fire: only the request (or
+                # timer) that actually flips the status sends the notification
+                cancelled = await db_execute(
+                    supabase.table("battles").update({"status": "CANCELLED"}).eq("id", battle_id).eq("status", "INVITED")
+                )
+                if cancelled.data:
+                    battle_scheduler.cancel(battle_id, "accept")
+                    await notify_user(data["creator_id"], "Battle cancelled.", "Acceptance requirement not met in 2 hours.", ntype="battle_result", reference_id=battle_id)
                 raise HTTPException(status_code=400, detail="Acceptance window expired")
         invited = set((data.get("invited_user_ids") or []))
         accepted = set((data.get("accepted_user_ids") or []))
@@ -1182,22 +2432,23 @@ async def accept_battle(battle_id: str, current_user: dict = Depends(get_current
         if uid in accepted:
             return {"accepted": True}
         accepted.add(uid)
-        supabase_admin.table("battles").update({"accepted_user_ids": list(accepted), "status": "INVITED"}).eq("id", battle_id).execute()
+        await db_execute(supabase_admin.table("battles").update({"accepted_user_ids": list(accepted), "status": "INVITED"}).eq("id", battle_id))
 
         # Notify creator and accepted participants
         accepter = tag_from_user(current_user)
-        notify_user(data["creator_id"], f"{accepter} accepted your battle.", "Upload your photo to start.", ntype="challenge_accepted", reference_id=battle_id)
+        await notify_user(data["creator_id"], f"{accepter} accepted your battle.", "Upload your photo to start.", ntype="challenge_accepted", reference_id=battle_id)
         for aid in accepted:
             if aid != data["creator_id"] and aid != uid:
-                notify_user(aid, f"{accepter} joined the battle.", "Upload your photo to start.", ntype="challenge_accepted", reference_id=battle_id)
+                await notify_user(aid, f"{accepter} joined the battle.", "Upload your photo to start.", ntype="challenge_accepted", reference_id=battle_id)
 
         # Threshold check
         if _threshold_met(data.get("mode"), len(accepted)):
-            supabase_admin.table("battles").update({"status": "UPLOADING"}).eq("id", battle_id).execute()
+            battle_scheduler.cancel(battle_id, "accept")
+            await db_execute(supabase_admin.table("battles").update({"status": "UPLOADING"}).eq("id", battle_id))
             # Inform participants to upload
             participants = list(accepted) + [data["creator_id"]]
             for pid in participants:
-                notify_user(pid, "Battle is ready to upload.", "Upload your image to begin.", ntype="battle_started", reference_id=battle_id)
+                await notify_user(pid, "Battle is ready to upload.", "Upload your image to begin.", ntype="battle_started", reference_id=battle_id)
         return {"accepted": True}
     except HTTPException:
         raise
@@ -1208,7 +2459,7 @@ async def accept_battle(battle_id: str, current_user: dict = Depends(get_current
 @api_router.post("/battles/{battle_id}/decline")
 async def decline_battle(battle_id: str, current_user: dict = Depends(get_current_user)):
     try:
-        data = _load_acceptance_lists(battle_id)
+        data = await _load_acceptance_lists(battle_id)
         invited = set((data.get("invited_user_ids") or []))
         if current_user["id"] not in invited:
             raise HTTPException(status_code=403, detail="Not invited")
@@ -1224,7 +2475,7 @@ async def decline_battle(battle_id: str, current_user: dict = Depends(get_curren
 async def upload_battle_submission(battle_id: str, payload: dict, current_user: dict = Depends(get_current_user)):
     """Upload media for a battle (creator or accepted participants only). Starts battle when all required uploads present."""
     try:
-        data = _load_acceptance_lists(battle_id)
+        data = await _load_acceptance_lists(battle_id)
         creator_id = data["creator_id"]
         accepted = set((data.get("accepted_user_ids") or []))
         uid = current_user["id"]
@@ -1233,26 +2484,29 @@ async def upload_battle_submission(battle_id: str, payload: dict, current_user:
         media_url = payload.get("media_url")
         if not media_url:
             raise HTTPException(status_code=400, detail="media_url required")
-        supabase_admin.table("battle_submissions").upsert({
+        await db_execute(supabase_admin.table("battle_submissions").upsert({
             "battle_id": battle_id,
             "user_id": uid,
             "media_url": media_url,
             "created_at": datetime.now(timezone.utc).isoformat()
-        }).execute()
+        }))
         
         # Check if all required uploads present
         required = len(accepted) + 1  # creator + accepted
-        subs = supabase.table("battle_submissions").select("id,user_id").eq("battle_id", battle_id).execute()
+        subs = await db_execute(supabase.table("battle_submissions").select("id,user_id").eq("battle_id", battle_id))
         unique_uploaders = len({s.get('user_id') for s in (subs.data or [])})
         if unique_uploaders >= required:
             # Start battle
-            supabase_admin.table("battles").update({
+            start_time = datetime.now(timezone.utc)
+            end_time = start_time + timedelta(hours=24)
+            await db_execute(supabase_admin.table("battles").update({
                 "status": "LIVE",
-                "start_time": datetime.now(timezone.utc).isoformat(),
-                "end_time": (datetime.now(timezone.utc) + timedelta(hours=24)).isoformat()
-            }).eq("id", battle_id).execute()
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat()
+            }).eq("id", battle_id))
+            battle_scheduler.schedule(battle_id, "end", end_time)
             for pid in list(accepted) + [creator_id]:
-                notify_user(pid, "Battle is LIVE for 24 hours.", "Share to get votes!", ntype="battle_started", reference_id=battle_id)
+                await notify_user(pid, "Battle is LIVE for 24 hours.", "Share to get votes!", ntype="battle_started", reference_id=battle_id)
         return {"success": True}
     except HTTPException:
         raise
@@ -1277,23 +2531,39 @@ def _user_can_view_battle(battle: dict, user_id: str) -> bool:
 
 @api_router.get("/battles/{battle_id}")
 async def get_battle(battle_id: str, current_user: dict = Depends(get_current_user)):
-    """Get a specific battle by ID"""
+    """Get a specific battle by ID.
+
+    Votes come back as aggregate results plus the caller's own vote; the voter
+    list is paginated separately via /battles/{battle_id}/voters.
+    """
     try:
-        response = supabase_admin.table("battles").select("""
-            *,
-            creator:profiles!battles_creator_id_fkey(*),
-            participants:profiles!battle_participants(*),
-            votes:votes(*)
-        """).eq("id", battle_id).single().execute()
+        user_id = current_user.get("id")
+        response = await db_execute(
+            supabase_admin.table("battles").select("""
+                *,
+                creator:profiles!battles_creator_id_fkey(*),
+                participants:profiles!battle_participants(*),
+                my_vote:votes(choice,created_at)
+            """)
+            .eq("id", battle_id)
+            .eq("my_vote.user_id", user_id)
+            .single()
+        )
 
         battle = response.data
         if not battle:
             raise HTTPException(status_code=404, detail="Battle not found")
 
-        user_id = current_user.get("id")
         if not user_id or not _user_can_view_battle(battle, user_id):
             raise HTTPException(status_code=403, detail="Not authorized to view this battle")
 
+        my_votes = battle.pop("my_vote", None) or []
+        my_vote = my_votes[0] if my_votes else None
+        if my_vote is None and vote_buffer is not None:
+            # Acknowledged but not yet flushed
+            my_vote = vote_buffer.pending_vote(battle_id, user_id)
+        battle["my_vote"] = my_vote["choice"] if my_vote else None
+        battle["results"] = _results_from_vote_counts(battle_id, battle.get("vote_counts")).dict()
         return {"battle": battle}
     except HTTPException:
         raise
@@ -1301,63 +2571,712 @@ async def get_battle(battle_id: str, current_user: dict = Depends(get_current_us
         logger.error(f"Error fetching battle: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch battle")
 
+def encode_cursor(created_at: str, row_id: str) -> str:
+    """Opaque keyset cursor for (created_at, id) ordered pages."""
+    raw = json.dumps([created_at, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return str(created_at), str(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_before(created_at: str, row_id: str) -> str:
+    """PostgREST or-filter selecting rows strictly after a cursor in (created_at, id) DESC order."""
+    return f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})'
+
+def keyset_after(created_at: str, row_id: str, column: str = "created_at") -> str:
+    """PostgREST or-filter selecting rows strictly after a cursor in (column, id) ASC order."""
+    return f'{column}.gt."{created_at}",and({column}.eq."{created_at}",id.gt.{row_id})'
+
+async def scan_keyset(make_query, page_size: int = 1000, column: str = "created_at"):
+    """Yield pages of rows in (column, id) ASC order.
+
+    make_query() returns a fresh filtered builder (the selected columns must
+    include column and id); each page resumes after the last row of the
+    previous one, so deep scans stay index range scans.
+    """
+    cursor = None
+    while True:
+        query = make_query()
+        if cursor is not None:
+            query = query.or_(keyset_after(*cursor, column=column))
+        response = await db_execute(query.order(column).order("id").limit(page_size))
+        rows = response.data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1][column], rows[-1]["id"])
+
+@api_router.get("/battles/{battle_id}/voters")
+async def get_battle_voters(battle_id: str, limit: int = 50, cursor: Optional[str] = None,
+                            current_user: dict = Depends(get_current_user)):
+    """Voters on a battle, newest first, keyset-paginated by an opaque cursor"""
+    try:
+        limit = max(1, min(limit, 200))
+        battle = await db_execute(
+            supabase_admin.table("battles")
+            .select("id,status,creator_id,participant_ids,invited_user_ids,accepted_user_ids")
+            .eq("id", battle_id)
+            .maybe_single()
+        )
+        if not battle or not battle.data:
+            raise HTTPException(status_code=404, detail="Battle not found")
+        if not _user_can_view_battle(battle.data, current_user["id"]):
+            raise HTTPException(status_code=403, detail="Not authorized to view this battle")
+
+        query = (
+            supabase_admin.table("votes")
+            .select("id,choice,created_at,voter:profiles!votes_user_id_fkey(id,username,full_name,avatar_url)")
+            .eq("battle_id", battle_id)
+        )
+        if cursor:
+            query = query.or_(keyset_before(*decode_cursor(cursor)))
+        response = await db_execute(
+            query.order("created_at", desc=True).order("id", desc=True).limit(limit)
+        )
+        voters = response.data or []
+        next_cursor = encode_cursor(voters[-1]["created_at"], voters[-1]["id"]) if len(voters) == limit else None
+        return {"voters": voters, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching battle voters: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch battle voters")
+
 @api_router.post("/battles/{battle_id}/vote")
 async def vote_battle(battle_id: str, vote_data: dict, current_user: dict = Depends(get_current_user)):
     """Vote on a battle"""
     try:
-        # Check if user already voted
-        existing_vote = supabase.table("votes").select("*").eq("battle_id", battle_id).eq("user_id", current_user["id"]).execute()
-        
-        if existing_vote.data:
+        choice = vote_data.get("choice")
+        if choice not in ("A", "B"):
+            raise HTTPException(status_code=400, detail="Choice must be A or B")
+
+        try:
+            battle_id = str(uuid.UUID(battle_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid battle id")
+
+        if vote_buffer is not None:
+            # A buffered vote is acknowledged before it is written, so the
+            # battle has to be checked up front rather than by the insert.
+            status = await battle_vote_status(battle_id)
+            if status is None:
+                raise HTTPException(status_code=404, detail="Battle not found")
+            if status != "LIVE":
+                raise HTTPException(status_code=400, detail="Battle is not open for voting")
+            if vote_buffer.pending_vote(battle_id, current_user["id"]) is not None \
+                    or await has_stored_vote(battle_id, current_user["id"]):
+                raise HTTPException(status_code=400, detail="User has already voted on this battle")
+            vote = vote_buffer.add(battle_id, current_user["id"], choice)
+            if vote is None:
+                raise HTTPException(status_code=400, detail="User has already voted on this battle")
+            trending_battles.record(battle_id, voter_id=current_user["id"])
+            return {"vote": vote, "queued": True}
+
+        # One round-trip: insert (unique per user/battle), tally bump via the
+        # votes trigger and the new counts all happen inside cast_battle_vote.
+        result = await db_execute(supabase.rpc("cast_battle_vote", {
+            "battle_uuid": battle_id,
+            "voter_uuid": current_user["id"],
+            "vote_choice": choice
+        }))
+        outcome = result.data or {}
+        if outcome.get("error") == "not_found":
+            raise HTTPException(status_code=404, detail="Battle not found")
+        if outcome.get("error") == "closed":
+            raise HTTPException(status_code=400, detail="Battle is not open for voting")
+        if not outcome.get("voted"):
             raise HTTPException(status_code=400, detail="User has already voted on this battle")
-        
-        # Create vote
-        vote_data.update({
-            "battle_id": battle_id,
-            "user_id": current_user["id"],
-            "created_at": datetime.now(timezone.utc).isoformat()
-        })
-        
-        response = supabase.table("votes").insert(vote_data).execute()
-        
-        # Update battle vote counts
-        battle = supabase.table("battles").select("vote_counts").eq("id", battle_id).single().execute()
-        current_counts = battle.data.get("vote_counts", {})
-        choice = vote_data["choice"]
-        current_counts[choice] = current_counts.get(choice, 0) + 1
-        
-        supabase.table("battles").update({"vote_counts": current_counts}).eq("id", battle_id).execute()
+
+        results = _results_from_vote_counts(battle_id, outcome.get("vote_counts"))
+        vote_updates.publish(battle_id, results.dict())
+        trending_battles.record(battle_id, voter_id=current_user["id"])
+
         # Notify creator of a new vote (best-effort)
-        try:
-            battle_info = supabase.table("battles").select("creator_id").eq("id", battle_id).single().execute()
-            creator_id = battle_info.data.get("creator_id") if battle_info.data else None
-            if creator_id and creator_id != current_user["id"]:
-                voter = tag_from_user(current_user)
-                notify_user(creator_id, f"{voter} voted in your battle.", ntype="vote", reference_id=battle_id)
-        except Exception:
-            pass
+        creator_id = outcome.get("creator_id")
+        if creator_id and creator_id != current_user["id"]:
+            voter = tag_from_user(current_user)
+            await notify_user(creator_id, f"{voter} voted in your battle.", ntype="vote", reference_id=battle_id)
 
-        return {"vote": response.data[0]}
+        return {"vote": outcome.get("vote"), "results": results.dict()}
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error voting on battle: {e}")
         raise HTTPException(status_code=500, detail="Failed to vote on battle")
 
-# ==================== POST ENDPOINTS ====================
+# ==================== FEED RANKING ====================
+# Optional ranked mode for /api/posts and /api/posts/feed/{user_id}: a window of
+# recent candidates is scored with time-decayed engagement in one NumPy pass
+# and the ranked list is cached per viewer for a short TTL.
+RANKED_FEED_CANDIDATES = int(os.getenv("RANKED_FEED_CANDIDATES", "500"))
+RANK_HALF_LIFE_HOURS = float(os.getenv("RANK_HALF_LIFE_HOURS", "6"))
+RANK_LIKE_WEIGHT = 1.0
+RANK_COMMENT_WEIGHT = 2.0
+RANK_REPOST_WEIGHT = 3.0
+RANK_AFFINITY_WEIGHT = 2.0
+
+ranked_feed_cache = TTLCache(
+    maxsize=int(os.getenv("RANKED_FEED_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("RANKED_FEED_TTL_SECONDS", "30")),
+)
 
-@api_router.get("/posts")
-async def get_posts(skip: int = 0, limit: int = 20):
-    """Get posts with pagination"""
+def score_posts(likes: np.ndarray, comments: np.ndarray, reposts: np.ndarray,
+                affinity: np.ndarray, age_hours: np.ndarray) -> np.ndarray:
+    """Time-decayed engagement score; every argument is a float array of the same length."""
+    engagement = (
+        RANK_LIKE_WEIGHT * np.log1p(likes)
+        + RANK_COMMENT_WEIGHT * np.log1p(comments)
+        + RANK_REPOST_WEIGHT * np.log1p(reposts)
+        + RANK_AFFINITY_WEIGHT * affinity
+    )
+    return (1.0 + engagement) * np.exp2(-age_hours / RANK_HALF_LIFE_HOURS)
+
+def rank_posts(posts: List[dict], followed_ids: Set[str], now: datetime) -> List[dict]:
+    """Order posts by score_posts, highest first (ties keep recency order)."""
+    n = len(posts)
+    if n == 0:
+        return []
+    likes = np.fromiter((p.get("likes_count") or 0 for p in posts), dtype=np.float64, count=n)
+    comments = np.fromiter((p.get("comments_count") or 0 for p in posts), dtype=np.float64, count=n)
+    reposts = np.fromiter((p.get("reposts_count") or 0 for p in posts), dtype=np.float64, count=n)
+    affinity = np.fromiter((p.get("author_id") in followed_ids for p in posts), dtype=np.float64, count=n)
+    # created_at is stored as UTC ISO-8601; the first 19 chars parse as datetime64[s]
+    created = np.array([(p.get("created_at") or "")[:19] or "NaT" for p in posts], dtype="datetime64[s]")
+    now_s = np.datetime64(now.astimezone(timezone.utc).replace(tzinfo=None), "s")
+    # NaT does not survive the float cast as NaN, so mask it explicitly:
+    # undated posts get an infinite age (score 0) and sink to the bottom
+    undated = np.isnat(created)
+    age_hours = np.full(n, np.inf)
+    age_hours[~undated] = np.clip((now_s - created[~undated]).astype(np.float64) / 3600.0, 0.0, None)
+
+    scores = score_posts(likes, comments, reposts, affinity, age_hours)
+    order = np.argsort(-scores, kind="stable")
+    return [posts[i] for i in order]
+
+async def _followed_among(viewer_id: Optional[str], author_ids: Set[str]) -> Set[str]:
+    if not viewer_id or not author_ids:
+        return set()
+    response = await db_execute(
+        supabase.table("user_follows")
+        .select("following_id")
+        .eq("follower_id", viewer_id)
+        .in_("following_id", list(author_ids))
+    )
+    return {row.get("following_id") for row in (response.data or [])}
+
+async def _attach_repost_counts(posts: List[dict]):
+    """Set reposts_count on each post. posts has no such column, so it is an
+    embedded count of post_relationships rows of type 'repost'."""
+    for post in posts:
+        post["reposts_count"] = 0
+    post_ids = [p["id"] for p in posts if p.get("id")]
+    if not post_ids:
+        return
     try:
-        response = supabase.table("posts").select("""
+        response = await db_execute(
+            supabase.table("posts")
+            .select("id, reposts:post_relationships!post_relationships_parent_post_id_fkey(count)")
+            .eq("reposts.relationship_type", "repost")
+            .in_("id", post_ids)
+        )
+    except Exception as e:
+        # Ranking still works on likes, comments and affinity
+        logger.warning(f"Repost counts unavailable for ranking: {e}")
+        return
+    counts = {row.get("id"): _embedded_count(row.get("reposts")) for row in (response.data or [])}
+    for post in posts:
+        post["reposts_count"] = counts.get(post.get("id"), 0)
+
+async def get_ranked_page(cache_key: tuple, viewer_id: Optional[str], skip: int, limit: int, load_candidates) -> List[dict]:
+    """Slice a cached ranked candidate list, ranking it first on a cache miss."""
+    ranked = ranked_feed_cache.get(cache_key)
+    if ranked is None:
+        candidates = await load_candidates()
+        await _attach_repost_counts(candidates)
+        followed = await _followed_among(viewer_id, {p.get("author_id") for p in candidates if p.get("author_id")})
+        ranked = rank_posts(candidates, followed, datetime.now(timezone.utc))
+        ranked_feed_cache.set(cache_key, ranked)
+    return [dict(p) for p in ranked[skip:skip + limit]]
+
+# ==================== LIKE COUNTERS ====================
+class LikeCounter:
+    """Absorbs like/unlike bursts in memory and folds them into posts.likes_count.
+
+    Deltas come only from rows a request actually inserted or deleted, so
+    applying them with one apply_post_like_deltas call per flush keeps the
+    column exact without touching the hot posts row on every like. Reads
+    overlay pending() on the stored count.
+
+    touch() marks a post's likes as changing in post_like_activity before the
+    like row is written, at most once per touch_interval per post, so the
+    periodic recount leaves posts alone while their deltas may be buffered.
+    """
+
+    def __init__(self, flush_interval: float, touch_interval: float = 20):
+        self.flush_interval = flush_interval
+        self.touch_interval = touch_interval
+        self.deltas: Dict[str, int] = {}
+        self._touched: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def touch(self, post_id: str):
+        now = time.monotonic()
+        if now - self._touched.get(post_id, -self.touch_interval) < self.touch_interval:
+            return
+        await db_execute(supabase_admin.rpc("touch_post_like_activity", {"post_ids": [post_id]}))
+        self._touched[post_id] = now
+
+    def add(self, post_id: str, delta: int):
+        value = self.deltas.get(post_id, 0) + delta
+        if value:
+            self.deltas[post_id] = value
+        else:
+            self.deltas.pop(post_id, None)
+
+    def pending(self, post_id: str) -> int:
+        return self.deltas.get(post_id, 0)
+
+    async def flush(self):
+        cutoff = time.monotonic() - self.touch_interval
+        self._touched = {post_id: at for post_id, at in self._touched.items() if at > cutoff}
+        deltas, self.deltas = self.deltas, {}
+        if not deltas:
+            return
+        try:
+            await db_execute(supabase_admin.rpc("apply_post_like_deltas", {"deltas": deltas}))
+        except Exception as e:
+            logger.error(f"Like counter flush failed for {len(deltas)} posts: {e}")
+            for post_id, delta in deltas.items():
+                self.add(post_id, delta)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+like_counter = LikeCounter(
+    flush_interval=float(os.getenv("LIKE_COUNTER_FLUSH_SECONDS", "2")),
+    touch_interval=float(os.getenv("LIKE_ACTIVITY_TOUCH_SECONDS", "20")),
+)
+
+# A periodic recount repairs likes_count drift (a crash with unflushed deltas,
+# writes that bypass the API). It only visits posts touched since it last ran
+# and idle for the settle window, which must outlast the touch interval plus
+# a flush so a delta still in some worker's LikeCounter is never counted twice.
+LIKE_COUNTS_RECONCILE_SECONDS = float(os.getenv("LIKE_COUNTS_RECONCILE_SECONDS", "3600"))
+LIKE_COUNTS_SETTLE_SECONDS = int(os.getenv("LIKE_COUNTS_SETTLE_SECONDS", "60"))
+
+async def reconcile_like_counts_periodically():
+    while True:
+        await asyncio.sleep(LIKE_COUNTS_RECONCILE_SECONDS)
+        try:
+            await like_counter.flush()
+            result = await db_execute(supabase_admin.rpc("reconcile_post_likes_counts", {
+                "settle_seconds": LIKE_COUNTS_SETTLE_SECONDS
+            }))
+            if result.data:
+                logger.warning(f"Repaired likes_count for {result.data} posts")
+        except Exception as e:
+            logger.warning(f"Like count reconciliation failed: {e}")
+
+# ==================== THREAD CACHE ====================
+class ThreadCache:
+    """Reply trees built from get_post_thread rows (post_id plus the reply
+    edge's parent_post_id), bounded by total cached nodes.
+
+    Threads are evicted least-recently-used first once max_nodes is exceeded.
+    New replies are appended to their parent's child list in place, and a
+    thread can be served for any node inside a cached tree. A thread is
+    refetched once it is older than ttl seconds, which picks up edits,
+    deletions and replies made through other workers.
+    """
+
+    def __init__(self, max_nodes: int, ttl: float):
+        self.max_nodes = max_nodes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._threads: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self._loaded_at: Dict[str, float] = {}
+        self._nodes: Dict[str, dict] = {}
+        self._children: Dict[str, List[str]] = {}
+        self._root_of: Dict[str, str] = {}
+
+    def _fresh_root(self, post_id: str) -> Optional[str]:
+        root_id = self._root_of.get(post_id)
+        if root_id is not None and time.monotonic() - self._loaded_at[root_id] > self.ttl:
+            self._drop(root_id)
+            root_id = None
+        return root_id
+
+    def contains(self, post_id: str) -> bool:
+        return self._fresh_root(post_id) is not None
+
+    def lookup(self, post_id: str) -> bool:
+        """Whether post_id can be served from the cache; counts a hit or miss."""
+        root_id = self._fresh_root(post_id)
+        if root_id is None:
+            self.misses += 1
+            return False
+        self._threads.move_to_end(root_id)
+        self.hits += 1
+        return True
+
+    def load(self, root_id: str, rows: List[dict]) -> bool:
+        """Cache a thread; returns False if the rows don't describe a tree rooted at root_id."""
+        by_id = {row["post_id"]: row for row in rows if row.get("post_id")}
+        if root_id not in by_id:
+            return False
+        if any(row.get("parent_post_id") not in by_id for post_id, row in by_id.items() if post_id != root_id):
+            return False
+        for post_id in by_id:
+            other_root = self._root_of.get(post_id)
+            if other_root is not None:
+                self._drop(other_root)
+        members: Set[str] = set()
+        for post_id, row in by_id.items():
+            self._nodes[post_id] = row
+            self._children[post_id] = []
+            self._root_of[post_id] = root_id
+            members.add(post_id)
+        for row in sorted(by_id.values(), key=lambda r: r.get("created_at") or ""):
+            if row["post_id"] != root_id:
+                self._children[row["parent_post_id"]].append(row["post_id"])
+        self._threads[root_id] = members
+        self._loaded_at[root_id] = time.monotonic()
+        self._evict()
+        return True
+
+    def append_reply(self, parent_id: str, row: dict):
+        """Attach a freshly created reply to a cached thread (no-op if the parent isn't cached)."""
+        root_id = self._root_of.get(parent_id)
+        post_id = row["post_id"]
+        if root_id is None or post_id in self._nodes:
+            return
+        self._nodes[post_id] = {**row, "thread_level": self._nodes[parent_id].get("thread_level", 0) + 1}
+        self._children[post_id] = []
+        self._children[parent_id].append(post_id)
+        self._root_of[post_id] = root_id
+        self._threads[root_id].add(post_id)
+        self._evict()
+
+    def subtree(self, post_id: str, depth: int, limit: int, cursor: int = 0) -> dict:
+        """Nested view of post_id: at most `limit` replies per level (top level
+        starting at `cursor`), `depth` levels deep. Levels with more replies
+        carry next_cursor; page them by requesting that reply's own thread.
+        """
+        def build(node_id: str, level: int, offset: int) -> dict:
+            node = dict(self._nodes[node_id])
+            children = self._children.get(node_id, [])
+            node["reply_count"] = len(children)
+            node["replies"] = []
+            node["next_cursor"] = None
+            if level < depth:
+                page = children[offset:offset + limit]
+                node["replies"] = [build(child_id, level + 1, 0) for child_id in page]
+                if offset + limit < len(children):
+                    node["next_cursor"] = offset + limit
+            return node
+        return build(post_id, 0, cursor)
+
+    def _drop(self, root_id: str):
+        self._loaded_at.pop(root_id, None)
+        for post_id in self._threads.pop(root_id, set()):
+            self._nodes.pop(post_id, None)
+            self._children.pop(post_id, None)
+            self._root_of.pop(post_id, None)
+
+    def _evict(self):
+        while len(self._nodes) > self.max_nodes and len(self._threads) > 1:
+            oldest_root = next(iter(self._threads))
+            self._drop(oldest_root)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "threads": len(self._threads),
+            "nodes": len(self._nodes),
+            "max_nodes": self.max_nodes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+thread_cache = ThreadCache(
+    max_nodes=int(os.getenv("THREAD_CACHE_MAX_NODES", "200000")),
+    ttl=float(os.getenv("THREAD_CACHE_TTL_SECONDS", "60")),
+)
+
+# ==================== HASHTAGS ====================
+HASHTAG_PATTERN = re.compile(r"#(\w+)")
+
+def extract_hashtags(content: Optional[str], hashtags: Optional[List[str]] = None) -> Set[str]:
+    """Normalized tags from an explicit hashtags array plus #tags in the text."""
+    tags = {str(t).lstrip("#").lower() for t in (hashtags or []) if t and str(t).lstrip("#")}
+    tags.update(t.lower() for t in HASHTAG_PATTERN.findall(content or ""))
+    return tags
+
+class HashtagIndex:
+    """Inverted index hashtag -> recent post ids, plus sliding-window tag counts.
+
+    Counts live in fixed-width time buckets; each window (e.g. 1h, 24h) keeps
+    a running total and subtracts buckets as they slide out, so trending reads
+    never rescan posts or buckets. Everything older than the retention window
+    is dropped.
+
+    Posts created through this worker are added directly; refresh() pulls the
+    ones created through other workers from the posts table. Post ids already
+    indexed are ignored, so the two paths never double count.
+    """
+
+    def __init__(self, retention: float, bucket_seconds: float, max_posts_per_tag: int,
+                 windows: Dict[str, float], refresh_overlap: float = 30):
+        self.retention = retention
+        self.bucket_seconds = bucket_seconds
+        self.max_posts_per_tag = max_posts_per_tag
+        self.windows = windows
+        self.refresh_overlap = refresh_overlap
+        self._posts: Dict[str, deque] = {}
+        self._buckets: deque = deque()
+        self._window_buckets: Dict[str, deque] = {name: deque() for name in windows}
+        self._totals: Dict[str, Dict[str, int]] = {name: {} for name in windows}
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._synced_ts: Optional[float] = None
+
+    def add(self, post_id: str, tags: Set[str], created_at: Optional[float] = None):
+        if not tags or post_id in self._seen:
+            return
+        now = time.time()
+        ts = created_at if created_at is not None else now
+        self._seen[post_id] = ts
+        self._advance(now)
+        for tag in tags:
+            posts = self._posts.setdefault(tag, deque(maxlen=self.max_posts_per_tag))
+            if posts and ts < posts[-1][0]:
+                # Late arrival: keep the deque ordered by time
+                items = sorted(list(posts) + [(ts, post_id)])
+                posts.clear()
+                posts.extend(items)
+            else:
+                posts.append((ts, post_id))
+        bucket_start = ts - (ts % self.bucket_seconds)
+        if bucket_start + self.bucket_seconds <= now - max(self.windows.values()):
+            return
+        counts = self._bucket_for(bucket_start, now)
+        for tag in tags:
+            counts[tag] = counts.get(tag, 0) + 1
+        for name, window in self.windows.items():
+            # Only windows still holding this bucket count it, so the totals
+            # always equal the sum of the buckets they will later subtract
+            if bucket_start + self.bucket_seconds > now - window:
+                totals = self._totals[name]
+                for tag in tags:
+                    totals[tag] = totals.get(tag, 0) + 1
+
+    def _bucket_for(self, bucket_start: float, now: float) -> Dict[str, int]:
+        for start, counts in reversed(self._buckets):
+            if start == bucket_start:
+                return counts
+            if start < bucket_start:
+                break
+        entry = (bucket_start, {})
+        self._insert_ordered(self._buckets, entry)
+        for name, window in self.windows.items():
+            if bucket_start + self.bucket_seconds > now - window:
+                self._insert_ordered(self._window_buckets[name], entry)
+        return entry[1]
+
+    @staticmethod
+    def _insert_ordered(buckets: deque, entry: tuple):
+        if not buckets or buckets[-1][0] < entry[0]:
+            buckets.append(entry)
+            return
+        ordered = sorted(list(buckets) + [entry], key=lambda b: b[0])
+        buckets.clear()
+        buckets.extend(ordered)
+
+    def _advance(self, now: float):
+        for name, window in self.windows.items():
+            window_buckets = self._window_buckets[name]
+            totals = self._totals[name]
+            # A bucket leaves the window once all of it is older than the window
+            while window_buckets and window_buckets[0][0] + self.bucket_seconds <= now - window:
+                _, counts = window_buckets.popleft()
+                for tag, n in counts.items():
+                    remaining = totals.get(tag, 0) - n
+                    if remaining > 0:
+                        totals[tag] = remaining
+                    else:
+                        totals.pop(tag, None)
+        horizon = now - max(self.retention, max(self.windows.values()))
+        while self._buckets and self._buckets[0][0] + self.bucket_seconds <= horizon:
+            self._buckets.popleft()
+
+    def prune(self, now: Optional[float] = None):
+        now = now if now is not None else time.time()
+        self._advance(now)
+        cutoff = now - self.retention
+        for tag in list(self._posts):
+            posts = self._posts[tag]
+            while posts and posts[0][0] < cutoff:
+                posts.popleft()
+            if not posts:
+                del self._posts[tag]
+        # Roughly insertion == time order; a late straggler just lives a bit longer
+        while self._seen and next(iter(self._seen.values())) < cutoff:
+            self._seen.popitem(last=False)
+
+    def posts_for(self, tag: str, limit: int, cursor: int = 0) -> List[str]:
+        """Newest-first post ids for a tag, skipping `cursor` entries."""
+        posts = self._posts.get(tag.lstrip("#").lower())
+        if not posts:
+            return []
+        return [post_id for _, post_id in itertools.islice(reversed(posts), cursor, cursor + limit)]
+
+    def trending(self, window: str, limit: int) -> List[dict]:
+        self._advance(time.time())
+        totals = self._totals[window]
+        top = heapq.nlargest(limit, totals.items(), key=lambda item: item[1])
+        return [{"tag": tag, "count": count} for tag, count in top]
+
+    async def refresh(self) -> int:
+        """Index tagged posts created since the last refresh (the whole
+        retention window on the first call). Re-reads refresh_overlap seconds
+        so rows committed late are not missed. Returns posts newly indexed."""
+        now = time.time()
+        since_ts = now - self.retention
+        if self._synced_ts is not None:
+            since_ts = max(since_ts, self._synced_ts - self.refresh_overlap)
+        since = datetime.fromtimestamp(since_ts, timezone.utc).isoformat()
+        loaded = 0
+        pages = scan_keyset(lambda: (
+            supabase_admin
+            .table("posts")
+            .select("id,content,hashtags,created_at")
+            .gte("created_at", since)
+        ))
+        async for rows in pages:
+            for row in rows:
+                created = _parse_timestamp(row.get("created_at"))
+                if not created:
+                    continue
+                self._synced_ts = max(self._synced_ts or 0.0, created.timestamp())
+                tags = extract_hashtags(row.get("content"), row.get("hashtags"))
+                if tags and row["id"] not in self._seen:
+                    self.add(row["id"], tags, created.timestamp())
+                    loaded += 1
+        if self._synced_ts is None:
+            self._synced_ts = now
+        return loaded
+
+hashtag_index = HashtagIndex(
+    retention=float(os.getenv("HASHTAG_RETENTION_HOURS", "72")) * 3600,
+    bucket_seconds=300,
+    max_posts_per_tag=int(os.getenv("HASHTAG_MAX_POSTS_PER_TAG", "1000")),
+    windows={"1h": 3600, "24h": 86400},
+)
+
+HASHTAG_REFRESH_SECONDS = float(os.getenv("HASHTAG_REFRESH_SECONDS", "15"))
+HASHTAG_PRUNE_SECONDS = 300
+
+async def maintain_hashtag_index():
+    """Pull posts created through other workers and drop expired entries."""
+    last_prune = time.monotonic()
+    while True:
+        await asyncio.sleep(HASHTAG_REFRESH_SECONDS)
+        try:
+            await hashtag_index.refresh()
+        except Exception as e:
+            logger.warning(f"Hashtag index refresh failed: {e}")
+        if time.monotonic() - last_prune >= HASHTAG_PRUNE_SECONDS:
+            hashtag_index.prune()
+            last_prune = time.monotonic()
+
+# ==================== POST ENDPOINTS ====================
+
+FEED_COMMENT_PREVIEW = int(os.getenv("FEED_COMMENT_PREVIEW", "3"))
+
+def _embedded_count(value: Any) -> int:
+    """Read a PostgREST embedded count (rel(count)), which comes back as [{"count": n}]."""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        return int(value.get("count") or 0)
+    return 0
+
+async def _fetch_feed_posts(skip: int, limit: int) -> List[dict]:
+    """Newest posts with like/comment counts and a short comment preview."""
+    response = await db_execute(
+        supabase.table("posts").select("""
             *,
             author:profiles!posts_author_id_fkey(*),
-            likes:likes(*),
-            comments:comments(*)
-        """).order("created_at", desc=True).range(skip, skip + limit - 1).execute()
+            comment_totals:comments(count),
+            comments_preview:comments(*)
+        """)
+        .order("created_at", desc=True)
+        .order("created_at", desc=True, foreign_table="comments_preview")
+        .limit(FEED_COMMENT_PREVIEW, foreign_table="comments_preview")
+        .range(skip, skip + limit - 1)
+    )
+    posts = response.data or []
+    for post in posts:
+        post["likes_count"] = (post.get("likes_count") or 0) + like_counter.pending(post["id"])
+        post["comments_count"] = _embedded_count(post.pop("comment_totals", None))
+    return posts
+
+async def _mark_viewer_likes(posts: List[dict], viewer_id: Optional[str]):
+    for post in posts:
+        post["viewer_has_liked"] = False
+    if not viewer_id or not posts:
+        return
+    liked = await db_execute(
+        supabase.table("likes")
+        .select("post_id")
+        .eq("user_id", viewer_id)
+        .in_("post_id", [p["id"] for p in posts])
+    )
+    liked_ids = {row.get("post_id") for row in (liked.data or [])}
+    for post in posts:
+        post["viewer_has_liked"] = post["id"] in liked_ids
+
+@api_router.get("/posts")
+async def get_posts(skip: int = 0, limit: int = 20, ranked: bool = False, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Get posts with pagination. Engagement comes back as counts plus a short comment preview.
+
+    ranked=true orders a window of recent posts by time-decayed engagement instead of recency.
+    """
+    try:
+        viewer_id = current_user["id"] if current_user else None
+        if ranked:
+            posts = await get_ranked_page(
+                ("posts", viewer_id), viewer_id, skip, limit,
+                lambda: _fetch_feed_posts(0, RANKED_FEED_CANDIDATES)
+            )
+        else:
+            posts = await _fetch_feed_posts(skip, limit)
+        await _mark_viewer_likes(posts, viewer_id)
         
-        return {"posts": response.data, "has_more": len(response.data) == limit}
+        return {"posts": posts, "has_more": len(posts) == limit}
     except Exception as e:
         # Graceful fallback if posts table or relations don't exist yet
         err_text = str(e)
@@ -1367,6 +3286,72 @@ async def get_posts(skip: int = 0, limit: int = 20):
         logger.error(f"Error fetching posts: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch posts")
 
+@api_router.get("/posts/{post_id}/likes")
+async def get_post_likes(post_id: str, skip: int = 0, limit: int = 50):
+    """Paginated likes for a post (newest first)"""
+    try:
+        response = await db_execute(
+            supabase
+            .table("likes")
+            .select("*")
+            .eq("post_id", post_id)
+            .order("created_at", desc=True)
+            .range(skip, skip + limit - 1)
+        )
+        likes = response.data or []
+        return {"likes": likes, "has_more": len(likes) == limit}
+    except Exception as e:
+        logger.error(f"Error fetching post likes: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch post likes")
+
+@api_router.get("/posts/{post_id}/comments")
+async def get_post_comments(post_id: str, skip: int = 0, limit: int = 50):
+    """Paginated comments for a post (newest first)"""
+    try:
+        response = await db_execute(
+            supabase
+            .table("comments")
+            .select("*")
+            .eq("post_id", post_id)
+            .order("created_at", desc=True)
+            .range(skip, skip + limit - 1)
+        )
+        comments = response.data or []
+        return {"comments": comments, "has_more": len(comments) == limit}
+    except Exception as e:
+        logger.error(f"Error fetching post comments: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch post comments")
+
+# ==================== HOME TIMELINES ====================
+# Fan-out-on-write: new posts, reposts and quotes are pushed into each
+# follower's home_timeline rows (see supabase_battle_module.sql). Authors with
+# more than TIMELINE_FANOUT_LIMIT followers are switched to fan-out-on-read and
+# merged in by get_home_timeline at read time.
+TIMELINE_FANOUT_LIMIT = int(os.getenv("TIMELINE_FANOUT_LIMIT", "10000"))
+TIMELINE_MAX_ENTRIES = int(os.getenv("TIMELINE_MAX_ENTRIES", "800"))
+TIMELINE_TRIM_INTERVAL_SECONDS = float(os.getenv("TIMELINE_TRIM_INTERVAL_SECONDS", "3600"))
+
+async def fanout_to_timelines(post_id: Optional[str]):
+    """Push a post into its author's followers' home timelines (best-effort)."""
+    if not post_id:
+        return
+    try:
+        await db_execute(supabase_admin.rpc("fanout_post_to_timelines", {
+            "post_uuid": post_id,
+            "fanout_limit": TIMELINE_FANOUT_LIMIT
+        }))
+    except Exception as e:
+        logger.warning(f"Timeline fan-out failed for post {post_id}: {e}")
+
+async def trim_home_timelines_periodically():
+    """Keep every inbox bounded to the newest TIMELINE_MAX_ENTRIES rows."""
+    while True:
+        await asyncio.sleep(TIMELINE_TRIM_INTERVAL_SECONDS)
+        try:
+            await db_execute(supabase_admin.rpc("trim_home_timelines", {"keep_count": TIMELINE_MAX_ENTRIES}))
+        except Exception as e:
+            logger.warning(f"Home timeline trim failed: {e}")
+
 @api_router.post("/posts")
 async def create_post(post_data: dict, current_user: dict = Depends(get_current_user)):
     """Create a new post"""
@@ -1374,32 +3359,67 @@ async def create_post(post_data: dict, current_user: dict = Depends(get_current_
         post_data["author_id"] = current_user["id"]
         post_data["created_at"] = datetime.now(timezone.utc).isoformat()
         
-        response = supabase.table("posts").insert(post_data).execute()
-        return {"post": response.data[0]}
+        response = await db_execute(supabase.table("posts").insert(post_data))
+        post = response.data[0]
+        await fanout_to_timelines(post.get("id"))
+        hashtag_index.add(post["id"], extract_hashtags(post.get("content"), post.get("hashtags")))
+        return {"post": post}
     except Exception as e:
         logger.error(f"Error creating post: {e}")
         raise HTTPException(status_code=500, detail="Failed to create post")
 
+async def _add_like(post_id: str, user_id: str) -> bool:
+    """Insert a like; returns False if it already existed."""
+    await like_counter.touch(post_id)
+    response = await db_execute(
+        supabase.table("likes").upsert({
+            "post_id": post_id,
+            "user_id": user_id,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }, on_conflict="post_id,user_id", ignore_duplicates=True)
+    )
+    added = bool(response.data)
+    if added:
+        like_counter.add(post_id, 1)
+    return added
+
+async def _remove_like(post_id: str, user_id: str) -> bool:
+    """Delete a like; returns False if there was none."""
+    await like_counter.touch(post_id)
+    response = await db_execute(supabase.table("likes").delete().eq("post_id", post_id).eq("user_id", user_id))
+    removed = bool(response.data)
+    if removed:
+        like_counter.add(post_id, -1)
+    return removed
+
+@api_router.put("/posts/{post_id}/like")
+async def put_like(post_id: str, current_user: dict = Depends(get_current_user)):
+    """Like a post (idempotent)"""
+    try:
+        changed = await _add_like(post_id, current_user["id"])
+        return {"liked": True, "changed": changed}
+    except Exception as e:
+        logger.error(f"Error liking post: {e}")
+        raise HTTPException(status_code=500, detail="Failed to like post")
+
+@api_router.delete("/posts/{post_id}/like")
+async def delete_like(post_id: str, current_user: dict = Depends(get_current_user)):
+    """Unlike a post (idempotent)"""
+    try:
+        changed = await _remove_like(post_id, current_user["id"])
+        return {"liked": False, "changed": changed}
+    except Exception as e:
+        logger.error(f"Error unliking post: {e}")
+        raise HTTPException(status_code=500, detail="Failed to unlike post")
+
 @api_router.post("/posts/{post_id}/like")
 async def like_post(post_id: str, current_user: dict = Depends(get_current_user)):
-    """Like or unlike a post"""
+    """Like or unlike a post (toggle; prefer PUT/DELETE for retry-safe clients)"""
     try:
-        # Check if already liked
-        existing_like = supabase.table("likes").select("*").eq("post_id", post_id).eq("user_id", current_user["id"]).execute()
-        
-        if existing_like.data:
-            # Unlike
-            supabase.table("likes").delete().eq("post_id", post_id).eq("user_id", current_user["id"]).execute()
+        if await _remove_like(post_id, current_user["id"]):
             return {"liked": False}
-        else:
-            # Like
-            like_data = {
-                "post_id": post_id,
-                "user_id": current_user["id"],
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            supabase.table("likes").insert(like_data).execute()
-            return {"liked": True}
+        await _add_like(post_id, current_user["id"])
+        return {"liked": True}
     except Exception as e:
         logger.error(f"Error liking post: {e}")
         raise HTTPException(status_code=500, detail="Failed to like post")
@@ -1409,22 +3429,35 @@ async def reply_to_post(post_id: str, reply_data: dict, current_user: dict = Dep
     """Reply to a post"""
     try:
         # Use the database function to create a reply
-        result = supabase.rpc('create_post_reply', {
+        result = await db_execute(supabase.rpc('create_post_reply', {
             'parent_post_id': post_id,
             'reply_content': reply_data['content'],
             'reply_media_urls': reply_data.get('media_urls', []),
             'reply_hashtags': reply_data.get('hashtags', [])
-        }).execute()
+        }))
         # Notify post author (best-effort)
         try:
-            post = supabase.table("posts").select("author_id").eq("id", post_id).single().execute()
+            post = await db_execute(supabase.table("posts").select("author_id").eq("id", post_id).single())
             author_id = post.data.get("author_id") if post.data else None
             if author_id and author_id != current_user["id"]:
                 sender = tag_from_user(current_user)
                 snippet = (reply_data.get('content') or '')[:60]
-                notify_user(author_id, f"{sender} commented on your post:", snippet, ntype="comment", reference_id=post_id)
+                await notify_user(author_id, f"{sender} commented on your post:", snippet, ntype="comment", reference_id=post_id)
         except Exception:
             pass
+        if result.data:
+            thread_cache.append_reply(post_id, {
+                "post_id": result.data,
+                "parent_post_id": post_id,
+                "author_id": current_user["id"],
+                "content": reply_data['content'],
+                "media_urls": reply_data.get('media_urls', []),
+                "hashtags": reply_data.get('hashtags', []),
+                "likes_count": 0,
+                "comments_count": 0,
+                "created_at": datetime.now(timezone.utc).isoformat()
+            })
+            hashtag_index.add(result.data, extract_hashtags(reply_data['content'], reply_data.get('hashtags')))
         return {"reply_id": result.data}
     except Exception as e:
         logger.error(f"Error replying to post: {e}")
@@ -1435,22 +3468,25 @@ async def quote_post(post_id: str, quote_data: dict, current_user: dict = Depend
     """Quote a post"""
     try:
         # Use the database function to create a quote
-        result = supabase.rpc('create_post_quote', {
+        result = await db_execute(supabase.rpc('create_post_quote', {
             'quoted_post_id': post_id,
             'quote_content': quote_data['content'],
             'quote_media_urls': quote_data.get('media_urls', []),
             'quote_hashtags': quote_data.get('hashtags', [])
-        }).execute()
+        }))
         # Notify post author (best-effort)
         try:
-            post = supabase.table("posts").select("author_id").eq("id", post_id).single().execute()
+            post = await db_execute(supabase.table("posts").select("author_id").eq("id", post_id).single())
             author_id = post.data.get("author_id") if post.data else None
             if author_id and author_id != current_user["id"]:
                 sender = tag_from_user(current_user)
                 snippet = (quote_data.get('content') or '')[:60]
-                notify_user(author_id, f"{sender} quoted your post:", snippet, ntype="comment", reference_id=post_id)
+                await notify_user(author_id, f"{sender} quoted your post:", snippet, ntype="comment", reference_id=post_id)
         except Exception:
             pass
+        await fanout_to_timelines(result.data)
+        if result.data:
+            hashtag_index.add(result.data, extract_hashtags(quote_data['content'], quote_data.get('hashtags')))
         return {"quote_id": result.data}
     except Exception as e:
         logger.error(f"Error quoting post: {e}")
@@ -1461,29 +3497,40 @@ async def repost(post_id: str, current_user: dict = Depends(get_current_user)):
     """Repost a post"""
     try:
         # Use the database function to create a repost
-        result = supabase.rpc('create_post_repost', {
+        result = await db_execute(supabase.rpc('create_post_repost', {
             'original_post_id': post_id
-        }).execute()
+        }))
         # Notify post author (best-effort)
         try:
-            post = supabase.table("posts").select("author_id").eq("id", post_id).single().execute()
+            post = await db_execute(supabase.table("posts").select("author_id").eq("id", post_id).single())
             author_id = post.data.get("author_id") if post.data else None
             if author_id and author_id != current_user["id"]:
                 sender = tag_from_user(current_user)
-                notify_user(author_id, f"{sender} reposted your post.", ntype="engagement", reference_id=post_id)
+                await notify_user(author_id, f"{sender} reposted your post.", ntype="engagement", reference_id=post_id)
         except Exception:
             pass
+        await fanout_to_timelines(result.data)
         return {"repost_id": result.data}
     except Exception as e:
         logger.error(f"Error reposting: {e}")
         raise HTTPException(status_code=500, detail="Failed to repost")
 
 @api_router.get("/posts/{post_id}/thread")
-async def get_post_thread(post_id: str):
-    """Get the thread of replies for a post"""
+async def get_post_thread(post_id: str, depth: int = 3, limit: int = 20, cursor: int = 0):
+    """Get the thread of replies for a post as a nested tree.
+
+    depth bounds how many reply levels are returned, limit caps replies per
+    level and cursor pages through the post's direct replies.
+    """
     try:
-        result = supabase.rpc('get_post_thread', {'post_uuid': post_id}).execute()
-        return {"thread": result.data}
+        depth = max(0, min(depth, 10))
+        limit = max(1, min(limit, 100))
+        if not thread_cache.lookup(post_id):
+            result = await db_execute(supabase.rpc('get_post_thread', {'post_uuid': post_id}))
+            if not thread_cache.load(post_id, result.data or []):
+                # Rows we can't shape into a tree: hand them back as-is
+                return {"thread": result.data}
+        return {"thread": thread_cache.subtree(post_id, depth, limit, max(cursor, 0))}
     except Exception as e:
         logger.error(f"Error fetching post thread: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch post thread")
@@ -1492,7 +3539,7 @@ async def get_post_thread(post_id: str):
 async def get_post_quotes(post_id: str):
     """Get quotes of a post"""
     try:
-        result = supabase.rpc('get_post_quotes', {'post_uuid': post_id}).execute()
+        result = await db_execute(supabase.rpc('get_post_quotes', {'post_uuid': post_id}))
         return {"quotes": result.data}
     except Exception as e:
         logger.error(f"Error fetching post quotes: {e}")
@@ -1502,21 +3549,57 @@ async def get_post_quotes(post_id: str):
 async def get_post_mentions(post_id: str):
     """Get mentions of a post"""
     try:
-        result = supabase.rpc('get_post_mentions', {'post_uuid': post_id}).execute()
+        result = await db_execute(supabase.rpc('get_post_mentions', {'post_uuid': post_id}))
         return {"mentions": result.data}
     except Exception as e:
         logger.error(f"Error fetching post mentions: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch post mentions")
 
+def _overlay_pending_likes(posts: List[dict]) -> List[dict]:
+    for post in posts:
+        post["likes_count"] = (post.get("likes_count") or 0) + like_counter.pending(post["id"])
+    return posts
+
 @api_router.get("/posts/feed/{user_id}")
-async def get_user_feed(user_id: str, skip: int = 0, limit: int = 20):
-    """Get enhanced post feed for a user"""
+async def get_user_feed(user_id: str, skip: int = 0, limit: int = 20, ranked: bool = False,
+                        current_user: dict = Depends(get_current_user)):
+    """Get the home timeline for a user: a slice of their materialized inbox.
+
+    Only the owner can read it. Rows carry the author profile, engagement
+    counts and is_liked, like get_enhanced_post_feed. ranked=true reorders a
+    window of the inbox by time-decayed engagement.
+    """
+    if user_id != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Not authorized to view this feed")
+    if ranked:
+        async def load_candidates():
+            result = await db_execute(supabase_admin.rpc('get_home_timeline', {
+                'viewer_uuid': user_id,
+                'limit_count': RANKED_FEED_CANDIDATES,
+                'offset_count': 0
+            }))
+            return result.data or []
+        try:
+            posts = _overlay_pending_likes(await get_ranked_page(("home", user_id), user_id, skip, limit, load_candidates))
+            return {"posts": posts, "has_more": len(posts) == limit}
+        except Exception as e:
+            logger.warning(f"Ranked home feed unavailable, falling back to recency: {e}")
     try:
-        result = supabase.rpc('get_enhanced_post_feed', {
+        result = await db_execute(supabase_admin.rpc('get_home_timeline', {
+            'viewer_uuid': user_id,
+            'limit_count': limit,
+            'offset_count': skip
+        }))
+        posts = _overlay_pending_likes(result.data or [])
+        return {"posts": posts, "has_more": len(posts) == limit}
+    except Exception as e:
+        logger.warning(f"get_home_timeline unavailable, computing feed on read: {e}")
+    try:
+        result = await db_execute(supabase.rpc('get_enhanced_post_feed', {
             'user_id': user_id,
             'limit_count': limit,
             'offset_count': skip
-        }).execute()
+        }))
         return {"posts": result.data, "has_more": len(result.data) == limit}
     except Exception as e:
         # Function may not exist yet in schema; return empty feed gracefully
@@ -1527,31 +3610,646 @@ async def get_user_feed(user_id: str, skip: int = 0, limit: int = 20):
         logger.error(f"Error fetching user feed: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch user feed")
 
+@api_router.get("/hashtags/trending")
+async def get_trending_hashtags(window: str = "1h", limit: int = 10):
+    """Most used hashtags over a sliding window (1h or 24h)"""
+    if window not in hashtag_index.windows:
+        raise HTTPException(status_code=400, detail=f"window must be one of: {', '.join(hashtag_index.windows)}")
+    limit = max(1, min(limit, 100))
+    return {"window": window, "hashtags": hashtag_index.trending(window, limit)}
+
+@api_router.get("/hashtags/{tag}/posts")
+async def get_hashtag_posts(tag: str, limit: int = 20, cursor: int = 0, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Recent posts carrying a hashtag, newest first, served from the in-memory index"""
+    try:
+        limit = max(1, min(limit, 100))
+        cursor = max(cursor, 0)
+        post_ids = hashtag_index.posts_for(tag, limit, cursor)
+        if not post_ids:
+            return {"posts": [], "next_cursor": None}
+        response = await db_execute(
+            supabase.table("posts")
+            .select("*, author:profiles!posts_author_id_fkey(*)")
+            .in_("id", post_ids)
+        )
+        by_id = {row["id"]: row for row in (response.data or [])}
+        # Deleted posts simply drop out; keep the index's ordering
+        posts = [by_id[post_id] for post_id in post_ids if post_id in by_id]
+        for post in posts:
+            post["likes_count"] = (post.get("likes_count") or 0) + like_counter.pending(post["id"])
+        await _mark_viewer_likes(posts, current_user["id"] if current_user else None)
+        next_cursor = cursor + len(post_ids) if len(post_ids) == limit else None
+        return {"posts": posts, "next_cursor": next_cursor}
+    except Exception as e:
+        logger.error(f"Error fetching hashtag posts: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch hashtag posts")
+
+# ==================== FOLLOW COUNTERS ====================
+# follow_counts rows are maintained by toggle_follow (see
+# supabase_battle_module.sql) and cached here write-through; a periodic
+# reconcile_follow_counts call repairs drift, skipping counters a follow
+# updated within the settle window.
+FOLLOW_COUNTS_RECONCILE_SECONDS = float(os.getenv("FOLLOW_COUNTS_RECONCILE_SECONDS", "3600"))
+FOLLOW_COUNTS_SETTLE_SECONDS = int(os.getenv("FOLLOW_COUNTS_SETTLE_SECONDS", "60"))
+
+follow_counts_cache = TTLCache(
+    maxsize=int(os.getenv("FOLLOW_COUNTS_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("FOLLOW_COUNTS_TTL_SECONDS", "30")),
+)
+
+async def load_follow_counts(user_id: str) -> dict:
+    cached = follow_counts_cache.get(user_id)
+    if cached is not None:
+        return dict(cached)
+    response = await db_execute(
+        supabase.table("follow_counts")
+        .select("followers_count,following_count")
+        .eq("user_id", user_id)
+        .limit(1)
+    )
+    row = response.data[0] if response.data else {}
+    counts = {"followers": row.get("followers_count") or 0, "following": row.get("following_count") or 0}
+    follow_counts_cache.set(user_id, counts)
+    return dict(counts)
+
+async def reconcile_follow_counts_periodically():
+    while True:
+        await asyncio.sleep(FOLLOW_COUNTS_RECONCILE_SECONDS)
+        try:
+            result = await db_execute(supabase_admin.rpc("reconcile_follow_counts", {
+                "settle_seconds": FOLLOW_COUNTS_SETTLE_SECONDS
+            }))
+            if result.data:
+                logger.warning(f"Repaired follow counts for {result.data} users")
+                follow_counts_cache.invalidate_where(lambda _: True)
+        except Exception as e:
+            logger.warning(f"Follow count reconciliation failed: {e}")
+
+# ==================== FOLLOW GRAPH ====================
+FOLLOW_GRAPH_REBUILD_SECONDS = float(os.getenv("FOLLOW_GRAPH_REBUILD_SECONDS", "900"))
+FOLLOW_GRAPH_OVERLAY_MAX = int(os.getenv("FOLLOW_GRAPH_OVERLAY_MAX", "50000"))
+FOF_MAX_SOURCES = 500
+
+class FollowGraph:
+    """Compact in-memory follow graph.
+
+    User ids are interned to dense int32s. Edges live in two CSR arrays (out:
+    who a user follows, in: who follows them) with every row sorted, so
+    membership is a binary search and mutuals or friends-of-friends are NumPy
+    set operations over rows. follow_user's changes go into small per-user
+    overlays. A periodic rebuild from user_follows folds them in and picks up
+    writes made through other workers; it runs early once the overlays pass
+    FOLLOW_GRAPH_OVERLAY_MAX edges.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._out_ptr = np.zeros(1, dtype=np.int64)
+        self._out = np.zeros(0, dtype=np.int32)
+        self._in_ptr = np.zeros(1, dtype=np.int64)
+        self._in = np.zeros(0, dtype=np.int32)
+        self._reset_overlay()
+        self._log: Optional[List[tuple]] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _reset_overlay(self):
+        # direction -> node -> neighbours added / removed since the CSR build
+        self._added: Dict[str, Dict[int, Set[int]]] = {"out": {}, "in": {}}
+        self._removed: Dict[str, Dict[int, Set[int]]] = {"out": {}, "in": {}}
+        self._overlay_edges = 0
+
+    @property
+    def edge_count(self) -> int:
+        return len(self._out) + self._overlay_edges
+
+    def _intern(self, user_id: str) -> int:
+        node = self._index.get(user_id)
+        if node is None:
+            node = self._index[user_id] = len(self._ids)
+            self._ids.append(user_id)
+        return node
+
+    @staticmethod
+    def _csr(src: np.ndarray, dst: np.ndarray, n: int) -> tuple:
+        order = np.lexsort((dst, src))
+        ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=ptr[1:])
+        return ptr, dst[order]
+
+    def _row(self, direction: str, node: int) -> np.ndarray:
+        ptr, indices = (self._out_ptr, self._out) if direction == "out" else (self._in_ptr, self._in)
+        base = indices[ptr[node]:ptr[node + 1]] if node + 1 < len(ptr) else indices[:0]
+        added = self._added[direction].get(node)
+        removed = self._removed[direction].get(node)
+        if removed:
+            base = np.setdiff1d(base, np.fromiter(removed, dtype=np.int32, count=len(removed)), assume_unique=True)
+        if added:
+            base = np.union1d(base, np.fromiter(added, dtype=np.int32, count=len(added)))
+        return base
+
+    @staticmethod
+    def _intersect(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        small, large = (a, b) if len(a) <= len(b) else (b, a)
+        if len(large) > 16 * len(small):
+            # Lopsided rows (e.g. a celebrity's followers): binary-search the small one
+            pos = np.searchsorted(large, small)
+            hit = pos < len(large)
+            hit[hit] = large[pos[hit]] == small[hit]
+            return small[hit]
+        return np.intersect1d(small, large, assume_unique=True)
+
+    def _apply(self, direction: str, node: int, other: int, present: bool):
+        added = self._added[direction].setdefault(node, set())
+        removed = self._removed[direction].setdefault(node, set())
+        if present:
+            removed.discard(other)
+            added.add(other)
+        else:
+            added.discard(other)
+            removed.add(other)
+
+    def set_edge(self, follower_id: str, following_id: str, following: bool):
+        """Record a follow (True) or unfollow (False) already committed to user_follows."""
+        a = self._intern(follower_id)
+        b = self._intern(following_id)
+        self._apply("out", a, b, following)
+        self._apply("in", b, a, following)
+        self._overlay_edges += 1
+        if self._log is not None:
+            self._log.append((follower_id, following_id, following))
+        if self._overlay_edges > FOLLOW_GRAPH_OVERLAY_MAX:
+            self._wakeup.set()
+
+    def follows(self, follower_id: str, following_id: str) -> bool:
+        a = self._index.get(follower_id)
+        b = self._index.get(following_id)
+        if a is None or b is None:
+            return False
+        if b in self._added["out"].get(a, ()):
+            return True
+        if b in self._removed["out"].get(a, ()):
+            return False
+        row = self._row("out", a)
+        i = np.searchsorted(row, b)
+        return bool(i < len(row) and row[i] == b)
+
+    def mutuals(self, user_id: str, limit: Optional[int] = None) -> List[str]:
+        node = self._index.get(user_id)
+        if node is None:
+            return []
+        both = self._intersect(self._row("out", node), self._row("in", node))
+        return [self._ids[i] for i in both[:limit]]
+
+    def friends_of_friends(self, user_id: str, limit: int) -> List[tuple]:
+        """[(user_id, mutual_connections)] for users followed by the people user_id follows."""
+        node = self._index.get(user_id)
+        if node is None:
+            return []
+        following = self._row("out", node)
+        if len(following) == 0:
+            return []
+        sources = following
+        if len(sources) > FOF_MAX_SOURCES:
+            # Seeded by the user so repeated requests (and paging) see the same sample
+            seed = int.from_bytes(hashlib.blake2b(user_id.encode(), digest_size=8).digest(), "big")
+            sources = np.random.default_rng(seed).choice(sources, FOF_MAX_SOURCES, replace=False)
+        reached = np.concatenate([self._row("out", int(v)) for v in sources])
+        candidates, counts = np.unique(reached, return_counts=True)
+        keep = ~np.isin(candidates, following, assume_unique=True) & (candidates != node)
+        candidates, counts = candidates[keep], counts[keep]
+        if len(candidates) > limit:
+            top = np.argpartition(-counts, limit - 1)[:limit]
+            candidates, counts = candidates[top], counts[top]
+        order = np.argsort(-counts, kind="stable")
+        return [(self._ids[candidates[i]], int(counts[i])) for i in order]
+
+    def _swap(self, ids: List[str], index: Dict[str, int], out_csr: tuple, in_csr: tuple):
+        log = self._log or []
+        self._ids, self._index = ids, index
+        self._out_ptr, self._out = out_csr
+        self._in_ptr, self._in = in_csr
+        self._reset_overlay()
+        self._log = None
+        # Replay follow_user changes that landed while the edges were loading
+        for follower_id, following_id, following in log:
+            self.set_edge(follower_id, following_id, following)
+        self.ready = True
+
+    async def rebuild(self):
+        self._log = []
+        try:
+            ids: List[str] = []
+            index: Dict[str, int] = {}
+            src = array("i")
+            dst = array("i")
+
+            def intern(user_id: str) -> int:
+                node = index.get(user_id)
+                if node is None:
+                    node = index[user_id] = len(ids)
+                    ids.append(user_id)
+                return node
+
+            page = 1000
+            last_id = None
+            while True:
+                query = supabase_admin.table("user_follows").select("id,follower_id,following_id")
+                if last_id:
+                    query = query.gt("id", last_id)
+                response = await db_execute(query.order("id").limit(page))
+                rows = response.data or []
+                for row in rows:
+                    if row.get("follower_id") and row.get("following_id"):
+                        src.append(intern(row["follower_id"]))
+                        dst.append(intern(row["following_id"]))
+                if len(rows) < page:
+                    break
+                last_id = rows[-1]["id"]
+
+            src_np = np.frombuffer(src, dtype=np.int32)
+            dst_np = np.frombuffer(dst, dtype=np.int32)
+            out_csr = await run_blocking(self._csr, src_np, dst_np, len(ids))
+            in_csr = await run_blocking(self._csr, dst_np, src_np, len(ids))
+        except BaseException:
+            self._log = None
+            raise
+        self._swap(ids, index, out_csr, in_csr)
+        logger.info(f"Follow graph loaded {len(ids)} users, {len(src)} edges")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.warning(f"Follow graph rebuild failed: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), FOLLOW_GRAPH_REBUILD_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+follow_graph = FollowGraph()
+
+# ==================== USER SEARCH INDEX ====================
+# Substring search and autocomplete over profiles without leading-wildcard
+# ilike scans. Each worker rebuilds its index at startup and then follows
+# profiles.updated_at, so edits made through other workers show up within
+# USER_SEARCH_REFRESH_SECONDS; edits through this worker apply immediately.
+USER_SEARCH_REFRESH_SECONDS = float(os.getenv("USER_SEARCH_REFRESH_SECONDS", "30"))
+USER_SEARCH_SCAN_BUDGET = 2048
+USER_SEARCH_OVERLAY_MAX = 20000
+
+class UserSearchIndex:
+    """In-memory username/full_name index.
+
+    Users are interned to dense slots in created_at order. Substring search
+    takes the trigram posting arrays for the query, intersects the two
+    shortest when they are long, and verifies candidates newest-first: the
+    same matches and order as the ilike query it replaces. Autocomplete
+    bisects a sorted list of lowercase username and name-word keys, with
+    keys added since the last build kept in a small sorted overlay.
+
+    Edits keep the user's slot. New trigrams are appended to their postings
+    (which are re-sorted lazily), and keys or trigrams the user no longer has
+    are left in place and filtered out on read.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._reset()
+        self._synced_at: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _reset(self):
+        # slot -> (id, username, full_name, avatar_url, haystack)
+        self._slots: List[tuple] = []
+        self._slot_by_id: Dict[str, int] = {}
+        self._postings: Dict[str, array] = {}
+        self._unsorted: Set[str] = set()
+        self._keys: List[str] = []
+        self._key_slots: List[int] = []
+        self._overlay: List[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @staticmethod
+    def _trigrams(username: str, full_name: str) -> Set[str]:
+        grams = set()
+        for text in (username.lower(), full_name.lower()):
+            grams.update(text[i:i + 3] for i in range(len(text) - 2))
+        return grams
+
+    @staticmethod
+    def _prefix_keys(username: str, full_name: str) -> Set[str]:
+        keys = set(full_name.lower().split())
+        if username:
+            keys.add(username.lower())
+        return keys
+
+    def _entry(self, profile: dict) -> tuple:
+        username = profile.get("username") or ""
+        full_name = profile.get("full_name") or ""
+        return (profile["id"], username, full_name, profile.get("avatar_url"),
+                f"{username.lower()}\n{full_name.lower()}")
+
+    def _post(self, gram: str, slot: int):
+        postings = self._postings.get(gram)
+        if postings is None:
+            postings = self._postings[gram] = array("I")
+        elif postings[-1] >= slot:
+            self._unsorted.add(gram)
+        postings.append(slot)
+
+    def upsert(self, profile: dict):
+        if not profile.get("id"):
+            return
+        entry = self._entry(profile)
+        slot = self._slot_by_id.get(entry[0])
+        if slot is None:
+            slot = len(self._slots)
+            self._slots.append(entry)
+            self._slot_by_id[entry[0]] = slot
+            old_grams: Set[str] = set()
+            old_keys: Set[str] = set()
+        else:
+            _, old_username, old_full_name, _, _ = self._slots[slot]
+            self._slots[slot] = entry
+            old_grams = self._trigrams(old_username, old_full_name)
+            old_keys = self._prefix_keys(old_username, old_full_name)
+        for gram in self._trigrams(entry[1], entry[2]) - old_grams:
+            self._post(gram, slot)
+        for key in self._prefix_keys(entry[1], entry[2]) - old_keys:
+            bisect.insort(self._overlay, (key, slot))
+        if len(self._overlay) > USER_SEARCH_OVERLAY_MAX:
+            self._compact_keys()
+
+    def _key_valid(self, key: str, slot: int) -> bool:
+        _, username, full_name, _, _ = self._slots[slot]
+        return key in self._prefix_keys(username, full_name)
+
+    def _compact_keys(self):
+        pairs = [pair for pair in zip(self._keys, self._key_slots) if self._key_valid(*pair)]
+        pairs.extend(pair for pair in self._overlay if self._key_valid(*pair))
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._key_slots = [slot for _, slot in pairs]
+        self._overlay = []
+
+    def load(self, profiles: List[dict]):
+        """Replace the whole index (bulk build: keys are sorted once at the end)."""
+        self._reset()
+        pairs = []
+        for profile in profiles:
+            if not profile.get("id") or profile["id"] in self._slot_by_id:
+                continue
+            entry = self._entry(profile)
+            slot = len(self._slots)
+            self._slots.append(entry)
+            self._slot_by_id[entry[0]] = slot
+            for gram in self._trigrams(entry[1], entry[2]):
+                self._post(gram, slot)
+            pairs.extend((key, slot) for key in self._prefix_keys(entry[1], entry[2]))
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._key_slots = [slot for _, slot in pairs]
+        self.ready = True
+
+    def _postings_for(self, gram: str) -> Optional[array]:
+        postings = self._postings.get(gram)
+        if postings is not None and gram in self._unsorted:
+            postings = self._postings[gram] = array("I", np.unique(np.frombuffer(postings, dtype=np.uint32)).tobytes())
+            self._unsorted.discard(gram)
+        return postings
+
+    def search(self, query: str, limit: int) -> Optional[List[str]]:
+        """Ids of users whose username or full_name contains query, newest first.
+
+        Returns None for queries too short to have a trigram.
+        """
+        q = query.strip().lower()
+        if len(q) < 3:
+            return None
+        postings = []
+        for gram in {q[i:i + 3] for i in range(len(q) - 2)}:
+            found = self._postings_for(gram)
+            if found is None:
+                return []
+            postings.append(found)
+        postings.sort(key=len)
+        ids: List[str] = []
+        candidates = postings[0]
+        checked = self._verify(q, reversed(candidates), limit, ids, USER_SEARCH_SCAN_BUDGET)
+        if len(ids) < limit and checked < len(candidates):
+            rest = np.frombuffer(candidates, dtype=np.uint32)[:len(candidates) - checked]
+            if len(postings) > 1:
+                # Matches are sparse: narrow the rest with the next posting list.
+                # Postings are sorted and unique, as intersect1d's fast path requires.
+                rest = np.intersect1d(rest, np.frombuffer(postings[1], dtype=np.uint32), assume_unique=True)
+            self._verify(q, reversed(rest), limit, ids, None)
+        return ids
+
+    def _verify(self, q: str, slots, limit: int, ids: List[str], budget: Optional[int]) -> int:
+        """Append ids of slots whose text contains q; returns how many slots were checked."""
+        checked = 0
+        for slot in slots:
+            entry = self._slots[slot]
+            checked += 1
+            if q in entry[4]:
+                ids.append(entry[0])
+                if len(ids) >= limit:
+                    break
+            if budget is not None and checked >= budget:
+                break
+        return checked
+
+    def _key_range(self, p: str):
+        i = bisect.bisect_left(self._keys, p)
+        while i < len(self._keys) and self._keys[i].startswith(p):
+            yield self._keys[i], self._key_slots[i]
+            i += 1
+
+    def _overlay_range(self, p: str):
+        i = bisect.bisect_left(self._overlay, (p,))
+        while i < len(self._overlay) and self._overlay[i][0].startswith(p):
+            yield self._overlay[i]
+            i += 1
+
+    def autocomplete(self, prefix: str, limit: int) -> List[dict]:
+        p = prefix.strip().lower()
+        if not p:
+            return []
+        users = []
+        seen = set()
+        for key, slot in heapq.merge(self._key_range(p), self._overlay_range(p)):
+            if slot in seen or not self._key_valid(key, slot):
+                continue
+            seen.add(slot)
+            user_id, username, full_name, avatar_url, _ = self._slots[slot]
+            users.append({"id": user_id, "username": username, "full_name": full_name, "avatar_url": avatar_url})
+            if len(users) >= limit:
+                break
+        return users
+
+    async def _fetch_profiles(self, since: Optional[str]) -> List[dict]:
+        # Full builds walk (created_at, id) so slots come out in created_at
+        # order; refreshes walk (updated_at, id) from the last sync.
+        column = "updated_at" if since else "created_at"
+
+        def make_query():
+            query = supabase_admin.table("profiles").select("id,username,full_name,avatar_url,created_at,updated_at")
+            return query.gt("updated_at", since) if since else query
+
+        rows = []
+        async for batch in scan_keyset(make_query, column=column):
+            rows.extend(batch)
+        return rows
+
+    async def rebuild(self):
+        started = datetime.now(timezone.utc).isoformat()
+        profiles = await self._fetch_profiles(None)
+        # Build off the event loop, then swap in; upserts that land meanwhile
+        # are picked up again by the next refresh
+        fresh = UserSearchIndex()
+        await run_blocking(fresh.load, profiles)
+        for attr in ("_slots", "_slot_by_id", "_postings", "_unsorted", "_keys", "_key_slots", "_overlay"):
+            setattr(self, attr, getattr(fresh, attr))
+        self.ready = True
+        self._synced_at = started
+        logger.info(f"User search index loaded {len(self)} profiles")
+
+    async def refresh(self):
+        since = self._synced_at
+        for profile in await self._fetch_profiles(since):
+            self.upsert(profile)
+            if profile.get("updated_at") and (self._synced_at is None or profile["updated_at"] > self._synced_at):
+                self._synced_at = profile["updated_at"]
+
+    async def _run(self):
+        try:
+            await self.rebuild()
+        except Exception as e:
+            logger.warning(f"User search index rebuild failed, using database search: {e}")
+            return
+        while True:
+            await asyncio.sleep(USER_SEARCH_REFRESH_SECONDS)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"User search index refresh failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+user_search_index = UserSearchIndex()
+
 # ==================== USER ENDPOINTS ====================
 
 @api_router.get("/users")
 async def get_users(skip: int = 0, limit: int = 20, search: str = None):
     """Get users with search and pagination"""
     try:
+        if search and user_search_index.ready:
+            ids = user_search_index.search(search, skip + limit)
+            if ids is not None:
+                ids = ids[skip:]
+                if not ids:
+                    return {"users": [], "has_more": False}
+                response = await db_execute(supabase.table("profiles").select("*").in_("id", ids))
+                by_id = {row["id"]: row for row in (response.data or [])}
+                users = [by_id[user_id] for user_id in ids if user_id in by_id]
+                return {"users": users, "has_more": len(ids) == limit}
+
         query = supabase.table("profiles").select("*")
         
         if search:
             query = query.or_(f"username.ilike.%{search}%,full_name.ilike.%{search}%")
             
         query = query.order("created_at", desc=True).range(skip, skip + limit - 1)
-        response = query.execute()
+        response = await db_execute(query)
         
         return {"users": response.data, "has_more": len(response.data) == limit}
     except Exception as e:
         logger.error(f"Error fetching users: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch users")
 
+@api_router.get("/users/autocomplete")
+async def autocomplete_users(q: str, limit: int = 10):
+    """Users whose username or a word of their name starts with q"""
+    limit = max(1, min(limit, 50))
+    if user_search_index.ready:
+        return {"users": user_search_index.autocomplete(q, limit)}
+    try:
+        response = await db_execute(
+            supabase.table("profiles")
+            .select("id,username,full_name,avatar_url")
+            .ilike("username", f"{q.strip()}%")
+            .order("username")
+            .limit(limit)
+        )
+        return {"users": response.data or []}
+    except Exception as e:
+        logger.error(f"Error autocompleting users: {e}")
+        raise HTTPException(status_code=500, detail="Failed to autocomplete users")
+
+@api_router.get("/users/suggestions")
+async def get_user_suggestions(limit: int = 20, current_user: dict = Depends(get_current_user)):
+    """People you may know: users followed by the people you follow, ranked by how many of them do"""
+    try:
+        if not follow_graph.ready:
+            return {"suggestions": []}
+        ranked = follow_graph.friends_of_friends(current_user["id"], max(1, min(limit, 100)))
+        profiles = await profile_cache.get_many([user_id for user_id, _ in ranked])
+        suggestions = []
+        for user_id, mutual_count in ranked:
+            profile = profiles.get(user_id)
+            if profile:
+                suggestions.append({
+                    "id": user_id,
+                    "username": profile.get("username"),
+                    "full_name": profile.get("full_name"),
+                    "avatar_url": profile.get("avatar_url"),
+                    "mutual_count": mutual_count,
+                })
+        return {"suggestions": suggestions}
+    except Exception as e:
+        logger.error(f"Error fetching user suggestions: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch suggestions")
+
 @api_router.get("/users/{user_id}")
 async def get_user(user_id: str):
     """Get a specific user by ID"""
     try:
-        response = supabase.table("profiles").select("*").eq("id", user_id).single().execute()
-        return {"user": response.data}
+        user = await profile_cache.get("id", user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return {"user": user}
     except Exception as e:
         logger.error(f"Error fetching user: {e}")
         raise HTTPException(status_code=404, detail="User not found")
@@ -1560,8 +4258,10 @@ async def get_user(user_id: str):
 async def get_user_by_username(username: str):
     """Get a specific user by username"""
     try:
-        response = supabase.table("profiles").select("*").eq("username", username).single().execute()
-        return {"user": response.data}
+        user = await profile_cache.get("username", username)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return {"user": user}
     except Exception as e:
         logger.error(f"Error fetching user by username: {e}")
         raise HTTPException(status_code=404, detail="User not found")
@@ -1570,94 +4270,162 @@ async def get_user_by_username(username: str):
 async def get_follow_counts(user_id: str):
     """Get followers and following counts for a user"""
     try:
-        followers = supabase.table("user_follows").select("id", count="exact").eq("following_id", user_id).execute()
-        following = supabase.table("user_follows").select("id", count="exact").eq("follower_id", user_id).execute()
-        return {"followers": followers.count or 0, "following": following.count or 0}
+        return await load_follow_counts(user_id)
     except Exception as e:
         logger.error(f"Error fetching follow counts: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch follow counts")
 
 
+FOLLOW_LIST_PAGE_SIZE = 1000
+
+# (filter column, embed alias, profile foreign key) per direction
+FOLLOW_LISTS = {
+    "followers": ("following_id", "follower", "user_follows_follower_id_fkey"),
+    "following": ("follower_id", "following", "user_follows_following_id_fkey"),
+}
+
+async def _follow_page(kind: str, user_id: str, limit: int, cursor: Optional[tuple]) -> tuple:
+    """One (created_at, id) DESC keyset page of a follow list: (profiles, next_cursor)."""
+    column, alias, fkey = FOLLOW_LISTS[kind]
+    query = (
+        supabase
+        .table("user_follows")
+        .select(f"id,created_at,{alias}:profiles!{fkey}(id,username,full_name,avatar_url,bio)")
+        .eq(column, user_id)
+    )
+    if cursor:
+        query = query.or_(keyset_before(*cursor))
+    response = await db_execute(query.order("created_at", desc=True).order("id", desc=True).limit(limit))
+    rows = response.data or []
+    profiles = []
+    for row in rows:
+        profile = row.get(alias)
+        if isinstance(profile, list):
+            profile = profile[0] if profile else None
+        if profile:
+            profiles.append(profile)
+    next_cursor = (rows[-1]["created_at"], rows[-1]["id"]) if len(rows) == limit else None
+    return profiles, next_cursor
+
+async def _stream_follow_list(kind: str, user_id: str):
+    # One page in memory at a time, however long the list is
+    cursor = None
+    while True:
+        profiles, cursor = await _follow_page(kind, user_id, FOLLOW_LIST_PAGE_SIZE, cursor)
+        if profiles:
+            yield "".join(json.dumps(profile) + "\n" for profile in profiles)
+        if cursor is None:
+            return
+
+async def _follow_list_response(kind: str, user_id: str, limit: int, cursor: Optional[str], format: Optional[str]):
+    if format == "ndjson":
+        return StreamingResponse(_stream_follow_list(kind, user_id), media_type="application/x-ndjson")
+    limit = max(1, min(limit, 200))
+    profiles, next_cursor = await _follow_page(kind, user_id, limit, decode_cursor(cursor) if cursor else None)
+    return {kind: profiles, "next_cursor": encode_cursor(*next_cursor) if next_cursor else None}
+
 @api_router.get("/users/{user_id}/followers")
-async def list_followers(user_id: str):
-    """Return basic profile information for users following the given user."""
+async def list_followers(user_id: str, limit: int = 50, cursor: Optional[str] = None, format: Optional[str] = None):
+    """Basic profile information for users following the given user, newest first.
+
+    Pages are keyed by an opaque cursor; format=ndjson streams the whole list instead.
+    """
     try:
-        response = (
-            supabase
-            .table("user_follows")
-            .select("follower:profiles!user_follows_follower_id_fkey(id,username,full_name,avatar_url,bio)")
-            .eq("following_id", user_id)
-            .execute()
-        )
-        followers = []
-        for row in response.data or []:
-            follower = row.get("follower")
-            if isinstance(follower, list):
-                follower = follower[0] if follower else None
-            if follower:
-                followers.append(follower)
-        return {"followers": followers}
+        return await _follow_list_response("followers", user_id, limit, cursor, format)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching followers: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch followers")
 
 
 @api_router.get("/users/{user_id}/following")
-async def list_following(user_id: str):
-    """Return basic profile information for users the given user is following."""
+async def list_following(user_id: str, limit: int = 50, cursor: Optional[str] = None, format: Optional[str] = None):
+    """Basic profile information for users the given user is following, newest first.
+
+    Pages are keyed by an opaque cursor; format=ndjson streams the whole list instead.
+    """
     try:
-        response = (
-            supabase
-            .table("user_follows")
-            .select("following:profiles!user_follows_following_id_fkey(id,username,full_name,avatar_url,bio)")
-            .eq("follower_id", user_id)
-            .execute()
-        )
-        following = []
-        for row in response.data or []:
-            followee = row.get("following")
-            if isinstance(followee, list):
-                followee = followee[0] if followee else None
-            if followee:
-                following.append(followee)
-        return {"following": following}
+        return await _follow_list_response("following", user_id, limit, cursor, format)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching following: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch following")
 
+async def mutual_follow_ids(user_id: str) -> List[str]:
+    """Users who follow user_id and are followed back, from the follow graph when it is loaded."""
+    if follow_graph.ready:
+        return follow_graph.mutuals(user_id)
+    following_resp = await db_execute(supabase_admin.table("user_follows").select("following_id").eq("follower_id", user_id))
+    followers_resp = await db_execute(supabase_admin.table("user_follows").select("follower_id").eq("following_id", user_id))
+    following_ids = {row.get("following_id") for row in (following_resp.data or []) if row.get("following_id")}
+    follower_ids = {row.get("follower_id") for row in (followers_resp.data or []) if row.get("follower_id")}
+    return [uid for uid in following_ids & follower_ids if uid and uid != user_id]
+
+@api_router.get("/users/{user_id}/mutuals")
+async def list_mutuals(user_id: str, limit: int = 50):
+    """Users who follow the given user and are followed back"""
+    try:
+        mutual_ids = (await mutual_follow_ids(user_id))[:max(1, min(limit, 200))]
+        profiles = await profile_cache.get_many(mutual_ids)
+        mutuals = []
+        for uid in mutual_ids:
+            profile = profiles.get(uid)
+            if profile:
+                mutuals.append({key: profile.get(key) for key in ("id", "username", "full_name", "avatar_url", "bio")})
+        return {"mutuals": mutuals}
+    except Exception as e:
+        logger.error(f"Error fetching mutuals: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch mutuals")
+
+@api_router.get("/users/{user_id}/relationship")
+async def get_relationship(user_id: str, current_user: dict = Depends(get_current_user)):
+    """Whether the caller follows the given user and whether that user follows the caller"""
+    try:
+        viewer_id = current_user["id"]
+        if follow_graph.ready:
+            return {
+                "following": follow_graph.follows(viewer_id, user_id),
+                "follows_you": follow_graph.follows(user_id, viewer_id),
+            }
+        response = await db_execute(
+            supabase_admin.table("user_follows")
+            .select("follower_id,following_id")
+            .or_(f"and(follower_id.eq.{viewer_id},following_id.eq.{user_id}),and(follower_id.eq.{user_id},following_id.eq.{viewer_id})")
+        )
+        edges = {(row.get("follower_id"), row.get("following_id")) for row in (response.data or [])}
+        return {"following": (viewer_id, user_id) in edges, "follows_you": (user_id, viewer_id) in edges}
+    except Exception as e:
+        logger.error(f"Error fetching relationship: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch relationship")
+
 @api_router.post("/users/{user_id}/follow")
 async def follow_user(user_id: str, current_user: dict = Depends(get_current_user)):
     """Follow or unfollow a user"""
+    if user_id == current_user["id"]:
+        raise HTTPException(status_code=400, detail="Cannot follow yourself")
     try:
-        # Check if already following (correct table: user_follows)
-        existing_follow = (
-            supabase
-            .table("user_follows")
-            .select("*")
-            .eq("follower_id", current_user["id"]) 
-            .eq("following_id", user_id)
-            .execute()
-        )
-        
-        if existing_follow.data:
-            # Unfollow
-            supabase.table("user_follows").delete().eq("follower_id", current_user["id"]).eq("following_id", user_id).execute()
-            return {"following": False}
-        else:
-            # Follow
-            follow_data = {
-                "follower_id": current_user["id"],
-                "following_id": user_id,
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            supabase.table("user_follows").insert(follow_data).execute()
+        # One round-trip: the edge, both users' counters and the follower's
+        # home_timeline (seeded with or cleared of the followee's posts)
+        result = await db_execute(supabase_admin.rpc("toggle_follow", {
+            "follower_uuid": current_user["id"],
+            "following_uuid": user_id,
+            "timeline_keep": TIMELINE_MAX_ENTRIES
+        }))
+        outcome = result.data or {}
+        follow_counts_cache.set(current_user["id"], outcome.get("follower") or {"followers": 0, "following": 0})
+        follow_counts_cache.set(user_id, outcome.get("followee") or {"followers": 0, "following": 0})
+        if outcome.get("changed"):
+            follow_graph.set_edge(current_user["id"], user_id, bool(outcome.get("following")))
+        if outcome.get("following") and outcome.get("changed"):
             # Notify followed user
             try:
                 follower_tag = tag_from_user(current_user)
-                notify_user(user_id, f"{follower_tag} started following you.", ntype="follow", reference_id=current_user["id"]) 
+                await notify_user(user_id, f"{follower_tag} started following you.", ntype="follow", reference_id=current_user["id"]) 
             except Exception:
                 pass
-            return {"following": True}
+        return {"following": bool(outcome.get("following"))}
     except Exception as e:
         logger.error(f"Error following user: {e}")
         raise HTTPException(status_code=500, detail="Failed to follow user")
@@ -1671,13 +4439,12 @@ async def get_chats(current_user: dict = Depends(get_current_user)):
         user_id = current_user["id"]
 
         try:
-            base_response = (
+            base_response = await db_execute(
                 supabase_admin
                 .table("chat_rooms")
                 .select("*")
                 .or_(f"created_by.eq.{user_id},room_type.eq.public")
                 .order("created_at", desc=True)
-                .execute()
             )
         except Exception as e:
             msg = str(e)
@@ -1691,12 +4458,11 @@ async def get_chats(current_user: dict = Depends(get_current_user)):
             if room.get("id"):
                 rooms_map[room["id"]] = room
 
-        direct_response = (
+        direct_response = await db_execute(
             supabase_admin
             .table("chat_rooms")
             .select("*")
             .eq("room_type", "direct")
-            .execute()
         )
         for room in direct_response.data or []:
             if room.get("id"):
@@ -1730,14 +4496,7 @@ async def get_chats(current_user: dict = Depends(get_current_user)):
                     rooms.append(room)
 
         if peer_ids:
-            profiles_resp = (
-                supabase_admin
-                .table("profiles")
-                .select("id,username,full_name,avatar_url")
-                .in_("id", list(peer_ids))
-                .execute()
-            )
-            profile_map = {profile["id"]: profile for profile in (profiles_resp.data or []) if profile.get("id")}
+            profile_map = await profile_cache.get_many(list(peer_ids))
             for room in rooms:
                 if (room.get("room_type") or "").lower() == "direct":
                     peer_profile = profile_map.get(room.get("peer_user_id"))
@@ -1764,28 +4523,19 @@ async def create_direct_chat(payload: DirectChatRequest, current_user: dict = De
             raise HTTPException(status_code=400, detail="Cannot start a chat with yourself")
 
         # Validate recipient exists
-        recipient_resp = (
-            supabase_admin
-            .table("profiles")
-            .select("id,username,full_name,avatar_url")
-            .eq("id", recipient_id)
-            .single()
-            .execute()
-        )
-        recipient_profile = recipient_resp.data
+        recipient_profile = await profile_cache.get("id", recipient_id)
         if not recipient_profile:
             raise HTTPException(status_code=404, detail="Recipient not found")
 
         dm_name = _canonical_dm_name(user_id, recipient_id)
 
-        existing = (
+        existing = await db_execute(
             supabase_admin
             .table("chat_rooms")
             .select("*")
             .eq("room_type", "direct")
             .eq("name", dm_name)
             .limit(1)
-            .execute()
         )
 
         if existing.data:
@@ -1796,7 +4546,7 @@ async def create_direct_chat(payload: DirectChatRequest, current_user: dict = De
                 "initiator": user_id,
                 "created_at": datetime.now(timezone.utc).isoformat()
             }
-            insert_resp = (
+            insert_resp = await db_execute(
                 supabase_admin
                 .table("chat_rooms")
                 .insert({
@@ -1806,7 +4556,6 @@ async def create_direct_chat(payload: DirectChatRequest, current_user: dict = De
                     "created_by": user_id,
                     "is_active": True
                 })
-                .execute()
             )
             if not insert_resp.data:
                 raise HTTPException(status_code=500, detail="Failed to create chat")
@@ -1838,24 +4587,17 @@ async def get_chat_suggestions(limit: int = 8, current_user: dict = Depends(get_
         if not user_id:
             return {"suggestions": []}
 
-        following_resp = supabase_admin.table("user_follows").select("following_id").eq("follower_id", user_id).execute()
-        followers_resp = supabase_admin.table("user_follows").select("follower_id").eq("following_id", user_id).execute()
-
-        following_ids = {row.get("following_id") for row in (following_resp.data or []) if row.get("following_id")}
-        follower_ids = {row.get("follower_id") for row in (followers_resp.data or []) if row.get("follower_id")}
-
-        candidate_ids = [uid for uid in following_ids & follower_ids if uid and uid != user_id]
+        candidate_ids = await mutual_follow_ids(user_id)
         if not candidate_ids:
             return {"suggestions": []}
 
         # Exclude users already present in the user's chat rooms
         try:
-            rooms_resp = (
+            rooms_resp = await db_execute(
                 supabase_admin
                 .table("chat_rooms")
                 .select("id")
                 .or_(f"created_by.eq.{user_id},room_type.eq.public")
-                .execute()
             )
             room_ids = [room.get("id") for room in (rooms_resp.data or []) if room.get("id")]
         except Exception:
@@ -1864,13 +4606,12 @@ async def get_chat_suggestions(limit: int = 8, current_user: dict = Depends(get_
         engaged_user_ids = set()
         if room_ids:
             try:
-                messages_resp = (
+                messages_resp = await db_execute(
                     supabase_admin
                     .table("chat_messages")
                     .select("user_id,room_id")
                     .in_("room_id", room_ids)
                     .neq("user_id", user_id)
-                    .execute()
                 )
                 engaged_user_ids = {msg.get("user_id") for msg in (messages_resp.data or []) if msg.get("user_id")}
             except Exception:
@@ -1882,12 +4623,11 @@ async def get_chat_suggestions(limit: int = 8, current_user: dict = Depends(get_
 
         limited_ids = filtered_ids[:limit]
 
-        profiles_resp = (
+        profiles_resp = await db_execute(
             supabase_admin
             .table("profiles")
             .select("id,username,full_name,avatar_url,bio")
             .in_("id", limited_ids)
-            .execute()
         )
 
         profile_map = {profile["id"]: profile for profile in (profiles_resp.data or []) if profile.get("id")}
@@ -1912,13 +4652,12 @@ async def get_chat_suggestions(limit: int = 8, current_user: dict = Depends(get_
 async def get_messages(chat_id: str, skip: int = 0, limit: int = 50, current_user: dict = Depends(get_current_user)):
     """Get messages for a chat (uses chat_messages table)."""
     try:
-        chat_resp = (
+        chat_resp = await db_execute(
             supabase_admin
             .table("chat_rooms")
             .select("id,room_type,name,description,created_by")
             .eq("id", chat_id)
             .single()
-            .execute()
         )
         chat = chat_resp.data
         if not chat:
@@ -1939,14 +4678,13 @@ async def get_messages(chat_id: str, skip: int = 0, limit: int = 50, current_use
         elif room_type != "public" and chat.get("created_by") != user_id:
             raise HTTPException(status_code=403, detail="Not authorized to view this chat")
 
-        response = (
+        response = await db_execute(
             supabase_admin
             .table("chat_messages")
             .select("*")
             .eq("room_id", chat_id)
             .order("created_at", desc=True)
             .range(skip, skip + limit - 1)
-            .execute()
         )
 
         messages = response.data or []
@@ -1966,13 +4704,12 @@ async def get_messages(chat_id: str, skip: int = 0, limit: int = 50, current_use
 async def send_message(chat_id: str, message_data: dict, current_user: dict = Depends(get_current_user)):
     """Send a message to a chat (uses chat_messages)."""
     try:
-        chat_resp = (
+        chat_resp = await db_execute(
             supabase_admin
             .table("chat_rooms")
             .select("id,room_type,name,description,created_by")
             .eq("id", chat_id)
             .single()
-            .execute()
         )
         chat = chat_resp.data
         if not chat:
@@ -2002,7 +4739,7 @@ async def send_message(chat_id: str, message_data: dict, current_user: dict = De
         if not payload["message"]:
             raise HTTPException(status_code=400, detail="content required")
 
-        response = supabase_admin.table("chat_messages").insert(payload).execute()
+        response = await db_execute(supabase_admin.table("chat_messages").insert(payload))
         if not response.data:
             raise HTTPException(status_code=500, detail="Message not persisted")
         inserted = response.data[0]
@@ -2032,7 +4769,7 @@ async def get_notifications(current_user: dict = Depends(get_current_user), cate
             q = q.eq("type", "system")
         elif category == "transactional":
             q = q.eq("type", "payment")
-        response = q.execute()
+        response = await db_execute(q)
         return {"notifications": response.data}
     except Exception as e:
         logger.error(f"Error fetching notifications: {e}")
@@ -2042,7 +4779,7 @@ async def get_notifications(current_user: dict = Depends(get_current_user), cate
 async def mark_notification_read(notification_id: str, current_user: dict = Depends(get_current_user)):
     """Mark a notification as read"""
     try:
-        supabase.table("notifications").update({"is_read": True}).eq("id", notification_id).eq("user_id", current_user["id"]).execute()
+        await db_execute(supabase.table("notifications").update({"is_read": True}).eq("id", notification_id).eq("user_id", current_user["id"]))
         return {"success": True}
     except Exception as e:
         logger.error(f"Error marking notification as read: {e}")
@@ -2051,7 +4788,7 @@ async def mark_notification_read(notification_id: str, current_user: dict = Depe
 @api_router.post("/notifications/mark-all-read")
 async def mark_all_read(current_user: dict = Depends(get_current_user)):
     try:
-        supabase.table("notifications").update({"is_read": True}).eq("user_id", current_user["id"]).execute()
+        await db_execute(supabase.table("notifications").update({"is_read": True}).eq("user_id", current_user["id"]))
         return {"success": True}
     except Exception as e:
         logger.error(f"Error mark all read: {e}")
@@ -2064,14 +4801,146 @@ async def system_notification(payload: dict, current_user: dict = Depends(get_cu
         title = payload.get("title") or "System"
         message = payload.get("message") or ""
         # Send to all active users (best-effort, limited to recent for MVP)
-        users = supabase.table("profiles").select("id").eq("is_active", True).limit(2000).execute()
+        users = await db_execute(supabase.table("profiles").select("id").eq("is_active", True).limit(2000))
         for u in users.data or []:
-            notify_user(u["id"], title, message, ntype="system")
+            await notify_user(u["id"], title, message, ntype="system")
         return {"success": True, "count": len(users.data or [])}
     except Exception as e:
         logger.error(f"Error broadcasting system notification: {e}")
         raise HTTPException(status_code=500, detail="Failed to send system notification")
 
+@app.on_event("startup")
+async def start_backplane():
+    await manager.backplane.start(manager.deliver_local)
+
+trending_refresh_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def load_trending_battles():
+    global trending_refresh_task
+    try:
+        await trending_battles.refresh()
+        logger.info(f"Trending battles loaded {len(trending_battles)} battles")
+    except Exception as e:
+        logger.warning(f"Trending battles rebuild failed, starting empty: {e}")
+    trending_refresh_task = asyncio.create_task(refresh_trending_battles_periodically())
+
+@app.on_event("shutdown")
+async def stop_trending_battles():
+    if trending_refresh_task is not None:
+        trending_refresh_task.cancel()
+
+@app.on_event("startup")
+async def start_battle_scheduler():
+    await battle_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_battle_scheduler():
+    await battle_scheduler.stop()
+
+@app.on_event("startup")
+async def start_like_counter():
+    like_counter.start()
+
+@app.on_event("shutdown")
+async def stop_like_counter():
+    await like_counter.stop()
+
+like_reconcile_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_like_reconcile():
+    global like_reconcile_task
+    like_reconcile_task = asyncio.create_task(reconcile_like_counts_periodically())
+
+@app.on_event("shutdown")
+async def stop_like_reconcile():
+    if like_reconcile_task is not None:
+        like_reconcile_task.cancel()
+
+@app.on_event("startup")
+async def start_vote_buffer():
+    if vote_buffer is not None:
+        vote_buffer.start()
+
+@app.on_event("shutdown")
+async def drain_vote_buffer():
+    if vote_buffer is not None:
+        await vote_buffer.stop()
+
+@app.on_event("startup")
+async def start_vote_updates():
+    vote_updates.start()
+
+@app.on_event("shutdown")
+async def stop_vote_updates():
+    await vote_updates.stop()
+
+@app.on_event("shutdown")
+async def stop_backplane():
+    await manager.backplane.stop()
+
+timeline_trim_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_timeline_trim():
+    global timeline_trim_task
+    timeline_trim_task = asyncio.create_task(trim_home_timelines_periodically())
+
+@app.on_event("shutdown")
+async def stop_timeline_trim():
+    if timeline_trim_task is not None:
+        timeline_trim_task.cancel()
+
+@app.on_event("startup")
+async def start_user_search_index():
+    user_search_index.start()
+
+@app.on_event("shutdown")
+async def stop_user_search_index():
+    await user_search_index.stop()
+
+@app.on_event("startup")
+async def start_follow_graph():
+    follow_graph.start()
+
+@app.on_event("shutdown")
+async def stop_follow_graph():
+    await follow_graph.stop()
+
+follow_reconcile_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_follow_reconcile():
+    global follow_reconcile_task
+    follow_reconcile_task = asyncio.create_task(reconcile_follow_counts_periodically())
+
+@app.on_event("shutdown")
+async def stop_follow_reconcile():
+    if follow_reconcile_task is not None:
+        follow_reconcile_task.cancel()
+
+hashtag_index_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_hashtag_index():
+    global hashtag_index_task
+    try:
+        loaded = await hashtag_index.refresh()
+        logger.info(f"Hashtag index loaded {loaded} tagged posts")
+    except Exception as e:
+        logger.warning(f"Hashtag index rebuild failed, starting empty: {e}")
+    hashtag_index_task = asyncio.create_task(maintain_hashtag_index())
+
+@app.on_event("shutdown")
+async def stop_hashtag_index():
+    if hashtag_index_task is not None:
+        hashtag_index_task.cancel()
+
+@app.on_event("shutdown")
+async def shutdown_db_executor():
+    db_executor.shutdown(wait=False)
+
 # Include all routes after definitions
 app.include_router(api_router)
 
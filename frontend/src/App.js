@@ -1810,6 +1810,11 @@ const Profile = () => {
   const [followingList, setFollowingList] = useState([]);
   const [loadingFollowersList, setLoadingFollowersList] = useState(false);
   const [loadingFollowingList, setLoadingFollowingList] = useState(false);
+  // Keyset cursors for the next page of each list (null once it is exhausted)
+  const [followersCursor, setFollowersCursor] = useState(null);
+  const [followingCursor, setFollowingCursor] = useState(null);
+  const [loadingMoreFollowers, setLoadingMoreFollowers] = useState(false);
+  const [loadingMoreFollowing, setLoadingMoreFollowing] = useState(false);
   // Profile data derived from authenticated user (no dummy values)
   const profile = viewedUser ? {
     id: viewedUser.id,
@@ -1926,26 +1931,58 @@ const Profile = () => {
     try {
       const res = await apiService.getFollowers(profile.id);
       setFollowersList(res.followers || []);
+      setFollowersCursor(res.next_cursor || null);
     } catch (error) {
       setFollowersList([]);
+      setFollowersCursor(null);
     } finally {
       setLoadingFollowersList(false);
     }
   };
 
+  const loadMoreFollowers = async () => {
+    if (!profile.id || !followersCursor || loadingMoreFollowers) return;
+    setLoadingMoreFollowers(true);
+    try {
+      const res = await apiService.getFollowers(profile.id, followersCursor);
+      setFollowersList(prev => [...prev, ...(res.followers || [])]);
+      setFollowersCursor(res.next_cursor || null);
+    } catch (error) {
+      console.error('Error loading more followers:', error);
+    } finally {
+      setLoadingMoreFollowers(false);
+    }
+  };
+
   const loadFollowing = async () => {
     if (!profile.id) return;
     setLoadingFollowingList(true);
     try {
       const res = await apiService.getFollowing(profile.id);
       setFollowingList(res.following || []);
+      setFollowingCursor(res.next_cursor || null);
     } catch (error) {
       setFollowingList([]);
+      setFollowingCursor(null);
     } finally {
       setLoadingFollowingList(false);
     }
   };
 
+  const loadMoreFollowing = async () => {
+    if (!profile.id || !followingCursor || loadingMoreFollowing) return;
+    setLoadingMoreFollowing(true);
+    try {
+      const res = await apiService.getFollowing(profile.id, followingCursor);
+      setFollowingList(prev => [...prev, ...(res.following || [])]);
+      setFollowingCursor(res.next_cursor || null);
+    } catch (error) {
+      console.error('Error loading more following:', error);
+    } finally {
+      setLoadingMoreFollowing(false);
+    }
+  };
+
   const handleFollowToggle = async (userId) => {
     try {
       const res = await apiService.followUser(userId);
@@ -2229,6 +2266,15 @@ const Profile = () => {
                     </div>
                   </button>
                 ))}
+                {followersCursor && (
+                  <button
+                    onClick={loadMoreFollowers}
+                    disabled={loadingMoreFollowers}
+                    className="w-full py-2 bg-white/10 hover:bg-white/20 border border-white/10 rounded-xl text-purple-200 text-sm transition-colors disabled:opacity-50"
+                  >
+                    {loadingMoreFollowers ? 'Loading...' : 'Load more'}
+                  </button>
+                )}
               </div>
             )}
           </div>
@@ -2274,6 +2320,15 @@ const Profile = () => {
                     </div>
                   </button>
                 ))}
+                {followingCursor && (
+                  <button
+                    onClick={loadMoreFollowing}
+                    disabled={loadingMoreFollowing}
+                    className="w-full py-2 bg-white/10 hover:bg-white/20 border border-white/10 rounded-xl text-purple-200 text-sm transition-colors disabled:opacity-50"
+                  >
+                    {loadingMoreFollowing ? 'Loading...' : 'Load more'}
+                  </button>
+                )}
               </div>
             )}
           </div>
@@ -230,12 +230,14 @@ class ApiService {
     return this.request(`/users/${userId}/follow_counts`);
   }
 
-  async getFollowers(userId) {
-    return this.request(`/users/${userId}/followers`);
+  async getFollowers(userId, cursor) {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    return this.request(`/users/${userId}/followers${query}`);
   }
 
-  async getFollowing(userId) {
-    return this.request(`/users/${userId}/following`);
+  async getFollowing(userId, cursor) {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    return this.request(`/users/${userId}/following${query}`);
   }
 
   async updateProfile(data) {
@@ -99,3 +99,873 @@ DO $$ BEGIN
         USING (auth.uid() = creator_id);
     END IF;
 END $$;
+
+-- 5) Maintained vote tallies on battles.vote_counts ({"A": n, "B": m}) and
+-- battles.total_votes. Statement-level triggers with transition tables: a
+-- multi-row insert into votes costs one UPDATE per battle instead of one per
+-- vote row.
+ALTER TABLE battles ADD COLUMN IF NOT EXISTS total_votes INTEGER DEFAULT 0;
+
+-- The schema's row-level trigger calls the same function name; it must be
+-- gone before the function below (which reads transition tables) replaces it.
+DROP TRIGGER IF EXISTS update_battle_vote_counts_trigger ON votes;
+DROP TRIGGER IF EXISTS update_battle_vote_counts ON votes;
+
+CREATE OR REPLACE FUNCTION update_battle_vote_counts()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE battles b
+           SET vote_counts = jsonb_build_object(
+                   'A', COALESCE((b.vote_counts->>'A')::int, 0) + d.a,
+                   'B', COALESCE((b.vote_counts->>'B')::int, 0) + d.b),
+               total_votes = COALESCE(b.total_votes, 0) + d.a + d.b
+          FROM (SELECT battle_id,
+                       COUNT(*) FILTER (WHERE choice = 'A') AS a,
+                       COUNT(*) FILTER (WHERE choice = 'B') AS b
+                  FROM new_votes
+                 GROUP BY battle_id) d
+         WHERE b.id = d.battle_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE battles b
+           SET vote_counts = jsonb_build_object(
+                   'A', GREATEST(COALESCE((b.vote_counts->>'A')::int, 0) - d.a, 0),
+                   'B', GREATEST(COALESCE((b.vote_counts->>'B')::int, 0) - d.b, 0)),
+               total_votes = GREATEST(COALESCE(b.total_votes, 0) - d.a - d.b, 0)
+          FROM (SELECT battle_id,
+                       COUNT(*) FILTER (WHERE choice = 'A') AS a,
+                       COUNT(*) FILTER (WHERE choice = 'B') AS b
+                  FROM old_votes
+                 GROUP BY battle_id) d
+         WHERE b.id = d.battle_id;
+    ELSE
+        UPDATE battles b
+           SET vote_counts = jsonb_build_object(
+                   'A', GREATEST(COALESCE((b.vote_counts->>'A')::int, 0) + d.a, 0),
+                   'B', GREATEST(COALESCE((b.vote_counts->>'B')::int, 0) + d.b, 0)),
+               total_votes = GREATEST(COALESCE(b.total_votes, 0) + d.a + d.b, 0)
+          FROM (SELECT battle_id, SUM(a) AS a, SUM(b) AS b
+                  FROM (SELECT battle_id, (choice = 'A')::int AS a, (choice = 'B')::int AS b FROM new_votes
+                        UNION ALL
+                        SELECT battle_id, -(choice = 'A')::int, -(choice = 'B')::int FROM old_votes) x
+                 GROUP BY battle_id) d
+         WHERE b.id = d.battle_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS votes_counts_after_insert ON votes;
+DROP TRIGGER IF EXISTS votes_counts_after_update ON votes;
+DROP TRIGGER IF EXISTS votes_counts_after_delete ON votes;
+
+CREATE TRIGGER votes_counts_after_insert
+    AFTER INSERT ON votes
+    REFERENCING NEW TABLE AS new_votes
+    FOR EACH STATEMENT EXECUTE FUNCTION update_battle_vote_counts();
+
+CREATE TRIGGER votes_counts_after_update
+    AFTER UPDATE ON votes
+    REFERENCING OLD TABLE AS old_votes NEW TABLE AS new_votes
+    FOR EACH STATEMENT EXECUTE FUNCTION update_battle_vote_counts();
+
+CREATE TRIGGER votes_counts_after_delete
+    AFTER DELETE ON votes
+    REFERENCING OLD TABLE AS old_votes
+    FOR EACH STATEMENT EXECUTE FUNCTION update_battle_vote_counts();
+
+-- Backfill tallies from existing votes
+UPDATE battles b
+   SET vote_counts = jsonb_build_object(
+           'A', (SELECT COUNT(*) FROM votes v WHERE v.battle_id = b.id AND v.choice = 'A'),
+           'B', (SELECT COUNT(*) FROM votes v WHERE v.battle_id = b.id AND v.choice = 'B')),
+       total_votes = (SELECT COUNT(*) FROM votes v WHERE v.battle_id = b.id);
+
+-- 6) Atomic vote ingestion: one round-trip that enforces one vote per user
+-- (uniq_vote_per_user_battle), bumps the tally (votes triggers above) and
+-- returns the new counts plus the creator for notifications. Only LIVE
+-- battles take votes: 'error' is 'not_found' or 'closed' otherwise. The
+-- battle row is locked FOR NO KEY UPDATE rather than FOR SHARE, since the
+-- tally trigger updates that row in the same transaction and two voters
+-- holding share locks would deadlock on the upgrade.
+CREATE OR REPLACE FUNCTION cast_battle_vote(battle_uuid UUID, voter_uuid UUID, vote_choice TEXT)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    new_vote votes%ROWTYPE;
+    inserted BOOLEAN;
+    battle_row RECORD;
+BEGIN
+    IF vote_choice NOT IN ('A', 'B') THEN
+        RAISE EXCEPTION 'Choice must be A or B' USING ERRCODE = '22023';
+    END IF;
+
+    SELECT status INTO battle_row FROM battles WHERE id = battle_uuid FOR NO KEY UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('voted', false, 'error', 'not_found');
+    END IF;
+    IF battle_row.status IS DISTINCT FROM 'LIVE' THEN
+        RETURN jsonb_build_object('voted', false, 'error', 'closed', 'status', battle_row.status);
+    END IF;
+
+    INSERT INTO votes (battle_id, user_id, choice, created_at)
+    VALUES (battle_uuid, voter_uuid, vote_choice, now())
+    ON CONFLICT (battle_id, user_id) DO NOTHING
+    RETURNING * INTO new_vote;
+    inserted := FOUND;
+
+    SELECT creator_id, vote_counts INTO battle_row FROM battles WHERE id = battle_uuid;
+
+    RETURN jsonb_build_object(
+        'voted', inserted,
+        'vote', CASE WHEN inserted THEN to_jsonb(new_vote) END,
+        'vote_counts', COALESCE(battle_row.vote_counts, '{}'::jsonb),
+        'creator_id', battle_row.creator_id
+    );
+END;
+$$;
+
+-- 7) Batched vote ingestion for the write-behind buffer (VOTE_WRITE_BEHIND=1).
+-- One INSERT statement per battle batch, so the statement-level votes
+-- trigger updates battles.vote_counts once per flush. Batches for a battle
+-- that is missing or no longer LIVE insert nothing and report why. Every
+-- user_id that did not get a row (already voted, bad choice, closed battle)
+-- comes back in 'rejected' so the API can log it.
+CREATE OR REPLACE FUNCTION cast_battle_votes_batch(battle_uuid UUID, batch JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    inserted_ids JSONB;
+    battle_row RECORD;
+    battle_error TEXT;
+BEGIN
+    SELECT status INTO battle_row FROM battles WHERE id = battle_uuid FOR NO KEY UPDATE;
+    IF NOT FOUND THEN
+        battle_error := 'not_found';
+    ELSIF battle_row.status IS DISTINCT FROM 'LIVE' THEN
+        battle_error := 'closed';
+    END IF;
+    IF battle_error IS NOT NULL THEN
+        RETURN jsonb_build_object(
+            'inserted', 0,
+            'error', battle_error,
+            'status', battle_row.status,
+            'rejected', COALESCE((SELECT jsonb_agg(v.user_id)
+                                    FROM jsonb_to_recordset(batch) AS v(user_id UUID)), '[]'::jsonb)
+        );
+    END IF;
+
+    WITH ins AS (
+        INSERT INTO votes (battle_id, user_id, choice, created_at)
+        SELECT battle_uuid, v.user_id, v.choice, COALESCE(v.created_at, now())
+          FROM jsonb_to_recordset(batch) AS v(user_id UUID, choice TEXT, created_at TIMESTAMPTZ)
+         WHERE v.choice IN ('A', 'B')
+        ON CONFLICT (battle_id, user_id) DO NOTHING
+        RETURNING user_id
+    )
+    SELECT COALESCE(jsonb_agg(user_id), '[]'::jsonb) INTO inserted_ids FROM ins;
+
+    SELECT creator_id, vote_counts INTO battle_row FROM battles WHERE id = battle_uuid;
+
+    RETURN jsonb_build_object(
+        'inserted', jsonb_array_length(inserted_ids),
+        'inserted_ids', inserted_ids,
+        'rejected', COALESCE((SELECT jsonb_agg(v.user_id)
+                                FROM jsonb_to_recordset(batch) AS v(user_id UUID)
+                               WHERE NOT inserted_ids ? v.user_id::text), '[]'::jsonb),
+        'vote_counts', COALESCE(battle_row.vote_counts, '{}'::jsonb),
+        'creator_id', battle_row.creator_id
+    );
+END;
+$$;
+
+-- 8) Home timelines (fan-out-on-write with fan-out-on-read for large accounts)
+CREATE TABLE IF NOT EXISTS home_timeline (
+    user_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    post_id UUID NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+    author_id UUID NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, post_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_home_timeline_user_created ON home_timeline(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_posts_author_created ON posts(author_id, created_at DESC);
+
+-- Authors whose posts are merged at read time instead of fanned out
+CREATE TABLE IF NOT EXISTS timeline_pull_authors (
+    author_id UUID PRIMARY KEY REFERENCES profiles(id) ON DELETE CASCADE,
+    marked_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Inboxes are read by their owner only; timeline_pull_authors is written and
+-- read by the API's service role, so it gets no policies at all.
+ALTER TABLE home_timeline ENABLE ROW LEVEL SECURITY;
+ALTER TABLE timeline_pull_authors ENABLE ROW LEVEL SECURITY;
+
+DO $$ BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_policy
+        WHERE polname = 'Users can read their own timeline'
+          AND polrelid = 'home_timeline'::regclass
+    ) THEN
+        CREATE POLICY "Users can read their own timeline"
+        ON home_timeline
+        FOR SELECT TO authenticated
+        USING (auth.uid() = user_id);
+    END IF;
+END $$;
+
+CREATE OR REPLACE FUNCTION fanout_post_to_timelines(post_uuid UUID, fanout_limit INTEGER DEFAULT 10000)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    p RECORD;
+    follower_count INTEGER;
+    inserted INTEGER;
+BEGIN
+    SELECT id, author_id, created_at INTO p FROM posts WHERE id = post_uuid;
+    IF NOT FOUND THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO home_timeline (user_id, post_id, author_id, created_at)
+    VALUES (p.author_id, p.id, p.author_id, p.created_at)
+    ON CONFLICT DO NOTHING;
+
+    -- Capped count: never scans more than fanout_limit + 1 follow rows
+    SELECT COUNT(*) INTO follower_count
+      FROM (SELECT 1 FROM user_follows WHERE following_id = p.author_id LIMIT fanout_limit + 1) f;
+
+    IF follower_count > fanout_limit THEN
+        INSERT INTO timeline_pull_authors (author_id) VALUES (p.author_id) ON CONFLICT DO NOTHING;
+        RETURN 0;
+    END IF;
+
+    INSERT INTO home_timeline (user_id, post_id, author_id, created_at)
+    SELECT follower_id, p.id, p.author_id, p.created_at
+      FROM user_follows
+     WHERE following_id = p.author_id
+    ON CONFLICT DO NOTHING;
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
+
+-- Rows carry the same columns as get_enhanced_post_feed (author profile,
+-- reply/quote/mention counts, is_liked for the viewer) plus id, so clients
+-- render either feed the same way. Counts are computed for the page only.
+DROP FUNCTION IF EXISTS get_home_timeline(UUID, INTEGER, INTEGER);
+
+CREATE FUNCTION get_home_timeline(viewer_uuid UUID, limit_count INTEGER DEFAULT 20, offset_count INTEGER DEFAULT 0)
+RETURNS TABLE (
+    id UUID,
+    post_id UUID,
+    author_id UUID,
+    username VARCHAR,
+    full_name VARCHAR,
+    avatar_url TEXT,
+    content TEXT,
+    media_urls TEXT[],
+    hashtags TEXT[],
+    likes_count INTEGER,
+    comments_count INTEGER,
+    quote_count INTEGER,
+    mention_count INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE,
+    is_liked BOOLEAN,
+    post_type VARCHAR
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT p.id,
+           p.id,
+           p.author_id,
+           pr.username::varchar,
+           pr.full_name::varchar,
+           pr.avatar_url::text,
+           p.content,
+           p.media_urls,
+           p.hashtags,
+           COALESCE(p.likes_count, 0),
+           (SELECT COUNT(*)::int FROM post_relationships r
+             WHERE r.parent_post_id = p.id AND r.relationship_type = 'reply'),
+           (SELECT COUNT(*)::int FROM post_relationships r
+             WHERE r.parent_post_id = p.id AND r.relationship_type = 'quote'),
+           (SELECT COUNT(*)::int FROM post_relationships r
+             WHERE r.parent_post_id = p.id AND r.relationship_type = 'mention'),
+           p.created_at,
+           EXISTS (SELECT 1 FROM likes l WHERE l.post_id = p.id AND l.user_id = viewer_uuid),
+           'post'::varchar
+      FROM (
+            (SELECT post_id, created_at
+               FROM home_timeline
+              WHERE user_id = viewer_uuid
+              ORDER BY created_at DESC
+              LIMIT limit_count + offset_count)
+            UNION
+            (SELECT pp.id, pp.created_at
+               FROM user_follows f
+               JOIN timeline_pull_authors a ON a.author_id = f.following_id
+               JOIN posts pp ON pp.author_id = a.author_id
+              WHERE f.follower_id = viewer_uuid
+              ORDER BY pp.created_at DESC
+              LIMIT limit_count + offset_count)
+           ) t
+      JOIN posts p ON p.id = t.post_id
+      LEFT JOIN profiles pr ON pr.id = p.author_id
+     ORDER BY t.created_at DESC
+     LIMIT limit_count OFFSET offset_count;
+$$;
+
+CREATE OR REPLACE FUNCTION trim_home_timelines(keep_count INTEGER DEFAULT 800)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    removed INTEGER;
+BEGIN
+    -- Only inboxes past keep_count are touched: the per-user count is an
+    -- index-only scan, and each cutoff is one probe of the (user_id,
+    -- created_at DESC) index. Rows tied with the cutoff are kept.
+    DELETE FROM home_timeline h
+     USING (SELECT grown.user_id, cutoff.created_at
+              FROM (SELECT user_id
+                      FROM home_timeline
+                     GROUP BY user_id
+                    HAVING COUNT(*) > keep_count) grown
+             CROSS JOIN LATERAL (
+                    SELECT t.created_at
+                      FROM home_timeline t
+                     WHERE t.user_id = grown.user_id
+                     ORDER BY t.created_at DESC
+                    OFFSET GREATEST(keep_count, 1) - 1
+                     LIMIT 1
+                   ) cutoff) stale
+     WHERE h.user_id = stale.user_id AND h.created_at < stale.created_at;
+    GET DIAGNOSTICS removed = ROW_COUNT;
+    RETURN removed;
+END;
+$$;
+
+-- Seeds a new follower's inbox with the followee's recent posts. Pull
+-- authors are merged in at read time, so they are skipped.
+CREATE OR REPLACE FUNCTION pull_followee_into_timeline(follower_uuid UUID, followee_uuid UUID, keep_count INTEGER DEFAULT 800)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    inserted INTEGER;
+BEGIN
+    IF EXISTS (SELECT 1 FROM timeline_pull_authors WHERE author_id = followee_uuid) THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO home_timeline (user_id, post_id, author_id, created_at)
+    SELECT follower_uuid, p.id, p.author_id, p.created_at
+      FROM posts p
+     WHERE p.author_id = followee_uuid
+     ORDER BY p.created_at DESC
+     LIMIT keep_count
+    ON CONFLICT DO NOTHING;
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
+
+-- Fills every inbox with the newest keep_count posts from the user and the
+-- accounts they follow. Safe to re-run; existing rows are left alone.
+CREATE OR REPLACE FUNCTION backfill_home_timelines(keep_count INTEGER DEFAULT 800)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    inserted INTEGER;
+BEGIN
+    INSERT INTO home_timeline (user_id, post_id, author_id, created_at)
+    SELECT u.id, recent.id, recent.author_id, recent.created_at
+      FROM profiles u
+     CROSS JOIN LATERAL (
+            SELECT p.id, p.author_id, p.created_at
+              FROM posts p
+             WHERE p.author_id = u.id
+                OR p.author_id IN (SELECT f.following_id
+                                     FROM user_follows f
+                                    WHERE f.follower_id = u.id
+                                      AND NOT EXISTS (SELECT 1 FROM timeline_pull_authors a
+                                                       WHERE a.author_id = f.following_id))
+             ORDER BY p.created_at DESC
+             LIMIT keep_count
+           ) recent
+    ON CONFLICT DO NOTHING;
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
+
+-- Backfill (keep_count matches the API's TIMELINE_MAX_ENTRIES default)
+SELECT backfill_home_timelines(800);
+
+-- 9) Like counters: one like per user per post, and posts.likes_count is
+-- maintained by the API's in-process LikeCounter in batched deltas rather
+-- than by a per-row trigger on the hot posts row.
+DO $$ BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE schemaname = 'public' AND indexname = 'uniq_like_per_user_post'
+    ) THEN
+        CREATE UNIQUE INDEX uniq_like_per_user_post ON likes(post_id, user_id);
+    END IF;
+END $$;
+
+DROP TRIGGER IF EXISTS update_post_likes_count_trigger ON likes;
+
+-- When each post's likes last changed. The API bumps touched_at before a like
+-- or unlike (at most once per LIKE_ACTIVITY_TOUCH_SECONDS per post and worker)
+-- and again when the deltas are flushed, so the recount below only visits
+-- posts that changed since it last ran and have been idle since.
+CREATE TABLE IF NOT EXISTS post_like_activity (
+    post_id UUID PRIMARY KEY REFERENCES posts(id) ON DELETE CASCADE,
+    touched_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    reconciled_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_post_like_activity_touched ON post_like_activity(touched_at);
+
+ALTER TABLE post_like_activity ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION touch_post_like_activity(post_ids UUID[])
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO post_like_activity (post_id, touched_at)
+    SELECT p.id, now() FROM posts p WHERE p.id = ANY(post_ids)
+    ON CONFLICT (post_id) DO UPDATE SET touched_at = EXCLUDED.touched_at;
+$$;
+
+CREATE OR REPLACE FUNCTION apply_post_like_deltas(deltas JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    updated INTEGER;
+BEGIN
+    UPDATE posts p
+       SET likes_count = GREATEST(COALESCE(p.likes_count, 0) + d.value::int, 0)
+      FROM jsonb_each_text(deltas) AS d(key, value)
+     WHERE p.id = d.key::uuid;
+    GET DIAGNOSTICS updated = ROW_COUNT;
+    PERFORM touch_post_like_activity(ARRAY(SELECT key::uuid FROM jsonb_object_keys(deltas) AS key));
+    RETURN updated;
+END;
+$$;
+
+-- Recount likes_count where it drifted (a crash with unflushed deltas, writes
+-- that bypass the API). Only posts touched since their last recount are
+-- visited, and only once idle for settle_seconds: a like or unlike touches
+-- the post before its row changes, so a delta still buffered in any worker
+-- keeps its post inside the window and is never applied twice. full_scan
+-- recounts every post that is idle, for one-off repairs.
+DROP FUNCTION IF EXISTS reconcile_post_likes_counts(INTEGER);
+
+CREATE OR REPLACE FUNCTION reconcile_post_likes_counts(
+    settle_seconds INTEGER DEFAULT 60,
+    full_scan BOOLEAN DEFAULT false
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    settled_before TIMESTAMPTZ := now() - make_interval(secs => settle_seconds);
+    repaired INTEGER;
+BEGIN
+    WITH idle AS (
+        SELECT a.post_id
+          FROM post_like_activity a
+         WHERE a.touched_at < settled_before
+           AND (a.reconciled_at IS NULL OR a.reconciled_at < a.touched_at)
+           AND NOT full_scan
+        UNION ALL
+        SELECT p.id
+          FROM posts p
+         WHERE full_scan
+           AND NOT EXISTS (
+               SELECT 1 FROM post_like_activity a
+                WHERE a.post_id = p.id AND a.touched_at >= settled_before
+           )
+    ), fixed AS (
+        UPDATE posts p
+           SET likes_count = c.likes
+          FROM (
+              SELECT i.post_id, (SELECT COUNT(*)::int FROM likes l WHERE l.post_id = i.post_id) AS likes
+                FROM idle i
+          ) c
+         WHERE p.id = c.post_id
+           AND p.likes_count IS DISTINCT FROM c.likes
+        RETURNING p.id
+    ), marked AS (
+        UPDATE post_like_activity a
+           SET reconciled_at = now()
+          FROM idle i
+         WHERE a.post_id = i.post_id
+           AND a.touched_at < settled_before
+        RETURNING a.post_id
+    )
+    SELECT COUNT(*) INTO repaired FROM fixed;
+    RETURN repaired;
+END;
+$$;
+
+-- Repair any drift from the old per-row trigger
+SELECT reconcile_post_likes_counts(0, true);
+
+-- 10) Reply threads with their edges: get_post_thread plus each reply's
+-- parent_post_id, so the API's thread cache can rebuild the tree from one
+-- round-trip. The return type changes, so the old function is dropped first.
+DROP FUNCTION IF EXISTS get_post_thread(UUID);
+
+CREATE FUNCTION get_post_thread(post_uuid UUID)
+RETURNS TABLE (
+    post_id UUID,
+    parent_post_id UUID,
+    author_id UUID,
+    content TEXT,
+    media_urls TEXT[],
+    hashtags TEXT[],
+    likes_count INTEGER,
+    comments_count INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE,
+    thread_level INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH RECURSIVE post_thread AS (
+        SELECT p.id AS post_id, NULL::uuid AS parent_post_id, p.author_id, p.content,
+               p.media_urls, p.hashtags, p.likes_count, p.comments_count, p.created_at,
+               0 AS thread_level
+          FROM posts p
+         WHERE p.id = post_uuid
+
+        UNION ALL
+
+        SELECT p.id, pr.parent_post_id, p.author_id, p.content,
+               p.media_urls, p.hashtags, p.likes_count, p.comments_count, p.created_at,
+               pt.thread_level + 1
+          FROM posts p
+          JOIN post_relationships pr ON p.id = pr.child_post_id
+          JOIN post_thread pt ON pr.parent_post_id = pt.post_id
+         WHERE pr.relationship_type = 'reply'
+    )
+    SELECT * FROM post_thread
+    ORDER BY thread_level, created_at;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_post_thread(UUID) TO authenticated;
+
+-- 11) Denormalized battle cards: everything a list card renders (the battle
+-- row, creator profile, submissions with their uploaders, tallies) as one
+-- jsonb document per battle, kept current by triggers on its source tables.
+CREATE TABLE IF NOT EXISTS battle_cards (
+    battle_id UUID PRIMARY KEY REFERENCES battles(id) ON DELETE CASCADE,
+    status TEXT,
+    is_active BOOLEAN,
+    created_at TIMESTAMPTZ,
+    card JSONB NOT NULL,
+    refreshed_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_battle_cards_created ON battle_cards(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_battle_cards_status_created ON battle_cards(status, created_at DESC);
+
+-- Cards are public like battles; only refresh_battle_cards writes them.
+ALTER TABLE battle_cards ENABLE ROW LEVEL SECURITY;
+
+DO $$ BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_policy
+        WHERE polname = 'Battle cards are viewable by everyone'
+          AND polrelid = 'battle_cards'::regclass
+    ) THEN
+        CREATE POLICY "Battle cards are viewable by everyone"
+        ON battle_cards
+        FOR SELECT
+        USING (true);
+    END IF;
+END $$;
+
+-- SECURITY DEFINER: the card triggers fire on writes made by ordinary
+-- users, who have no write access to battle_cards under RLS.
+CREATE OR REPLACE FUNCTION refresh_battle_cards(battle_ids UUID[])
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    refreshed INTEGER;
+BEGIN
+    INSERT INTO battle_cards (battle_id, status, is_active, created_at, card, refreshed_at)
+    SELECT b.id, b.status, b.is_active, b.created_at,
+           to_jsonb(b) || jsonb_build_object(
+               'creator', (SELECT jsonb_build_object(
+                                  'id', p.id,
+                                  'username', p.username,
+                                  'full_name', p.full_name,
+                                  'avatar_url', p.avatar_url,
+                                  'verified', p.verified)
+                             FROM profiles p WHERE p.id = b.creator_id),
+               'submissions', COALESCE((SELECT jsonb_agg(jsonb_build_object(
+                                                'id', s.id,
+                                                'user_id', s.user_id,
+                                                'media_url', s.media_url,
+                                                'created_at', s.created_at,
+                                                'username', sp.username,
+                                                'avatar_url', sp.avatar_url) ORDER BY s.created_at)
+                                          FROM battle_submissions s
+                                          LEFT JOIN profiles sp ON sp.id = s.user_id
+                                         WHERE s.battle_id = b.id), '[]'::jsonb),
+               'vote_counts', COALESCE(b.vote_counts, '{"A": 0, "B": 0}'::jsonb))
+      FROM battles b
+     WHERE b.id = ANY(battle_ids)
+    ON CONFLICT (battle_id) DO UPDATE
+       SET status = EXCLUDED.status,
+           is_active = EXCLUDED.is_active,
+           created_at = EXCLUDED.created_at,
+           card = EXCLUDED.card,
+           refreshed_at = now();
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+    RETURN refreshed;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION battle_cards_on_battles()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_battle_cards(ARRAY(SELECT id FROM new_rows));
+        RETURN NULL;
+    END IF;
+    -- Tally-only updates (one per vote statement) patch the card in place;
+    -- anything else rebuilds it. The tally triggers also bump total_votes
+    -- and updated_at, so those columns don't count as a change either.
+    UPDATE battle_cards c
+       SET card = c.card || jsonb_build_object(
+                      'vote_counts', COALESCE(n.vote_counts, '{"A": 0, "B": 0}'::jsonb),
+                      'total_votes', n.total_votes,
+                      'updated_at', n.updated_at),
+           refreshed_at = now()
+      FROM new_rows n
+      JOIN old_rows o ON o.id = n.id
+     WHERE c.battle_id = n.id
+       AND to_jsonb(n) - ARRAY['vote_counts', 'total_votes', 'updated_at']
+         = to_jsonb(o) - ARRAY['vote_counts', 'total_votes', 'updated_at'];
+    PERFORM refresh_battle_cards(ARRAY(
+        SELECT n.id
+          FROM new_rows n
+          JOIN old_rows o ON o.id = n.id
+         WHERE to_jsonb(n) - ARRAY['vote_counts', 'total_votes', 'updated_at']
+               IS DISTINCT FROM to_jsonb(o) - ARRAY['vote_counts', 'total_votes', 'updated_at']));
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS battle_cards_after_insert ON battles;
+CREATE TRIGGER battle_cards_after_insert
+    AFTER INSERT ON battles
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION battle_cards_on_battles();
+
+DROP TRIGGER IF EXISTS battle_cards_after_update ON battles;
+CREATE TRIGGER battle_cards_after_update
+    AFTER UPDATE ON battles
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION battle_cards_on_battles();
+
+CREATE OR REPLACE FUNCTION battle_cards_on_submissions()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM refresh_battle_cards(ARRAY[COALESCE(NEW.battle_id, OLD.battle_id)]);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS battle_cards_after_submission ON battle_submissions;
+CREATE TRIGGER battle_cards_after_submission
+    AFTER INSERT OR UPDATE OR DELETE ON battle_submissions
+    FOR EACH ROW EXECUTE FUNCTION battle_cards_on_submissions();
+
+CREATE OR REPLACE FUNCTION battle_cards_on_profiles()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM refresh_battle_cards(ARRAY(
+        SELECT id FROM battles WHERE creator_id = NEW.id
+        UNION
+        SELECT battle_id FROM battle_submissions WHERE user_id = NEW.id));
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS battle_cards_after_profile ON profiles;
+CREATE TRIGGER battle_cards_after_profile
+    AFTER UPDATE OF username, full_name, avatar_url, verified ON profiles
+    FOR EACH ROW EXECUTE FUNCTION battle_cards_on_profiles();
+
+-- Backfill cards for existing battles
+SELECT refresh_battle_cards(ARRAY(SELECT id FROM battles));
+
+-- 12) Maintained follower/following counters. toggle_follow changes the
+-- edge and both counters in one transaction; reconcile_follow_counts repairs
+-- any drift from writes that bypass it.
+CREATE TABLE IF NOT EXISTS follow_counts (
+    user_id UUID PRIMARY KEY REFERENCES profiles(id) ON DELETE CASCADE,
+    followers_count INTEGER NOT NULL DEFAULT 0,
+    following_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+ALTER TABLE follow_counts ENABLE ROW LEVEL SECURITY;
+
+DO $$ BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_policy
+        WHERE polname = 'Follow counts are viewable by everyone'
+          AND polrelid = 'follow_counts'::regclass
+    ) THEN
+        CREATE POLICY "Follow counts are viewable by everyone"
+        ON follow_counts
+        FOR SELECT
+        USING (true);
+    END IF;
+END $$;
+
+-- Also seeds (or clears) the follower's home_timeline with the followee's
+-- recent posts, so a new follow shows up in the feed straight away.
+DROP FUNCTION IF EXISTS toggle_follow(UUID, UUID);
+CREATE OR REPLACE FUNCTION toggle_follow(follower_uuid UUID, following_uuid UUID, timeline_keep INTEGER DEFAULT 800)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    changed INTEGER;
+    delta INTEGER;
+    follower_counts follow_counts;
+    followee_counts follow_counts;
+BEGIN
+    IF follower_uuid = following_uuid THEN
+        RAISE EXCEPTION 'cannot follow yourself';
+    END IF;
+
+    DELETE FROM user_follows WHERE follower_id = follower_uuid AND following_id = following_uuid;
+    GET DIAGNOSTICS changed = ROW_COUNT;
+    IF changed > 0 THEN
+        delta := -1;
+    ELSE
+        INSERT INTO user_follows (follower_id, following_id, created_at)
+        VALUES (follower_uuid, following_uuid, now())
+        ON CONFLICT (follower_id, following_id) DO NOTHING;
+        GET DIAGNOSTICS changed = ROW_COUNT;
+        delta := changed;
+    END IF;
+
+    IF delta > 0 THEN
+        PERFORM pull_followee_into_timeline(follower_uuid, following_uuid, timeline_keep);
+    ELSIF delta < 0 THEN
+        DELETE FROM home_timeline WHERE user_id = follower_uuid AND author_id = following_uuid;
+    END IF;
+
+    IF delta <> 0 THEN
+        -- Both counter rows in one statement, locked in id order so two users
+        -- following each other at once can't deadlock
+        INSERT INTO follow_counts AS c (user_id, followers_count, following_count)
+        SELECT u.id,
+               CASE WHEN u.id = following_uuid THEN GREATEST(delta, 0) ELSE 0 END,
+               CASE WHEN u.id = follower_uuid THEN GREATEST(delta, 0) ELSE 0 END
+          FROM unnest(ARRAY[follower_uuid, following_uuid]) AS u(id)
+         ORDER BY u.id
+        ON CONFLICT (user_id) DO UPDATE
+           SET followers_count = GREATEST(c.followers_count + CASE WHEN c.user_id = following_uuid THEN delta ELSE 0 END, 0),
+               following_count = GREATEST(c.following_count + CASE WHEN c.user_id = follower_uuid THEN delta ELSE 0 END, 0),
+               updated_at = now();
+    END IF;
+
+    SELECT * INTO follower_counts FROM follow_counts WHERE user_id = follower_uuid;
+    SELECT * INTO followee_counts FROM follow_counts WHERE user_id = following_uuid;
+    RETURN jsonb_build_object(
+        -- delta = 0: a concurrent request inserted the same edge first
+        'following', delta >= 0,
+        'changed', delta <> 0,
+        'follower', jsonb_build_object(
+            'followers', COALESCE(follower_counts.followers_count, 0),
+            'following', COALESCE(follower_counts.following_count, 0)),
+        'followee', jsonb_build_object(
+            'followers', COALESCE(followee_counts.followers_count, 0),
+            'following', COALESCE(followee_counts.following_count, 0))
+    );
+END;
+$$;
+
+-- Counter rows a toggle_follow updated within settle_seconds are skipped:
+-- now() is this transaction's start, so a toggle that committed after the
+-- recount's snapshot can still carry an older updated_at, and overwriting
+-- its row would undo that follow. The conflict check sees the latest
+-- committed version, so such a row is always inside the window.
+DROP FUNCTION IF EXISTS reconcile_follow_counts();
+
+CREATE OR REPLACE FUNCTION reconcile_follow_counts(settle_seconds INTEGER DEFAULT 60)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    settled_before TIMESTAMPTZ := now() - make_interval(secs => settle_seconds);
+    repaired INTEGER;
+BEGIN
+    WITH actual AS (
+        SELECT user_id, SUM(followers)::int AS followers_count, SUM(following)::int AS following_count
+          FROM (SELECT following_id AS user_id, 1 AS followers, 0 AS following FROM user_follows
+                UNION ALL
+                SELECT follower_id, 0, 1 FROM user_follows) f
+         GROUP BY user_id
+    ), drifted AS (
+        SELECT COALESCE(a.user_id, c.user_id) AS user_id,
+               COALESCE(a.followers_count, 0) AS followers_count,
+               COALESCE(a.following_count, 0) AS following_count
+          FROM actual a
+          FULL JOIN follow_counts c ON c.user_id = a.user_id
+         WHERE c.user_id IS NULL
+            OR (COALESCE(c.updated_at, '-infinity') < settled_before
+                AND (c.followers_count IS DISTINCT FROM COALESCE(a.followers_count, 0)
+                     OR c.following_count IS DISTINCT FROM COALESCE(a.following_count, 0)))
+    )
+    INSERT INTO follow_counts AS c (user_id, followers_count, following_count, updated_at)
+    SELECT user_id, followers_count, following_count, now() FROM drifted
+    ON CONFLICT (user_id) DO UPDATE
+       SET followers_count = EXCLUDED.followers_count,
+           following_count = EXCLUDED.following_count,
+           updated_at = now()
+     WHERE COALESCE(c.updated_at, '-infinity') < settled_before;
+    GET DIAGNOSTICS repaired = ROW_COUNT;
+    RETURN repaired;
+END;
+$$;
+
+-- Backfill
+SELECT reconcile_follow_counts(0);
+
+-- 13) Keyset pagination for follower/following lists: (created_at, id) DESC
+-- pages per user are a single index range scan.
+CREATE INDEX IF NOT EXISTS idx_user_follows_following_created ON user_follows(following_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_user_follows_follower_created ON user_follows(follower_id, created_at DESC, id DESC);
@@ -0,0 +1,185 @@
+"""Shared fixtures: import backend/server.py without a live Supabase and
+answer its queries from an in-memory fake instead."""
+
+import asyncio
+import os
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test-anon-key")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test-service-key")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+# Applied in this order, so the battle module's definitions win
+SCHEMA_FILES = ("supabase_final_schema.sql", "supabase_battle_module.sql")
+FUNCTION_DEF = re.compile(
+    r"CREATE\s+(?:OR\s+REPLACE\s+)?FUNCTION\s+(?:public\.)?(\w+)\s*\((.*?)\)\s*"
+    r"RETURNS\s+(?:TABLE\s*\((.*?)\)|[\w\[\]]+)",
+    re.S | re.I,
+)
+
+
+def _split_top_level(text):
+    parts, depth, current = [], 0, ""
+    for ch in text:
+        depth += ch == "("
+        depth -= ch == ")"
+        if ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+    parts.append(current)
+    return [part.strip() for part in parts if part.strip()]
+
+
+def load_schema_functions():
+    """{name: (params, required, columns)} for the SQL functions the API calls
+    over RPC; columns is None unless the function RETURNS TABLE."""
+    functions = {}
+    for name in SCHEMA_FILES:
+        for fn, args, table in FUNCTION_DEF.findall((ROOT / name).read_text()):
+            params = [a.split()[0] for a in _split_top_level(args)]
+            required = {a.split()[0] for a in _split_top_level(args) if " DEFAULT " not in a.upper()}
+            columns = {c.split()[0] for c in _split_top_level(table)} if table else None
+            functions[fn] = (set(params), required, columns)
+    return functions
+
+
+SCHEMA_FUNCTIONS = load_schema_functions()
+
+
+def check_rpc(query, data):
+    """Hold a faked RPC call and its rows to the function's real signature."""
+    assert query.rpc_name in SCHEMA_FUNCTIONS, f"{query.rpc_name} is not defined in {SCHEMA_FILES}"
+    params, required, columns = SCHEMA_FUNCTIONS[query.rpc_name]
+    assert set(query.params) <= params, f"{query.rpc_name} has no parameter {set(query.params) - params}"
+    assert required <= set(query.params), f"{query.rpc_name} needs {required - set(query.params)}"
+    if columns is not None and isinstance(data, list):
+        for row in data:
+            assert set(row) <= columns, f"{query.rpc_name} returns no column {set(row) - columns}"
+
+
+class FakeQuery:
+    """Records a supabase-py builder chain so a fake db_execute can answer it."""
+
+    def __init__(self, table_name=None, rpc_name=None, params=None):
+        self.table_name = table_name
+        self.rpc_name = rpc_name
+        self.params = params or {}
+        self.calls = []
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return method
+
+    def args(self, name):
+        """Positional args of every call to `name`, in order."""
+        return [args for call, args, _ in self.calls if call == name]
+
+    def first(self, name, default=None):
+        found = self.args(name)
+        return found[0] if found else default
+
+
+class FakeClient:
+    def table(self, name):
+        return FakeQuery(table_name=name)
+
+    def rpc(self, name, params=None):
+        return FakeQuery(rpc_name=name, params=params)
+
+
+class Response:
+    def __init__(self, data=None, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeDB:
+    """Stands in for db_execute. Tests set `handler(query) -> data`; every
+    query yields to the event loop first, like a real round-trip would, and
+    RPC calls are checked against the function definitions in the schema."""
+
+    def __init__(self):
+        self.handler = lambda query: []
+        self.queries = []
+
+    async def execute(self, query):
+        self.queries.append(query)
+        await asyncio.sleep(0)
+        result = self.handler(query)
+        if query.rpc_name:
+            check_rpc(query, result.data if isinstance(result, Response) else result)
+        return result if isinstance(result, Response) else Response(result)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDB()
+    client = FakeClient()
+    monkeypatch.setattr(server, "supabase", client)
+    monkeypatch.setattr(server, "supabase_admin", client)
+    monkeypatch.setattr(server, "db_execute", db.execute)
+    return db
+
+
+@pytest.fixture
+def no_notifications(monkeypatch):
+    sent = []
+
+    async def notify_user(user_id, title, message="", ntype="user", reference_id=None):
+        sent.append((user_id, title, ntype, reference_id))
+
+    async def notify_users(rows):
+        sent.extend((row["user_id"], row["title"], row.get("type"), row.get("reference_id")) for row in rows)
+
+    monkeypatch.setattr(server, "notify_user", notify_user)
+    monkeypatch.setattr(server, "notify_users", notify_users)
+    return sent
+
+
+KEYSET = re.compile(r'^(\w+)\.(gt|lt)\."([^"]+)",and\(\1\.eq\."([^"]+)",id\.\2\.([^)]+)\)$')
+
+
+def scan_rows(rows, query):
+    """Answer a keyset page from `rows`: gt/gte/lt/eq filters on plain
+    columns, the keyset_after/keyset_before or-filter, (column, id) order in
+    either direction and limit."""
+    (column,), order = next((args, kwargs) for name, args, kwargs in query.calls if name == "order")
+    selected = rows
+    for name, value in query.args("gt"):
+        selected = [r for r in selected if r[name] > value]
+    for name, value in query.args("gte"):
+        selected = [r for r in selected if r[name] >= value]
+    for name, value in query.args("lt"):
+        selected = [r for r in selected if r[name] < value]
+    for name, value in query.args("eq"):
+        if "." not in name:
+            selected = [r for r in selected if r.get(name) == value]
+    for (expression,) in query.args("or_"):
+        _, op, value, _, row_id = KEYSET.match(expression).groups()
+        if op == "gt":
+            selected = [r for r in selected if (r[column], r["id"]) > (value, row_id)]
+        else:
+            selected = [r for r in selected if (r[column], r["id"]) < (value, row_id)]
+    selected = sorted(selected, key=lambda r: (r[column], r["id"]), reverse=order.get("desc", False))
+    (limit,) = query.first("limit")
+    return selected[:limit]
+
+
+@pytest.fixture
+def keyset_table():
+    return scan_rows
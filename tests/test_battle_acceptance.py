@@ -0,0 +1,52 @@
+"""Lazy expiry in accept_battle: concurrent late accepts cancel the battle
+once and notify the creator once."""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+
+import server
+
+BATTLE_ID = str(uuid.uuid4())
+CREATOR_ID = str(uuid.uuid4())
+
+
+def test_expired_accepts_cancel_and_notify_once(fake_db, no_notifications):
+    invited = [str(uuid.uuid4()) for _ in range(5)]
+    battle = {
+        "creator_id": CREATOR_ID,
+        "mode": "multi",
+        "status": "INVITED",
+        "accept_deadline": (datetime.now(timezone.utc) - timedelta(minutes=1)).isoformat(),
+        "invited_user_ids": invited,
+        "accepted_user_ids": [],
+    }
+
+    def handler(query):
+        if query.first("update"):
+            (changes,) = query.first("update")
+            filters = dict(query.args("eq"))
+            if filters.get("status", battle["status"]) != battle["status"]:
+                return []
+            battle.update(changes)
+            return [dict(battle)]
+        return dict(battle)
+
+    fake_db.handler = handler
+
+    async def accept(user_id):
+        try:
+            return await server.accept_battle(BATTLE_ID, current_user={"id": user_id})
+        except HTTPException as e:
+            return e
+
+    async def run():
+        return await asyncio.gather(*(accept(uid) for uid in invited))
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(r, HTTPException) and r.status_code == 400 for r in results)
+    assert battle["status"] == "CANCELLED"
+    assert no_notifications == [(CREATOR_ID, "Battle cancelled.", "battle_result", BATTLE_ID)]
@@ -0,0 +1,88 @@
+"""GET /battles/{id} returns aggregate results plus the caller's own vote
+instead of embedding every vote row, and voters page by keyset.
+
+The fake DB answers like PostgREST: the my_vote embed is filtered to the
+caller, so it holds at most one row however many votes the battle has.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+
+import server
+
+USER = {"id": str(uuid.uuid4())}
+
+
+def _battle(vote_count):
+    a_votes = vote_count * 3 // 5
+    return {"id": str(uuid.uuid4()), "status": "LIVE", "creator_id": str(uuid.uuid4()),
+            "title": "Best sunset", "vote_counts": {"A": a_votes, "B": vote_count - a_votes},
+            "creator": {"id": str(uuid.uuid4()), "username": "host"}, "participants": []}
+
+
+def _vote(i, choice="A", battle_id=None):
+    return {"id": f"{i:08d}", "battle_id": battle_id, "choice": choice,
+            "created_at": f"2026-01-01T00:00:{i % 60:02d}+00:00", "user_id": str(uuid.uuid4())}
+
+
+@pytest.mark.parametrize("vote_count", [10, 10_000, 200_000])
+def test_detail_payload_is_constant_in_vote_count(fake_db, monkeypatch, vote_count):
+    monkeypatch.setattr(server, "vote_buffer", None)
+    battle = _battle(vote_count)
+
+    # The old embed shipped every vote row with the battle
+    old_body = json.dumps({**battle, "votes": [_vote(i) for i in range(vote_count)]})
+
+    def handler(query):
+        (select,) = query.first("select")
+        assert "my_vote:votes(choice,created_at)" in select
+        assert ("my_vote.user_id", USER["id"]) in query.args("eq")
+        return {**battle, "my_vote": [{"choice": "B", "created_at": "2026-01-01T00:00:00+00:00"}]}
+
+    fake_db.handler = handler
+    started = time.perf_counter()
+    detail = asyncio.run(server.get_battle(battle["id"], current_user=USER))["battle"]
+    seconds = time.perf_counter() - started
+    new_body = json.dumps(detail)
+
+    print(f"\n{vote_count:>7} votes: embedded {len(old_body):>10} B | detail {len(new_body)} B {seconds * 1000:.2f}ms")
+    assert detail["my_vote"] == "B"
+    assert detail["results"]["total_votes"] == vote_count
+    assert len(new_body) < 1024
+
+
+def test_unflushed_vote_is_reported_as_my_vote(fake_db, monkeypatch):
+    battle = _battle(5)
+    buffer = server.VoteBuffer(max_batch=100, flush_interval=60)
+    monkeypatch.setattr(server, "vote_buffer", buffer)
+    buffer.add(battle["id"], USER["id"], "A")
+    fake_db.handler = lambda query: {**battle, "my_vote": []}
+
+    detail = asyncio.run(server.get_battle(battle["id"], current_user=USER))["battle"]
+    assert detail["my_vote"] == "A"
+
+
+def test_voters_page_by_keyset(fake_db, keyset_table):
+    battle = _battle(0)
+    votes = [_vote(i, battle_id=battle["id"]) for i in range(120)] + [_vote(200, battle_id=str(uuid.uuid4()))]
+    newest_first = sorted(votes[:120], key=lambda v: (v["created_at"], v["id"]), reverse=True)
+
+    def handler(query):
+        if query.table_name == "battles":
+            return battle
+        assert not query.args("range")
+        return keyset_table(votes, query)
+
+    fake_db.handler = handler
+    seen, cursor = [], None
+    while True:
+        page = asyncio.run(server.get_battle_voters(battle["id"], limit=50, cursor=cursor, current_user=USER))
+        seen.extend(v["id"] for v in page["voters"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [v["id"] for v in newest_first]
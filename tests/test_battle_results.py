@@ -0,0 +1,64 @@
+"""Battle results from the maintained vote_counts tally versus counting every
+vote row, at 1k/100k/1M votes.
+
+The fake DB returns what PostgREST would: every `votes.choice` row for the
+old query, one `battles.vote_counts` row for the new one. Payload size is
+the JSON body of that response.
+"""
+
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import pytest
+
+import server
+
+BATTLE_ID = str(uuid.uuid4())
+
+
+def _count_rows(battle_id, votes):
+    """The pre-tally implementation: download every vote and count in Python."""
+    total_votes = len(votes)
+    option_a_votes = len([v for v in votes if v["choice"] == "A"])
+    option_b_votes = len([v for v in votes if v["choice"] == "B"])
+    return server.BattleResultsResponse(
+        battle_id=battle_id,
+        total_votes=total_votes,
+        option_a_votes=option_a_votes,
+        option_b_votes=option_b_votes,
+        option_a_percentage=round(option_a_votes / total_votes * 100, 1) if total_votes else 0,
+        option_b_percentage=round(option_b_votes / total_votes * 100, 1) if total_votes else 0,
+    )
+
+
+@pytest.mark.parametrize("vote_count", [1_000, 100_000, 1_000_000])
+def test_tally_cost_is_constant_in_vote_count(fake_db, vote_count):
+    rng = random.Random(vote_count)
+    a_votes = sum(rng.random() < 0.6 for _ in range(vote_count))
+    counts = {"A": a_votes, "B": vote_count - a_votes}
+
+    # Old path: the whole votes column crosses the wire
+    started = time.perf_counter()
+    rows_body = json.dumps([{"choice": "A"}] * a_votes + [{"choice": "B"}] * counts["B"])
+    expected = _count_rows(BATTLE_ID, json.loads(rows_body))
+    rows_seconds = time.perf_counter() - started
+
+    # New path: one row from battles
+    tally_body = json.dumps({"vote_counts": counts})
+    fake_db.handler = lambda query: json.loads(tally_body)
+    started = time.perf_counter()
+    results = asyncio.run(server.get_battle_results_internal(BATTLE_ID))
+    tally_seconds = time.perf_counter() - started
+
+    print(f"\n{vote_count:>9} votes: rows {len(rows_body):>10} B {rows_seconds * 1000:8.1f}ms | "
+          f"tally {len(tally_body)} B {tally_seconds * 1000:.2f}ms")
+
+    assert results == expected
+    (query,) = fake_db.queries
+    assert query.table_name == "battles"
+    assert query.first("select") == ("vote_counts",)
+    assert len(tally_body) < 64
+    assert len(rows_body) > vote_count * 10
@@ -0,0 +1,129 @@
+"""Per-socket send queues in ConnectionManager.
+
+Broadcasts only enqueue; each socket's writer task drains its own queue, so
+a stalled client cannot hold back the others and is dropped once its queue
+overflows.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+import server
+
+
+class FakeSocket:
+    def __init__(self, stalled=False):
+        self.stalled = stalled
+        self.received = []
+        self.closed_with = None
+        self._never = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.stalled:
+            await self._never.wait()
+        self.received.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+class BrokenSocket(FakeSocket):
+    async def send_text(self, message):
+        raise ConnectionResetError("peer went away")
+
+
+@pytest.fixture
+def queue_size(monkeypatch):
+    monkeypatch.setattr(server, "WS_SEND_QUEUE_SIZE", 8)
+    return 8
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_broadcast_to_10k_sockets_with_stalled_viewers(queue_size):
+    battle_id = "battle-1"
+    frames = queue_size * 2
+
+    async def run():
+        manager = server.ConnectionManager()
+        sockets = [FakeSocket(stalled=(i % 1000 == 0)) for i in range(10_000)]
+        for socket in sockets:
+            await manager.accept(socket)
+            manager.subscribe(socket, [battle_id])
+
+        elapsed = 0.0
+        for n in range(frames):
+            started = time.perf_counter()
+            await manager.broadcast_to_battle(battle_id, {"type": "vote_update", "seq": n})
+            elapsed += time.perf_counter() - started
+            # Let the writers drain between frames, as votes arrive over time
+            await _settle()
+        await _settle()
+        return manager, sockets, elapsed
+
+    manager, sockets, elapsed = asyncio.run(run())
+    stalled = [s for s in sockets if s.stalled]
+    healthy = [s for s in sockets if not s.stalled]
+    print(f"\n{frames} frames to {len(sockets)} sockets in {elapsed * 1000:.0f}ms "
+          f"({elapsed / frames * 1000:.1f}ms per broadcast)")
+
+    assert all(len(s.received) == frames for s in healthy)
+    assert all(s.closed_with == 1013 for s in stalled)
+    assert manager.dropped_slow_consumers == len(stalled)
+    assert len(manager.active_connections[battle_id]) == len(healthy)
+    assert all(s not in manager.senders for s in stalled)
+
+
+def test_broadcast_does_not_wait_for_the_network(queue_size):
+    async def run():
+        manager = server.ConnectionManager()
+        socket = FakeSocket(stalled=True)
+        await manager.accept(socket)
+        manager.subscribe(socket, ["b"])
+        # Returns immediately even though the socket never completes a send
+        await asyncio.wait_for(manager.broadcast_to_battle("b", {"n": 1}), timeout=0.1)
+        return manager, socket
+
+    manager, socket = asyncio.run(run())
+    assert socket.received == []
+    assert socket in manager.senders and socket.closed_with is None
+
+
+def test_frames_keep_their_order_per_socket(queue_size):
+    async def run():
+        manager = server.ConnectionManager()
+        socket = FakeSocket()
+        await manager.accept(socket)
+        manager.subscribe(socket, ["b"])
+        manager.send(socket, {"type": "battle_state"})
+        for n in range(5):
+            await manager.broadcast_to_battle("b", {"seq": n})
+        await _settle()
+        return socket
+
+    socket = asyncio.run(run())
+    assert socket.received == ['{"type": "battle_state"}'] + [f'{{"seq": {n}}}' for n in range(5)]
+
+
+def test_failed_send_releases_the_connection(queue_size):
+    async def run():
+        manager = server.ConnectionManager()
+        socket = BrokenSocket()
+        await manager.accept(socket)
+        manager.subscribe(socket, ["a", "b"])
+        await manager.broadcast_to_battle("a", {"n": 1})
+        await _settle()
+        return manager, socket
+
+    manager, socket = asyncio.run(run())
+    assert manager.active_connections == {}
+    assert socket not in manager.senders and socket not in manager.subscriptions
+    assert socket.closed_with == 1013
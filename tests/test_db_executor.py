@@ -0,0 +1,107 @@
+"""db_execute keeps blocking PostgREST calls off the event loop.
+
+A mix of fast queries and a few slow ones is run both the old way (calling
+the sync `.execute()` inside the coroutine) and through db_execute, and the
+loop's responsiveness and overall throughput are compared.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import server
+
+SLOW_SECONDS = 0.05
+FAST_SECONDS = 0.001
+
+
+class BlockingQuery:
+    """Stands in for a supabase-py builder: execute() blocks the calling thread."""
+
+    active = 0
+    peak = 0
+    _lock = threading.Lock()
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def execute(self):
+        with BlockingQuery._lock:
+            BlockingQuery.active += 1
+            BlockingQuery.peak = max(BlockingQuery.peak, BlockingQuery.active)
+        try:
+            time.sleep(self.seconds)
+            return self.seconds
+        finally:
+            with BlockingQuery._lock:
+                BlockingQuery.active -= 1
+
+
+def _workload():
+    # 8 slow queries spread through 200 fast ones
+    return [BlockingQuery(SLOW_SECONDS if i % 25 == 0 else FAST_SECONDS) for i in range(200)]
+
+
+async def _run(queries, execute):
+    """Runs every query concurrently while a heartbeat measures loop stalls."""
+    worst_gap = 0.0
+    done = asyncio.Event()
+
+    async def heartbeat():
+        nonlocal worst_gap
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            worst_gap = max(worst_gap, now - last)
+            last = now
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await asyncio.gather(*(execute(q) for q in queries))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await beat
+    return elapsed, worst_gap
+
+
+async def _execute_inline(query):
+    return query.execute()
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="supabase-test")
+    monkeypatch.setattr(server, "db_executor", pool)
+    BlockingQuery.peak = 0
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_db_execute_beats_inline_calls_on_mixed_load(executor):
+    inline_elapsed, inline_gap = asyncio.run(_run(_workload(), _execute_inline))
+    pooled_elapsed, pooled_gap = asyncio.run(_run(_workload(), server.db_execute))
+
+    print(f"\ninline: {len(_workload()) / inline_elapsed:.0f} q/s, worst loop stall {inline_gap * 1000:.1f}ms")
+    print(f"pooled: {len(_workload()) / pooled_elapsed:.0f} q/s, worst loop stall {pooled_gap * 1000:.1f}ms")
+
+    # Inline, the loop is blocked for the whole batch; pooled it stays responsive
+    assert inline_gap >= 8 * SLOW_SECONDS
+    assert pooled_gap * 4 < inline_gap
+    assert pooled_elapsed * 2 < inline_elapsed
+
+
+def test_concurrency_is_bounded_by_the_executor(executor):
+    queries = [BlockingQuery(0.01) for _ in range(64)]
+
+    async def run():
+        return await asyncio.gather(*(server.db_execute(q) for q in queries))
+
+    results = asyncio.run(run())
+
+    assert results == [0.01] * 64
+    assert BlockingQuery.peak <= executor._max_workers
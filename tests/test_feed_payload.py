@@ -0,0 +1,86 @@
+"""Feed payload size versus engagement per post.
+
+The fake DB answers the way PostgREST would: embedded `(count)` relations
+come back as [{"count": n}] and a foreign-table limit trims the embedded
+comment preview. The old query embedded every like and comment row.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+
+import server
+
+PAGE = 20
+
+
+def _post(i):
+    return {
+        "id": str(uuid.uuid4()),
+        "author_id": str(uuid.uuid4()),
+        "content": f"post {i}",
+        "created_at": f"2026-01-01T00:{i:02d}:00+00:00",
+        "likes_count": 0,
+        "author": {"id": str(uuid.uuid4()), "username": f"user{i}"},
+    }
+
+
+def _comment(post_id, n):
+    return {"id": str(uuid.uuid4()), "post_id": post_id, "user_id": str(uuid.uuid4()),
+            "content": f"comment {n}", "created_at": "2026-01-01T00:00:00+00:00"}
+
+
+def _like(post_id):
+    return {"id": str(uuid.uuid4()), "post_id": post_id, "user_id": str(uuid.uuid4()),
+            "created_at": "2026-01-01T00:00:00+00:00"}
+
+
+def _old_payload(posts, engagement):
+    """What `likes:likes(*), comments:comments(*)` shipped per page."""
+    return json.dumps({"posts": [
+        {**p, "likes": [_like(p["id"]) for _ in range(engagement)],
+         "comments": [_comment(p["id"], n) for n in range(engagement)]}
+        for p in posts
+    ]})
+
+
+@pytest.mark.parametrize("engagement", [0, 100, 1_000, 5_000])
+def test_feed_payload_is_flat_in_engagement(fake_db, engagement):
+    posts = [_post(i) for i in range(PAGE)]
+
+    def handler(query):
+        if query.table_name == "likes":
+            return []
+        (select,) = query.first("select")
+        assert "likes(*)" not in select and "comments:comments(*)" not in select
+        preview = next(args[0] for name, args, kwargs in query.calls
+                       if name == "limit" and kwargs.get("foreign_table") == "comments_preview")
+        return [
+            {**p, "comment_totals": [{"count": engagement}],
+             "comments_preview": [_comment(p["id"], n) for n in range(min(engagement, preview))]}
+            for p in posts
+        ]
+
+    fake_db.handler = handler
+    started = time.perf_counter()
+    result = asyncio.run(server.get_posts(skip=0, limit=PAGE, current_user={"id": str(uuid.uuid4())}))
+    new_body = json.dumps(result)
+    new_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    old_body = _old_payload(posts, engagement)
+    old_seconds = time.perf_counter() - started
+
+    print(f"\n{engagement:>6} likes+comments/post: old {len(old_body):>11} B {old_seconds * 1000:8.1f}ms | "
+          f"new {len(new_body):>6} B {new_seconds * 1000:.2f}ms")
+
+    assert all(p["comments_count"] == engagement for p in result["posts"])
+    assert all(len(p["comments_preview"]) == min(engagement, server.FEED_COMMENT_PREVIEW) for p in result["posts"])
+    assert all(p["viewer_has_liked"] is False for p in result["posts"])
+    # Bounded by the preview size, whatever the engagement
+    assert len(new_body) < 40_000
+    if engagement:
+        assert len(old_body) > len(new_body) * engagement / 10
@@ -0,0 +1,79 @@
+"""Ranked feed scoring: engagement signals, decay and undated posts."""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import server
+
+NOW = datetime(2026, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _post(hours_ago=None, **counts):
+    created_at = (NOW - timedelta(hours=hours_ago)).isoformat() if hours_ago is not None else None
+    return {"id": str(uuid.uuid4()), "author_id": str(uuid.uuid4()), "created_at": created_at, **counts}
+
+
+def test_undated_posts_rank_last():
+    undated = _post(None, likes_count=1000)
+    old = _post(72)
+    fresh = _post(0.1)
+    ranked = server.rank_posts([undated, old, fresh], set(), NOW)
+    assert ranked == [fresh, old, undated]
+
+
+def test_future_timestamps_count_as_brand_new():
+    future = _post(-5)
+    hour_old = _post(1)
+    assert server.rank_posts([hour_old, future], set(), NOW) == [future, hour_old]
+
+
+def test_reposts_and_affinity_lift_a_post():
+    plain = _post(1)
+    reposted = _post(1, reposts_count=50)
+    followed = _post(1)
+    ranked = server.rank_posts([plain, followed, reposted], {followed["author_id"]}, NOW)
+    assert ranked == [reposted, followed, plain]
+
+
+def test_ranked_page_counts_reposts_from_post_relationships(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "ranked_feed_cache", server.TTLCache(maxsize=10, ttl=60))
+    quiet = _post(1)
+    viral = _post(1)
+    reposts = {viral["id"]: 40}
+
+    def handler(query):
+        if query.table_name == "user_follows":
+            return []
+        assert query.table_name == "posts"
+        (select,) = query.first("select")
+        assert "post_relationships" in select
+        assert ("reposts.relationship_type", "repost") in query.args("eq")
+        ids = query.first("in_")[1]
+        return [{"id": pid, "reposts": [{"count": reposts.get(pid, 0)}]} for pid in ids]
+
+    fake_db.handler = handler
+
+    async def load():
+        return [dict(quiet), dict(viral)]
+
+    page = asyncio.run(server.get_ranked_page(("t",), None, 0, 10, load))
+    assert [p["id"] for p in page] == [viral["id"], quiet["id"]]
+    assert [p["reposts_count"] for p in page] == [40, 0]
+
+
+def test_ranked_page_survives_missing_repost_counts(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "ranked_feed_cache", server.TTLCache(maxsize=10, ttl=60))
+    newer, older = _post(1), _post(5)
+
+    def handler(query):
+        raise RuntimeError("relationship not found")
+
+    fake_db.handler = handler
+
+    async def load():
+        return [dict(older), dict(newer)]
+
+    page = asyncio.run(server.get_ranked_page(("t",), None, 0, 10, load))
+    assert [p["id"] for p in page] == [newer["id"], older["id"]]
+    assert all(p["reposts_count"] == 0 for p in page)
@@ -0,0 +1,123 @@
+"""FollowGraph: CSR rows plus overlays against a brute-force edge set,
+rebuilds from user_follows, and memory / build-time figures."""
+
+import asyncio
+import random
+import time
+from collections import Counter
+
+import numpy as np
+
+import server
+
+
+def _edges(users, per_user, seed=4):
+    rng = random.Random(seed)
+    ids = [f"u{i}" for i in range(users)]
+    edges = set()
+    for a in ids:
+        for b in rng.sample(ids, per_user):
+            if a != b:
+                edges.add((a, b))
+    return ids, edges
+
+
+def _graph(ids, edges):
+    graph = server.FollowGraph()
+    index = {user_id: i for i, user_id in enumerate(ids)}
+    src = np.array([index[a] for a, _ in edges], dtype=np.int32)
+    dst = np.array([index[b] for _, b in edges], dtype=np.int32)
+    graph._swap(list(ids), index, graph._csr(src, dst, len(ids)), graph._csr(dst, src, len(ids)))
+    return graph
+
+
+def _fof(edges, user_id):
+    following = {b for a, b in edges if a == user_id}
+    reached = Counter(c for f in following for a, c in edges if a == f)
+    return {c: n for c, n in reached.items() if c not in following and c != user_id}
+
+
+def test_queries_match_the_edge_set_through_overlay_edits():
+    ids, edges = _edges(300, 12)
+    graph = _graph(ids, edges)
+    rng = random.Random(9)
+    for _ in range(400):
+        a, b = rng.sample(ids, 2)
+        following = rng.random() < 0.5
+        graph.set_edge(a, b, following)
+        (edges.add if following else edges.discard)((a, b))
+
+    for user_id in rng.sample(ids, 40):
+        followers = {a for a, b in edges if b == user_id}
+        following = {b for a, b in edges if a == user_id}
+        assert sorted(graph.mutuals(user_id)) == sorted(following & followers)
+        assert all(graph.follows(user_id, b) for b in following)
+        assert not any(graph.follows(user_id, b) for b in set(ids) - following)
+        assert dict(graph.friends_of_friends(user_id, len(ids))) == _fof(edges, user_id)
+        top = graph.friends_of_friends(user_id, 5)
+        assert [n for _, n in top] == sorted(_fof(edges, user_id).values(), reverse=True)[:5]
+
+    assert graph.mutuals("nobody") == [] and not graph.follows("nobody", ids[0])
+
+
+def test_celebrity_rows_take_the_lopsided_intersection():
+    ids = [f"u{i}" for i in range(20000)]
+    edges = {(a, "u0") for a in ids[1:]} | {("u0", b) for b in ids[1:40:3]}
+    graph = _graph(ids, edges)
+    assert sorted(graph.mutuals("u0")) == sorted(ids[1:40:3])
+
+
+def test_sampled_sources_are_stable_per_user():
+    ids = [f"u{i}" for i in range(3000)]
+    edges = {("u0", b) for b in ids[1:1200]} | {(a, ids[(i * 7) % 3000]) for i, a in enumerate(ids[1:1200], 1)}
+    graph = _graph(ids, edges)
+    first = graph.friends_of_friends("u0", 50)
+    assert len(first) == 50
+    assert all(graph.friends_of_friends("u0", 50) == first for _ in range(5))
+
+
+def test_rebuild_pages_by_id_and_replays_concurrent_follows(fake_db, keyset_table):
+    _, edges = _edges(500, 5)
+    rows = [{"id": f"{i:08d}", "follower_id": a, "following_id": b} for i, (a, b) in enumerate(sorted(edges))]
+    graph = server.FollowGraph()
+
+    def handler(query):
+        if len(fake_db.queries) == 1:
+            # A follow committed through this worker while the edges load
+            graph.set_edge("late", "u1", True)
+        return keyset_table(rows, query)
+
+    fake_db.handler = handler
+    asyncio.run(graph.rebuild())
+
+    assert graph.ready
+    assert len(fake_db.queries) == len(rows) // 1000 + 1
+    assert graph.edge_count == len(rows) + 1
+    assert graph.follows("late", "u1")
+    assert all(graph.follows(a, b) for a, b in list(edges)[:200])
+
+
+def test_memory_and_build_time():
+    rng = np.random.default_rng(0)
+    users, edges = 200_000, 2_000_000
+    src = rng.integers(0, users, edges, dtype=np.int32)
+    dst = rng.integers(0, users, edges, dtype=np.int32)
+    ids = [f"u{i}" for i in range(users)]
+    graph = server.FollowGraph()
+    started = time.perf_counter()
+    out_csr = graph._csr(src, dst, users)
+    in_csr = graph._csr(dst, src, users)
+    build = time.perf_counter() - started
+    graph._swap(ids, {user_id: i for i, user_id in enumerate(ids)}, out_csr, in_csr)
+
+    csr_bytes = sum(a.nbytes for a in (graph._out_ptr, graph._out, graph._in_ptr, graph._in))
+    per_edge = csr_bytes / edges
+    started = time.perf_counter()
+    for user_id in ids[:1000]:
+        graph.mutuals(user_id)
+        graph.friends_of_friends(user_id, 20)
+    per_query = (time.perf_counter() - started) / 2000
+    print(f"\nfollow graph 200k users / 2M edges: CSR build {build:.2f}s, "
+          f"{per_edge:.1f} bytes/edge, {per_query * 1e6:.0f}us per query")
+    assert per_edge < 12
+    assert per_query < 0.005
@@ -0,0 +1,115 @@
+"""HashtagIndex: sliding-window trending counts, per-tag post lists and the
+incremental refresh that folds in posts created through other workers."""
+
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+import server
+
+HOUR = 3600
+
+
+def _index():
+    return server.HashtagIndex(retention=72 * HOUR, bucket_seconds=300, max_posts_per_tag=1000,
+                               windows={"1h": HOUR, "24h": 24 * HOUR})
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _expected(posts, window, now, bucket_seconds=300):
+    """Brute force: a post counts while its whole bucket is inside the window."""
+    counts = Counter()
+    for ts, tags in posts:
+        bucket_start = ts - ts % bucket_seconds
+        if bucket_start + bucket_seconds > now - window:
+            counts.update(tags)
+    return counts
+
+
+def test_trending_matches_a_brute_force_count():
+    index = _index()
+    rng = random.Random(7)
+    tags = [f"tag{i}" for i in range(40)]
+    now = time.time()
+    posts = []
+    for _ in range(5000):
+        ts = now - rng.random() * 30 * HOUR
+        post_tags = set(rng.sample(tags, rng.randint(1, 3)))
+        posts.append((ts, post_tags))
+    # Insert out of order, as refreshes and late commits do
+    for ts, post_tags in rng.sample(posts, len(posts)):
+        index.add(str(uuid.uuid4()), post_tags, ts)
+
+    for window, seconds in index.windows.items():
+        expected = _expected(posts, seconds, time.time())
+        got = {row["tag"]: row["count"] for row in index.trending(window, len(tags))}
+        assert got == {tag: n for tag, n in expected.items() if n}
+
+
+def test_posts_for_is_newest_first_and_paged():
+    index = _index()
+    now = time.time()
+    ids = [f"p{i}" for i in range(10)]
+    for i, post_id in enumerate(ids):
+        index.add(post_id, {"cats"}, now - (10 - i) * 60)
+    assert index.posts_for("#Cats", 4) == ["p9", "p8", "p7", "p6"]
+    assert index.posts_for("cats", 4, cursor=8) == ["p1", "p0"]
+    assert index.posts_for("dogs", 4) == []
+
+
+def test_refresh_folds_in_other_workers_posts_once(fake_db, keyset_table):
+    index = _index()
+    now = time.time()
+    rows = [
+        {"id": str(uuid.uuid4()), "content": f"hello #t{i % 3}", "hashtags": [], "created_at": _iso(now - 600 + i * 0.1)}
+        for i in range(2500)
+    ]
+    fake_db.handler = lambda query: keyset_table(rows, query)
+
+    # One of them was created through this worker and is already indexed
+    index.add(rows[0]["id"], {"t0"}, now - 600)
+    assert asyncio.run(index.refresh()) == 2499
+    # Pages are keyset scans, never offsets
+    assert all(not q.args("range") for q in fake_db.queries)
+    assert len(fake_db.queries) == 3
+
+    # A later refresh re-reads only the overlap and counts nothing twice
+    rows.append({"id": str(uuid.uuid4()), "content": "#t0 again", "hashtags": ["extra"], "created_at": _iso(now)})
+    fake_db.queries.clear()
+    assert asyncio.run(index.refresh()) == 1
+    (query,) = fake_db.queries
+    (_, since), = query.args("gte")
+    assert since >= _iso(now - 600 + 2499 * 0.1 - index.refresh_overlap)
+
+    totals = {row["tag"]: row["count"] for row in index.trending("1h", 10)}
+    assert totals == {"t0": 835, "t1": 833, "t2": 833, "extra": 1}
+
+
+def test_prune_drops_expired_posts_and_seen_ids():
+    index = _index()
+    now = time.time()
+    index.add("old", {"x"}, now - 80 * HOUR)
+    index.add("new", {"x"}, now)
+    index.prune(now)
+    assert index.posts_for("x", 10) == ["new"]
+    assert list(index._seen) == ["new"]
+
+
+def test_trending_read_cost(capsys):
+    index = _index()
+    rng = random.Random(1)
+    now = time.time()
+    for i in range(100_000):
+        index.add(str(i), {f"tag{rng.randint(0, 5000)}"}, now - rng.random() * 24 * HOUR)
+    started = time.perf_counter()
+    for _ in range(100):
+        index.trending("24h", 20)
+    per_read = (time.perf_counter() - started) / 100
+    print(f"\ntrending(24h, 20) over 100k posts / 5k tags: {per_read * 1e6:.0f}us")
+    assert per_read < 0.05
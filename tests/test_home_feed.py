@@ -0,0 +1,49 @@
+"""GET /posts/feed/{user_id}: owner-only access and the enriched
+get_home_timeline rows the frontend renders."""
+
+import asyncio
+import uuid
+
+import pytest
+
+import server
+
+VIEWER = {"id": str(uuid.uuid4())}
+
+
+def _row(post_id, likes=0):
+    return {"id": post_id, "post_id": post_id, "author_id": str(uuid.uuid4()), "username": "ann",
+            "full_name": "Ann", "avatar_url": None, "content": "hi", "media_urls": [], "hashtags": [],
+            "likes_count": likes, "comments_count": 0, "quote_count": 0, "mention_count": 0,
+            "created_at": "2026-01-01T00:00:00+00:00", "is_liked": False, "post_type": "post"}
+
+
+@pytest.fixture
+def counter(monkeypatch):
+    counter = server.LikeCounter(flush_interval=60)
+    monkeypatch.setattr(server, "like_counter", counter)
+    return counter
+
+
+def test_other_users_timelines_are_forbidden(fake_db):
+    with pytest.raises(server.HTTPException) as err:
+        asyncio.run(server.get_user_feed(str(uuid.uuid4()), current_user=VIEWER))
+    assert err.value.status_code == 403
+    assert fake_db.queries == []
+
+
+def test_timeline_rows_carry_profile_fields_and_pending_likes(fake_db, counter):
+    post_id = str(uuid.uuid4())
+    counter.add(post_id, 2)
+
+    def handler(query):
+        assert query.rpc_name == "get_home_timeline"
+        assert query.params == {"viewer_uuid": VIEWER["id"], "limit_count": 20, "offset_count": 0}
+        return [_row(post_id, likes=5)]
+
+    fake_db.handler = handler
+    result = asyncio.run(server.get_user_feed(VIEWER["id"], current_user=VIEWER))
+
+    (post,) = result["posts"]
+    assert post["likes_count"] == 7
+    assert {"username", "full_name", "avatar_url", "is_liked", "quote_count"} <= post.keys()
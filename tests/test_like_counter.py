@@ -0,0 +1,166 @@
+"""Concurrent like/unlike toggles through _add_like/_remove_like with the
+LikeCounter flushing in between. The emulated likes table enforces
+(post_id, user_id) uniqueness and returns only rows a statement actually
+changed, like PostgREST does.
+"""
+
+import asyncio
+import random
+import uuid
+
+import pytest
+
+import server
+
+POSTS = [str(uuid.uuid4()) for _ in range(5)]
+
+
+class LikeStore:
+    def __init__(self):
+        self.likes = set()
+        self.likes_count = {post_id: 0 for post_id in POSTS}
+        self.flush_failures = 0
+        self.reconciles = []
+        self.events = []
+
+    def handler(self, query):
+        if query.rpc_name == "touch_post_like_activity":
+            self.events.extend(("touch", post_id) for post_id in query.params["post_ids"])
+            return None
+        if query.rpc_name == "apply_post_like_deltas":
+            if self.flush_failures:
+                self.flush_failures -= 1
+                raise RuntimeError("connection reset")
+            for post_id, delta in query.params["deltas"].items():
+                self.likes_count[post_id] = max(self.likes_count[post_id] + delta, 0)
+            return len(query.params["deltas"])
+        if query.rpc_name == "reconcile_post_likes_counts":
+            self.reconciles.append(query.params)
+            return 0
+        assert query.table_name == "likes"
+        if query.first("upsert"):
+            (row,) = query.first("upsert")
+            key = (row["post_id"], row["user_id"])
+            if key in self.likes:
+                return []
+            self.likes.add(key)
+            self.events.append(("write", row["post_id"]))
+            return [row]
+        filters = dict(query.args("eq"))
+        key = (filters["post_id"], filters["user_id"])
+        if key not in self.likes:
+            return []
+        self.likes.remove(key)
+        self.events.append(("write", key[0]))
+        return [{"post_id": key[0], "user_id": key[1]}]
+
+    def actual(self, post_id):
+        return sum(1 for p, _ in self.likes if p == post_id)
+
+
+@pytest.fixture
+def store(fake_db, no_notifications, monkeypatch):
+    store = LikeStore()
+    fake_db.handler = store.handler
+    monkeypatch.setattr(server, "like_counter", server.LikeCounter(flush_interval=0.001))
+    return store
+
+
+async def _toggle_storm(users, rounds):
+    async def user_session(user_id):
+        for _ in range(rounds):
+            post_id = random.choice(POSTS)
+            action = random.choice(("put", "delete", "toggle"))
+            current_user = {"id": user_id}
+            if action == "put":
+                await server.put_like(post_id, current_user=current_user)
+            elif action == "delete":
+                await server.delete_like(post_id, current_user=current_user)
+            else:
+                await server.like_post(post_id, current_user=current_user)
+
+    await asyncio.gather(*(user_session(u) for u in users))
+
+
+def test_concurrent_toggles_keep_likes_count_exact(store):
+    users = [str(uuid.uuid4()) for _ in range(300)]
+
+    async def run():
+        server.like_counter.start()
+        await _toggle_storm(users, rounds=20)
+        await server.like_counter.stop()
+
+    asyncio.run(run())
+
+    assert store.likes, "the storm should leave some likes behind"
+    for post_id in POSTS:
+        assert store.likes_count[post_id] == store.actual(post_id)
+    assert server.like_counter.deltas == {}
+
+
+def test_reads_overlay_pending_deltas(store):
+    users = [str(uuid.uuid4()) for _ in range(50)]
+    asyncio.run(_toggle_storm(users, rounds=10))
+
+    for post_id in POSTS:
+        assert store.likes_count[post_id] + server.like_counter.pending(post_id) == store.actual(post_id)
+
+
+def test_failed_flush_keeps_deltas_for_the_next_one(store):
+    users = [str(uuid.uuid4()) for _ in range(100)]
+
+    async def run():
+        await _toggle_storm(users, rounds=5)
+        store.flush_failures = 1
+        await server.like_counter.flush()
+        assert store.likes_count == {post_id: 0 for post_id in POSTS}
+        # Activity between the failed and the next flush folds into the same deltas
+        await _toggle_storm(users, rounds=5)
+        await server.like_counter.flush()
+
+    asyncio.run(run())
+
+    for post_id in POSTS:
+        assert store.likes_count[post_id] == store.actual(post_id)
+
+
+def test_reconcile_flushes_before_recounting(store, monkeypatch):
+    monkeypatch.setattr(server, "LIKE_COUNTS_RECONCILE_SECONDS", 0)
+    server.like_counter.add(POSTS[0], 3)
+
+    async def run():
+        task = asyncio.create_task(server.reconcile_like_counts_periodically())
+        while not store.reconciles:
+            await asyncio.sleep(0)
+        task.cancel()
+
+    asyncio.run(run())
+
+    assert store.likes_count[POSTS[0]] == 3
+    assert store.reconciles[0] == {"settle_seconds": server.LIKE_COUNTS_SETTLE_SECONDS}
+
+
+def test_posts_are_touched_before_their_likes_change(store):
+    users = [str(uuid.uuid4()) for _ in range(20)]
+    asyncio.run(_toggle_storm(users, rounds=10))
+
+    writes = [i for i, (kind, _) in enumerate(store.events) if kind == "write"]
+    for i in writes:
+        post_id = store.events[i][1]
+        assert ("touch", post_id) in store.events[:i]
+    # Toggles after the first touch of a post within the interval skip it
+    touches = [post_id for kind, post_id in store.events if kind == "touch"]
+    assert len(touches) < len(writes) // 2
+
+
+def test_touches_repeat_once_the_interval_passes(store):
+    counter = server.like_counter
+    asyncio.run(server.put_like(POSTS[0], current_user={"id": "a"}))
+    counter._touched[POSTS[0]] -= counter.touch_interval
+    asyncio.run(server.delete_like(POSTS[0], current_user={"id": "a"}))
+    assert store.events == [("touch", POSTS[0]), ("write", POSTS[0])] * 2
+
+
+def test_settle_window_outlasts_touch_and_flush():
+    counter = server.like_counter
+    assert server.LIKE_COUNTS_SETTLE_SECONDS > counter.touch_interval + counter.flush_interval
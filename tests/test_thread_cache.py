@@ -0,0 +1,130 @@
+"""ThreadCache: in-place reply appends, LRU bounds and TTL refetches through
+GET /posts/{id}/thread.
+
+The fake RPC walks a posts table and its reply edges in post_relationships
+the way get_post_thread does, returning the function's row shape: post_id,
+parent_post_id and thread_level, with no id column.
+"""
+
+import asyncio
+
+import pytest
+
+import server
+
+
+class ThreadStore:
+    def __init__(self):
+        self.posts = {}
+        self.replies = []  # (parent_post_id, child_post_id)
+
+    def add(self, post_id, parent_id=None, minute=0):
+        self.posts[post_id] = {"author_id": "author", "content": post_id, "media_urls": [], "hashtags": [],
+                               "likes_count": 0, "comments_count": 0,
+                               "created_at": f"2026-01-01T00:{minute:02d}:00+00:00"}
+        if parent_id:
+            self.replies.append((parent_id, post_id))
+
+    def get_post_thread(self, post_uuid):
+        rows, frontier, level = [], [(post_uuid, None)], 0
+        while frontier:
+            level_rows = [{"post_id": post_id, "parent_post_id": parent_id, **self.posts[post_id],
+                           "thread_level": level}
+                          for post_id, parent_id in frontier if post_id in self.posts]
+            rows.extend(sorted(level_rows, key=lambda r: r["created_at"]))
+            frontier = [(child, parent) for parent, child in self.replies if parent in {r["post_id"] for r in level_rows}]
+            level += 1
+        return rows
+
+    def handler(self, query):
+        assert query.rpc_name == "get_post_thread"
+        return self.get_post_thread(query.params["post_uuid"])
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = server.ThreadCache(max_nodes=100, ttl=60)
+    monkeypatch.setattr(server, "thread_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def store(fake_db):
+    store = ThreadStore()
+    store.add("root")
+    store.add("a", "root", 1)
+    store.add("b", "root", 2)
+    store.add("a1", "a", 3)
+    fake_db.handler = store.handler
+    return store
+
+
+def _thread(post_id="root"):
+    return asyncio.run(server.get_post_thread(post_id, depth=3, limit=20, cursor=0))["thread"]
+
+
+def _ids(node):
+    return [node["post_id"]] + [i for child in node["replies"] for i in _ids(child)]
+
+
+def test_rpc_rows_are_cached_as_a_tree(cache, store, fake_db):
+    thread = _thread()
+    assert _ids(thread) == ["root", "a", "a1", "b"]
+    assert thread["reply_count"] == 2
+    assert thread["replies"][0]["replies"][0]["thread_level"] == 2
+    # Any node inside the cached tree is served from it
+    assert _ids(_thread("a")) == ["a", "a1"]
+    assert len(fake_db.queries) == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_appended_replies_are_served_without_a_refetch(cache, store, fake_db):
+    _thread()
+    cache.append_reply("b", {"post_id": "b1", "parent_post_id": "b", "content": "b1",
+                             "created_at": "2026-01-01T00:04:00+00:00"})
+    thread = _thread()
+    assert _ids(thread) == ["root", "a", "a1", "b", "b1"]
+    assert thread["replies"][1]["replies"][0]["thread_level"] == 2
+    assert len(fake_db.queries) == 1
+
+
+def test_stale_threads_are_refetched(cache, store, fake_db):
+    _thread()
+    # A reply created through another worker never reached this cache
+    store.add("c", "root", 5)
+    assert "c" not in _ids(_thread())
+
+    cache._loaded_at["root"] -= cache.ttl + 1
+    assert _ids(_thread()) == ["root", "a", "a1", "b", "c"]
+    assert len(fake_db.queries) == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_rows_without_reply_edges_are_not_cached(cache, fake_db):
+    # A database still on the old get_post_thread (no parent_post_id column)
+    fake_db.handler = lambda query: [{"post_id": "root", "thread_level": 0}, {"post_id": "a", "thread_level": 1}]
+    assert _thread() == fake_db.handler(None)
+    assert not cache.contains("root")
+
+
+def test_probes_do_not_count_as_lookups(cache, store):
+    assert not cache.contains("root")
+    _thread()
+    assert cache.contains("a")
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 0
+
+
+def test_least_recently_used_threads_are_evicted():
+    store = ThreadStore()
+    for root in ("t1", "t2", "t3"):
+        store.add(root)
+        store.add(f"{root}a", root, 1)
+        store.add(f"{root}b", root, 2)
+    cache = server.ThreadCache(max_nodes=8, ttl=60)
+    cache.load("t1", store.get_post_thread("t1"))
+    cache.load("t2", store.get_post_thread("t2"))
+    assert cache.lookup("t1a")
+    cache.load("t3", store.get_post_thread("t3"))
+    assert cache.contains("t1") and cache.contains("t3")
+    assert not cache.contains("t2")
+    assert cache.stats()["nodes"] == 6
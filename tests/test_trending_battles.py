@@ -0,0 +1,131 @@
+"""TrendingBattles: decayed vote velocity, rebasing, the LIVE-only replay
+from the votes table and the /battles/trending endpoint."""
+
+import asyncio
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+
+import server
+
+HALF_LIFE = 3600
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _brute_force(votes, now, half_life):
+    scores = {}
+    for battle_id, ts in votes:
+        scores[battle_id] = scores.get(battle_id, 0.0) + math.exp(-math.log(2) / half_life * (now - ts))
+    return scores
+
+
+def test_recent_votes_outrank_older_bursts():
+    trending = server.TrendingBattles(half_life=HALF_LIFE, min_score=0.01)
+    now = time.time()
+    for i in range(100):
+        trending.record("old-burst", now - 4 * HALF_LIFE, voter_id=f"u{i}")
+    for i in range(20):
+        trending.record("steady", now - i * 60, voter_id=f"u{i}")
+    # 100 votes 4 half-lives ago ~ 6.25 fresh votes
+    assert [battle_id for battle_id, _ in trending.top(2)] == ["steady", "old-burst"]
+    # The same voter never counts twice for a battle
+    key = trending._keys["steady"]
+    trending.record("steady", now, voter_id="u0")
+    assert trending._keys["steady"] == key
+    assert len(trending._seen) == 120
+
+
+def test_seen_voters_are_bounded(monkeypatch):
+    monkeypatch.setattr(server.TrendingBattles, "SEEN_LIMIT", 50)
+    trending = server.TrendingBattles(half_life=HALF_LIFE, min_score=0.01)
+    now = time.time()
+    for i in range(200):
+        trending.record("busy", now, voter_id=f"u{i}")
+    assert len(trending._seen) == 50
+    assert next(iter(trending._seen)) == ("busy", "u150")
+
+
+def test_ranking_survives_rebases():
+    trending = server.TrendingBattles(half_life=60, min_score=1e-9)
+    rng = random.Random(3)
+    start = time.time() - 3600
+    votes = []
+    # 60 half-lives of traffic forces several rebases
+    for i in range(3000):
+        ts = start + i * 1.2
+        battle_id = f"b{rng.randint(0, 30)}"
+        votes.append((battle_id, ts))
+        trending.record(battle_id, ts)
+    now = start + 3000 * 1.2
+    expected = sorted(_brute_force(votes, now, 60).items(), key=lambda kv: -kv[1])[:10]
+    assert [battle_id for battle_id, _ in trending.top(10)] == [battle_id for battle_id, _ in expected]
+
+
+def test_refresh_replays_live_battles_once(fake_db, keyset_table):
+    trending = server.TrendingBattles(half_life=HALF_LIFE, min_score=0.01)
+    now = time.time()
+    live, ended = str(uuid.uuid4()), str(uuid.uuid4())
+    status = {live: "LIVE", ended: "ENDED"}
+    rows = [
+        {"id": str(uuid.uuid4()), "battle_id": live if i % 2 else ended, "user_id": f"u{i}",
+         "created_at": _iso(now - 300 + i * 0.1)}
+        for i in range(2400)
+    ]
+
+    def handler(query):
+        assert ("battle.status", "LIVE") in query.args("eq")
+        (select,) = query.first("select")
+        assert "!inner(status)" in select
+        return keyset_table([r for r in rows if status[r["battle_id"]] == "LIVE"], query)
+
+    fake_db.handler = handler
+    # One live vote was cast through this worker already
+    trending.record(live, now - 300 + 0.1, voter_id="u1")
+
+    assert asyncio.run(trending.refresh()) == 1199
+    assert all(not q.args("range") for q in fake_db.queries)
+    assert [battle_id for battle_id, _ in trending.top(5)] == [live]
+    assert asyncio.run(trending.refresh()) == 0
+
+
+def test_endpoint_only_returns_live_battles(fake_db, monkeypatch):
+    trending = server.TrendingBattles(half_life=HALF_LIFE, min_score=0.01)
+    monkeypatch.setattr(server, "trending_battles", trending)
+    now = time.time()
+    ids = [str(uuid.uuid4()) for _ in range(4)]
+    for rank, battle_id in enumerate(ids):
+        for v in range(10 - rank):
+            trending.record(battle_id, now, voter_id=f"u{v}")
+    ended = ids[0]
+
+    def handler(query):
+        assert ("status", "LIVE") in query.args("eq")
+        (_, wanted), = query.args("in_")
+        return [{"id": battle_id, "status": "LIVE"} for battle_id in wanted if battle_id != ended]
+
+    fake_db.handler = handler
+    result = asyncio.run(server.get_trending_battles(limit=2))
+
+    assert [b["id"] for b in result["battles"]] == ids[1:3]
+    assert all(b["vote_velocity"] > 0 for b in result["battles"])
+    # Battles found to be over are dropped from the index
+    assert ended not in trending._keys
+
+
+def test_top_k_cost():
+    trending = server.TrendingBattles(half_life=HALF_LIFE, min_score=0.01)
+    rng = random.Random(5)
+    now = time.time()
+    for i in range(200_000):
+        trending.record(f"b{rng.randint(0, 10_000)}", now - rng.random() * HALF_LIFE)
+    started = time.perf_counter()
+    for _ in range(1000):
+        trending.top(20)
+    per_read = (time.perf_counter() - started) / 1000
+    print(f"\ntop(20) over {len(trending)} battles: {per_read * 1e6:.0f}us")
+    assert per_read < 0.005
@@ -0,0 +1,103 @@
+"""UserSearchIndex: trigram search and autocomplete against a brute-force
+ilike, in-place edits, and keyset-paged loads from the profiles table."""
+
+import asyncio
+import random
+import string
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import server
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _profile(i, username, full_name, updated=None):
+    created_at = (START + timedelta(seconds=i)).isoformat()
+    return {"id": str(uuid.uuid4()), "username": username, "full_name": full_name, "avatar_url": None,
+            "created_at": created_at, "updated_at": updated or created_at}
+
+
+def _profiles(n, seed=11):
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 7))) for _ in range(400)]
+    return [_profile(i, f"{rng.choice(words)}{i}", f"{rng.choice(words).title()} {rng.choice(words).title()}")
+            for i in range(n)]
+
+
+def _brute_force(profiles, q, limit):
+    q = q.strip().lower()
+    matches = [p for p in reversed(profiles) if q in p["username"].lower() or q in p["full_name"].lower()]
+    return [p["id"] for p in matches[:limit]]
+
+
+def test_search_matches_ilike_newest_first():
+    profiles = _profiles(5000)
+    index = server.UserSearchIndex()
+    index.load(profiles)
+    rng = random.Random(2)
+    for _ in range(200):
+        sample = rng.choice(profiles)
+        text = rng.choice((sample["username"], sample["full_name"]))
+        start = rng.randint(0, max(len(text) - 3, 0))
+        q = text[start:start + rng.randint(3, 5)].strip()
+        if len(q) < 3:
+            continue
+        assert index.search(q, 20) == _brute_force(profiles, q, 20)
+    assert index.search("ab", 20) is None
+
+
+def test_edits_keep_the_slot_and_drop_stale_keys():
+    profiles = _profiles(200)
+    index = server.UserSearchIndex()
+    index.load(profiles)
+    renamed = dict(profiles[10], username="zebracrossing", full_name="Zed Crossing")
+    index.upsert(renamed)
+    profiles[10] = renamed
+
+    assert index.search("ebracro", 5) == [renamed["id"]]
+    assert [u["id"] for u in index.autocomplete("zebra", 5)] == [renamed["id"]]
+    old_username = _profiles(200)[10]["username"]
+    assert renamed["id"] not in [u["id"] for u in index.autocomplete(old_username, 5)]
+    assert len(index) == 200
+
+
+def test_rebuild_and_refresh_page_by_keyset(fake_db, keyset_table):
+    profiles = _profiles(2500)
+    fake_db.handler = lambda query: keyset_table(profiles, query)
+    index = server.UserSearchIndex()
+
+    asyncio.run(index.rebuild())
+    assert len(index) == 2500
+    assert all(not q.args("range") for q in fake_db.queries)
+    assert [q.first("order") for q in fake_db.queries] == [("created_at",)] * 3
+
+    # Later edits are read back in (updated_at, id) order from the last sync
+    index._synced_at = profiles[-1]["updated_at"]
+    later = (START + timedelta(days=1)).isoformat()
+    for p in profiles[:1200]:
+        p["full_name"] = "Renamed Person"
+        p["updated_at"] = later
+    fake_db.queries.clear()
+    asyncio.run(index.refresh())
+
+    assert [q.first("order") for q in fake_db.queries] == [("updated_at",)] * 2
+    assert index._synced_at == later
+    assert len(index.search("renamed", 2000)) == 1200
+    assert len(index) == 2500
+
+
+def test_search_cost():
+    profiles = _profiles(100_000)
+    index = server.UserSearchIndex()
+    started = time.perf_counter()
+    index.load(profiles)
+    build = time.perf_counter() - started
+    started = time.perf_counter()
+    for q in ("ann", "son1", "ert", "99"):
+        index.search(q, 20)
+        index.autocomplete(q, 10)
+    per_query = (time.perf_counter() - started) / 8
+    print(f"\nuser index over 100k profiles: build {build:.2f}s, {per_query * 1e3:.2f}ms per query")
+    assert per_query < 0.05
@@ -0,0 +1,241 @@
+"""Write-behind vote buffer: batching, retries of failed flushes, rejected
+rows, and the up-front battle and voter checks on the buffered vote_battle
+path."""
+
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+BATTLE_ID = str(uuid.uuid4())
+
+
+class BatchStore:
+    """Emulates the battles and votes tables and cast_battle_votes_batch;
+    `fail` makes the next N batch calls raise."""
+
+    def __init__(self, keyset_table):
+        self.votes = {}
+        self.status = {BATTLE_ID: "LIVE"}
+        self.fail = 0
+        self.calls = []
+        self.keyset_table = keyset_table
+
+    def store_vote(self, battle_id, user_id, choice):
+        self.votes[(battle_id, user_id)] = choice
+
+    def handler(self, query):
+        if query.table_name == "battles":
+            battle_id = query.first("eq")[1]
+            if battle_id not in self.status:
+                return None
+            return {"id": battle_id, "status": self.status[battle_id], "end_time": None}
+        if query.table_name == "votes":
+            filters = dict(query.args("eq"))
+            rows = [{"id": f"{i:08d}", "battle_id": battle_id, "user_id": user_id,
+                     "created_at": "2026-01-01T00:00:00+00:00"}
+                    for i, ((battle_id, user_id), _) in enumerate(self.votes.items())
+                    if battle_id == filters["battle_id"] and filters.get("user_id", user_id) == user_id]
+            return rows[:1] if "user_id" in filters else self.keyset_table(rows, query)
+        assert query.rpc_name == "cast_battle_votes_batch"
+        battle_id = query.params["battle_uuid"]
+        batch = query.params["batch"]
+        self.calls.append([v["user_id"] for v in batch])
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("connection reset")
+        if self.status.get(battle_id) != "LIVE":
+            return {"inserted": 0, "error": "closed" if battle_id in self.status else "not_found",
+                    "rejected": [v["user_id"] for v in batch]}
+        inserted, rejected = [], []
+        for v in batch:
+            if (battle_id, v["user_id"]) in self.votes:
+                rejected.append(v["user_id"])
+            else:
+                self.store_vote(battle_id, v["user_id"], v["choice"])
+                inserted.append(v["user_id"])
+        return {"inserted": len(inserted), "inserted_ids": inserted, "rejected": rejected,
+                "vote_counts": {}, "creator_id": None}
+
+
+@pytest.fixture
+def store(fake_db, no_notifications, keyset_table, monkeypatch):
+    store = BatchStore(keyset_table)
+    fake_db.handler = store.handler
+    monkeypatch.setattr(server, "vote_updates", server.VoteUpdateCoalescer(server.ConnectionManager(), max_hz=4))
+    return store
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    buffer = server.VoteBuffer(max_batch=100, flush_interval=0.001, max_attempts=3)
+    monkeypatch.setattr(server, "vote_buffer", buffer)
+    monkeypatch.setattr(server, "known_battles", server.TTLCache(maxsize=10, ttl=60))
+    monkeypatch.setattr(server, "battle_voters", server.TTLCache(maxsize=10, ttl=60))
+    return buffer
+
+
+async def _vote(battle_id, user_id, choice="A"):
+    try:
+        return await server.vote_battle(battle_id, {"choice": choice}, current_user={"id": user_id})
+    except HTTPException as e:
+        return e
+
+
+def _users(n):
+    return [str(uuid.uuid4()) for _ in range(n)]
+
+
+def test_batches_are_written_once_per_battle(store, buffer):
+    users = _users(50)
+    for user_id in users:
+        assert buffer.add(BATTLE_ID, user_id, "A") is not None
+    assert buffer.add(BATTLE_ID, users[0], "B") is None
+
+    asyncio.run(buffer.flush_all())
+
+    assert store.calls == [users]
+    assert buffer.flushed_votes == 50
+    assert buffer.pending == {}
+
+
+def test_failed_batch_is_retried_without_absorbing_new_votes(store, buffer):
+    first, second = _users(3), _users(2)
+    for user_id in first:
+        buffer.add(BATTLE_ID, user_id, "A")
+    store.fail = 1
+
+    async def run():
+        await buffer.flush_all()
+        assert BATTLE_ID in buffer.retrying
+        # Still counted as pending for duplicate checks and my_vote
+        assert buffer.add(BATTLE_ID, first[0], "B") is None
+        assert buffer.pending_vote(BATTLE_ID, first[1])["choice"] == "A"
+        for user_id in second:
+            buffer.add(BATTLE_ID, user_id, "B")
+        # Backoff not elapsed yet: nothing is sent
+        await buffer.flush_all()
+        assert len(store.calls) == 1
+        await asyncio.sleep(buffer.flush_interval * 2)
+        await buffer.flush_all()
+
+    asyncio.run(run())
+
+    # The parked batch is resent as-is, then the new votes go in their own batch
+    assert store.calls == [first, first, second]
+    assert buffer.retrying == {} and buffer.pending == {}
+    assert len(store.votes) == 5
+
+
+def test_batch_is_dropped_after_max_attempts(store, buffer):
+    users = _users(4)
+    for user_id in users:
+        buffer.add(BATTLE_ID, user_id, "A")
+    store.fail = 100
+
+    async def run():
+        for _ in range(buffer.max_attempts):
+            await buffer.flush_all(force=True)
+        await buffer.flush_all(force=True)
+
+    asyncio.run(run())
+
+    assert len(store.calls) == buffer.max_attempts
+    assert buffer.retrying == {} and buffer.pending == {}
+    assert buffer.dropped_votes == 4
+    assert store.votes == {}
+
+
+def test_stop_drains_parked_batches(store, buffer):
+    users = _users(2)
+    for user_id in users:
+        buffer.add(BATTLE_ID, user_id, "B")
+    store.fail = 1
+
+    async def run():
+        await buffer.flush_all()
+        await buffer.stop()
+
+    asyncio.run(run())
+
+    assert len(store.votes) == 2
+    assert buffer.retrying == {} and buffer.dropped_votes == 0
+
+
+def test_buffered_vote_rejects_malformed_unknown_and_closed_battles(store, buffer, fake_db):
+    user_id = str(uuid.uuid4())
+
+    malformed = asyncio.run(_vote("not-a-battle", user_id))
+    assert malformed.status_code == 400
+    assert fake_db.queries == []
+
+    unknown = asyncio.run(_vote(str(uuid.uuid4()), user_id))
+    assert unknown.status_code == 404
+
+    ended = str(uuid.uuid4())
+    store.status[ended] = "ENDED"
+    closed = asyncio.run(_vote(ended, user_id))
+    assert closed.status_code == 400
+    assert buffer.pending == {}
+
+    accepted = asyncio.run(_vote(BATTLE_ID.upper(), user_id))
+    assert accepted["queued"] is True
+    assert buffer.pending_vote(BATTLE_ID, user_id) is not None
+    # Status and voters are cached for hot battles
+    lookups = len(fake_db.queries)
+    asyncio.run(_vote(BATTLE_ID, str(uuid.uuid4())))
+    assert len(fake_db.queries) == lookups
+
+
+def test_stored_votes_are_refused_before_the_ack(store, buffer):
+    earlier, flushed, fresh = _users(3)
+    store.store_vote(BATTLE_ID, earlier, "B")
+
+    async def run():
+        assert (await _vote(BATTLE_ID, earlier)).status_code == 400
+        assert (await _vote(BATTLE_ID, flushed))["queued"] is True
+        await buffer.flush_all()
+        # Flushed votes join the seeded voter set
+        assert (await _vote(BATTLE_ID, flushed)).status_code == 400
+        assert (await _vote(BATTLE_ID, fresh))["queued"] is True
+
+    asyncio.run(run())
+    assert buffer.rejected_votes == 0
+
+
+def test_large_battles_check_voters_one_at_a_time(store, buffer, fake_db, monkeypatch):
+    monkeypatch.setattr(server, "VOTER_SEED_MAX", 2)
+    voters = _users(3)
+    for user_id in voters:
+        store.store_vote(BATTLE_ID, user_id, "A")
+
+    assert asyncio.run(_vote(BATTLE_ID, voters[0])).status_code == 400
+    fake_db.queries.clear()
+    assert asyncio.run(_vote(BATTLE_ID, str(uuid.uuid4())))["queued"] is True
+    (lookup,) = fake_db.queries
+    assert lookup.table_name == "votes" and len(lookup.args("eq")) == 2
+
+
+def test_rows_the_batch_refuses_are_reported(store, buffer, caplog):
+    users = _users(4)
+    for user_id in users:
+        asyncio.run(_vote(BATTLE_ID, user_id))
+    # Another worker stored one of these voters' votes after the seed
+    store.store_vote(BATTLE_ID, users[0], "B")
+
+    asyncio.run(buffer.flush_all())
+    assert buffer.flushed_votes == 3 and buffer.rejected_votes == 1
+    assert users[0] in caplog.text
+
+    # The battle ends before the next batch is written
+    late = _users(2)
+    for user_id in late:
+        asyncio.run(_vote(BATTLE_ID, user_id))
+    store.status[BATTLE_ID] = "ENDED"
+    asyncio.run(buffer.flush_all())
+    assert buffer.rejected_votes == 3
+    assert "closed" in caplog.text
+    assert server.known_battles.get(BATTLE_ID) is None
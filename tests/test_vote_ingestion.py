@@ -0,0 +1,118 @@
+"""Concurrent vote ingestion through vote_battle.
+
+cast_battle_vote is emulated with the same contract as the SQL function: only
+LIVE battles take votes, the unique (battle_id, user_id) insert and the tally
+bump happen atomically, and the call returns the new counts. Thousands of interleaved requests must leave
+exact tallies and reject every second vote from the same user.
+"""
+
+import asyncio
+import random
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+BATTLE_ID = str(uuid.uuid4())
+CREATOR_ID = str(uuid.uuid4())
+
+
+class VoteStore:
+    def __init__(self):
+        self.votes = {}
+        self.counts = {"A": 0, "B": 0}
+        self.status = {BATTLE_ID: "LIVE"}
+
+    def cast(self, params):
+        status = self.status.get(params["battle_uuid"])
+        if status is None:
+            return {"voted": False, "error": "not_found"}
+        if status != "LIVE":
+            return {"voted": False, "error": "closed", "status": status}
+        key = (params["battle_uuid"], params["voter_uuid"])
+        if key in self.votes:
+            return {"voted": False, "vote_counts": dict(self.counts), "creator_id": CREATOR_ID}
+        self.votes[key] = params["vote_choice"]
+        self.counts[params["vote_choice"]] += 1
+        return {
+            "voted": True,
+            "vote": {"battle_id": key[0], "user_id": key[1], "choice": params["vote_choice"]},
+            "vote_counts": dict(self.counts),
+            "creator_id": CREATOR_ID,
+        }
+
+
+@pytest.fixture
+def store(fake_db, no_notifications, monkeypatch):
+    monkeypatch.setattr(server, "vote_buffer", None)
+    store = VoteStore()
+
+    def handler(query):
+        assert query.rpc_name == "cast_battle_vote", "vote_battle must be a single RPC round-trip"
+        return store.cast(query.params)
+
+    fake_db.handler = handler
+    return store
+
+
+async def _vote(user_id, choice):
+    await asyncio.sleep(random.random() / 1000)
+    try:
+        return await server.vote_battle(BATTLE_ID, {"choice": choice}, current_user={"id": user_id})
+    except HTTPException as e:
+        return e
+
+
+def test_parallel_votes_produce_exact_tallies(store, fake_db):
+    voters = [(str(uuid.uuid4()), random.choice("AB")) for _ in range(3000)]
+    # Every voter double-taps, the second time possibly with the other choice
+    attempts = voters + [(user_id, "B" if choice == "A" else "A") for user_id, choice in voters]
+    random.shuffle(attempts)
+
+    async def run():
+        return await asyncio.gather(*[_vote(user_id, choice) for user_id, choice in attempts])
+
+    results = asyncio.run(run())
+
+    accepted = [r for r in results if not isinstance(r, HTTPException)]
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert len(accepted) == len(voters)
+    assert len(rejected) == len(voters)
+    assert all(r.status_code == 400 for r in rejected)
+    assert store.counts["A"] + store.counts["B"] == len(voters)
+    assert store.counts == {
+        "A": sum(1 for choice in store.votes.values() if choice == "A"),
+        "B": sum(1 for choice in store.votes.values() if choice == "B"),
+    }
+    # One round-trip per request
+    assert len(fake_db.queries) == len(attempts)
+    # The last accepted response reports the final totals
+    final = max(accepted, key=lambda r: r["results"]["total_votes"])
+    assert final["results"]["total_votes"] == len(voters)
+
+
+def test_invalid_choice_is_rejected_without_a_query(store, fake_db):
+    result = asyncio.run(_vote(str(uuid.uuid4()), "C"))
+    assert isinstance(result, HTTPException) and result.status_code == 400
+    assert fake_db.queries == []
+
+
+@pytest.mark.parametrize("battle_id, status_code", [
+    ("not-a-uuid", 400),
+    (str(uuid.uuid4()), 404),
+    (BATTLE_ID, 400),
+])
+def test_unknown_and_closed_battles_are_refused(store, fake_db, battle_id, status_code):
+    store.status[BATTLE_ID] = "ENDED"
+
+    async def vote():
+        try:
+            return await server.vote_battle(battle_id, {"choice": "A"}, current_user={"id": str(uuid.uuid4())})
+        except HTTPException as e:
+            return e
+
+    result = asyncio.run(vote())
+    assert isinstance(result, HTTPException) and result.status_code == status_code
+    assert store.counts == {"A": 0, "B": 0}
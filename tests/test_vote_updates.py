@@ -0,0 +1,134 @@
+"""Coalesced vote_update broadcasts and their delivery across workers."""
+
+import asyncio
+import json
+
+import server
+
+
+class FakeSocket:
+    def __init__(self):
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.received.append(json.loads(message))
+
+    async def close(self, code=1000):
+        pass
+
+
+class RecordingBackplane:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, battle_id, message_str):
+        self.published.append((battle_id, json.loads(message_str)))
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def _results(total):
+    return {"battle_id": "b", "total_votes": total}
+
+
+def test_votes_within_a_tick_become_one_frame_per_viewer():
+    async def run():
+        manager = server.ConnectionManager()
+        coalescer = server.VoteUpdateCoalescer(manager, max_hz=4)
+        sockets = [FakeSocket() for _ in range(100)]
+        for socket in sockets:
+            await manager.accept(socket)
+            manager.subscribe(socket, ["b"])
+        for n in range(1, 1001):
+            coalescer.publish("b", _results(n))
+        await coalescer.flush()
+        await _settle()
+        return coalescer, sockets
+
+    coalescer, sockets = asyncio.run(run())
+    stats = coalescer.stats()
+    print(f"\nframes without coalescing {stats['frames_without_coalescing']}, sent {stats['frames_sent']}")
+
+    assert stats == {"updates_received": 1000, "frames_without_coalescing": 100_000, "frames_sent": 100}
+    for socket in sockets:
+        (frame,) = socket.received
+        assert frame["type"] == "vote_update"
+        assert frame["seq"] == 1 and frame["origin"] == coalescer.origin
+        # Only the latest snapshot is sent
+        assert frame["data"]["results"]["total_votes"] == 1000
+
+
+def test_battles_without_local_viewers_are_still_published():
+    backplane = RecordingBackplane()
+    manager = server.ConnectionManager(backplane=backplane)
+    coalescer = server.VoteUpdateCoalescer(manager, max_hz=4)
+
+    async def run():
+        for tick in range(3):
+            coalescer.publish("b", _results(tick))
+            await coalescer.flush()
+
+    asyncio.run(run())
+
+    assert [frame["seq"] for _, frame in backplane.published] == [1, 2, 3]
+    assert all(battle_id == "b" for battle_id, _ in backplane.published)
+    assert coalescer.frames_sent == 0
+    assert coalescer.state("b") == {"origin": coalescer.origin, "seq": 3}
+    coalescer.forget("b")
+    assert coalescer.state("b")["seq"] == 0
+
+
+def test_updates_reach_viewers_on_other_workers(tmp_path):
+    path = str(tmp_path / "ws.sock")
+
+    async def wait_connected(*backplanes):
+        for _ in range(200):
+            if all(bp._writer is not None for bp in backplanes):
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError("backplane did not connect")
+
+    async def run():
+        workers = []
+        for _ in range(2):
+            backplane = server.UnixSocketBackplane(path)
+            manager = server.ConnectionManager(backplane=backplane)
+            await backplane.start(manager.deliver_local)
+            workers.append((manager, server.VoteUpdateCoalescer(manager, max_hz=4)))
+        await wait_connected(*(m.backplane for m, _ in workers))
+        (manager_a, coalescer_a), (manager_b, coalescer_b) = workers
+
+        # The viewer is only on worker B; the votes land on worker A
+        viewer = FakeSocket()
+        await manager_b.accept(viewer)
+        manager_b.subscribe(viewer, ["b"])
+        coalescer_a.publish("b", _results(1))
+        await coalescer_a.flush()
+        coalescer_b.publish("b", _results(2))
+        await coalescer_b.flush()
+        coalescer_a.publish("b", _results(3))
+        await coalescer_a.flush()
+
+        for _ in range(200):
+            if len(viewer.received) == 3:
+                break
+            await asyncio.sleep(0.01)
+        for manager, _ in workers:
+            await manager.backplane.stop()
+        return coalescer_a, coalescer_b, viewer
+
+    coalescer_a, coalescer_b, viewer = asyncio.run(run())
+
+    assert coalescer_a.origin != coalescer_b.origin
+    by_origin = {}
+    for frame in viewer.received:
+        by_origin.setdefault(frame["origin"], []).append(frame["seq"])
+    # Each origin's sequence is gap-free on its own
+    assert by_origin == {coalescer_a.origin: [1, 2], coalescer_b.origin: [1]}
+    assert sorted(f["data"]["results"]["total_votes"] for f in viewer.received) == [1, 2, 3]
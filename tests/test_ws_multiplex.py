@@ -0,0 +1,160 @@
+"""/api/ws/battles: subscribe validation and per-message error handling, and
+the per-battle /api/ws/battles/{id} snapshot ordering."""
+
+import asyncio
+import json
+import uuid
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+import server
+
+KNOWN = [str(uuid.uuid4()) for _ in range(3)]
+
+
+class ScriptedSocket:
+    """Feeds the endpoint a fixed list of client messages, then disconnects."""
+
+    def __init__(self, messages):
+        self._messages = [m if isinstance(m, str) else json.dumps(m) for m in messages]
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def receive_text(self):
+        # Give the writer task a chance to flush replies in order
+        for _ in range(3):
+            await asyncio.sleep(0)
+        if not self._messages:
+            raise WebSocketDisconnect()
+        return self._messages.pop(0)
+
+    async def send_text(self, message):
+        self.received.append(json.loads(message))
+
+    async def close(self, code=1000):
+        pass
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    manager = server.ConnectionManager()
+    monkeypatch.setattr(server, "manager", manager)
+    return manager
+
+
+@pytest.fixture
+def battles(fake_db):
+    state = {"failures": 0}
+
+    def handler(query):
+        assert query.table_name == "battles"
+        if state["failures"]:
+            state["failures"] -= 1
+            raise RuntimeError("statement timeout")
+        ids = query.first("in_")[1]
+        return [{"id": bid, "vote_counts": {"A": 1, "B": 2}} for bid in ids if bid in KNOWN]
+
+    fake_db.handler = handler
+    return state
+
+
+def _run(socket, manager):
+    seen = {}
+
+    async def run():
+        original_release = manager.release
+
+        def release(websocket):
+            # Snapshot subscriptions before the endpoint cleans them up
+            seen["subscriptions"] = set(manager.subscriptions.get(websocket, set()))
+            original_release(websocket)
+
+        manager.release = release
+        await server.websocket_multiplex_endpoint(socket)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    return seen["subscriptions"]
+
+
+def test_invalid_and_unknown_ids_are_reported(manager, battles, fake_db):
+    unknown = str(uuid.uuid4())
+    socket = ScriptedSocket([
+        {"type": "subscribe", "battle_ids": [KNOWN[0], "'; drop table", 42, unknown, KNOWN[1].upper()]},
+    ])
+    subscriptions = _run(socket, manager)
+
+    errors = [f for f in socket.received if f["type"] == "error"]
+    assert {"detail": "Invalid battle ids", "battle_ids": ["'; drop table", 42]} in [
+        {k: e[k] for k in ("detail", "battle_ids")} for e in errors]
+    assert any(e["detail"] == "Battles not found" and e["battle_ids"] == [unknown] for e in errors)
+    states = [f for f in socket.received if f["type"] == "battle_states"]
+    assert sorted(s["battle_id"] for s in states[0]["data"]) == sorted(KNOWN[:2])
+    assert subscriptions == set(KNOWN[:2])
+    # Malformed ids never reach the IN query
+    assert fake_db.queries[0].first("in_")[1] == [KNOWN[0], unknown, KNOWN[1]]
+
+
+def test_a_failed_lookup_does_not_close_the_socket(manager, battles):
+    socket = ScriptedSocket([
+        {"type": "subscribe", "battle_ids": [KNOWN[0]]},
+        {"type": "ping"},
+        {"type": "subscribe", "battle_ids": [KNOWN[2]]},
+    ])
+    battles["failures"] = 1
+    subscriptions = _run(socket, manager)
+
+    types = [f["type"] for f in socket.received]
+    assert types == ["error", "pong", "battle_states"]
+    assert socket.received[0]["detail"] == "Failed to load battles"
+    assert socket.received[0]["battle_ids"] == [KNOWN[0]]
+    # The failed subscription was rolled back; the retry afterwards worked
+    assert subscriptions == {KNOWN[2]}
+
+
+def test_bad_payload_shapes_get_error_frames(manager, battles):
+    socket = ScriptedSocket([
+        "not json",
+        "[1, 2]",
+        {"type": "subscribe", "battle_ids": KNOWN[0]},
+        {"type": "ping"},
+    ])
+    subscriptions = _run(socket, manager)
+
+    assert [f.get("detail", f["type"]) for f in socket.received] == [
+        "Invalid JSON", "Expected a JSON object", "battle_ids must be a list", "pong"]
+    assert subscriptions == set()
+
+
+def test_per_battle_snapshot_is_queued_before_subscribing(manager, fake_db):
+    battle_id = KNOWN[0]
+    socket = ScriptedSocket([{"type": "ping"}])
+
+    def handler(query):
+        # Nothing can be broadcast to the socket while the snapshot is read
+        assert battle_id not in manager.active_connections
+        return {"vote_counts": {"A": 1, "B": 2}}
+
+    fake_db.handler = handler
+
+    async def run():
+        original_send = manager.send
+
+        def send(websocket, message):
+            original_send(websocket, message)
+            if message["type"] == "battle_state":
+                # A tally change flushed the moment the socket subscribes
+                asyncio.get_running_loop().call_soon(
+                    asyncio.ensure_future,
+                    manager.broadcast_to_battle(battle_id, {"type": "vote_update", "seq": 1}))
+
+        manager.send = send
+        await server.websocket_endpoint(socket, battle_id)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert [f["type"] for f in socket.received] == ["battle_state", "vote_update", "pong"]
+    assert socket.received[0]["data"]["total_votes"] == 3